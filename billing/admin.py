@@ -1,15 +1,40 @@
 # billing/admin.py
 from django.contrib import admin
-from .models import Bill, Payment
+from .models import Bill, DayCloseout, Payment, PaystackEvent, PaystackTransaction
 
 @admin.register(Bill)
 class BillAdmin(admin.ModelAdmin):
     list_display = ("id", "patient", "total_amount", "is_paid", "created_at")
     list_filter = ("is_paid", "created_at")
     search_fields = ("patient__name",)
+    # Derived from the bill's items (billing.services)
+    readonly_fields = ("total_amount",)
 
 @admin.register(Payment)
 class PaymentAdmin(admin.ModelAdmin):
     list_display = ("reference", "bill", "amount", "status", "paid_at")
     list_filter = ("status",)
     search_fields = ("reference",)
+
+@admin.register(PaystackTransaction)
+class PaystackTransactionAdmin(admin.ModelAdmin):
+    list_display = ("reference", "subaccount_code", "status", "amount", "currency", "created_at", "paid_at")
+    list_filter = ("status",)
+    search_fields = ("reference",)
+
+
+@admin.register(PaystackEvent)
+class PaystackEventAdmin(admin.ModelAdmin):
+    list_display = ("event", "reference", "status", "attempts", "received_at", "applied_at")
+    list_filter = ("status", "event")
+    search_fields = ("reference",)
+
+
+@admin.register(DayCloseout)
+class DayCloseoutAdmin(admin.ModelAdmin):
+    list_display = ("day", "clinic", "payment_count", "total_amount", "closed_by", "closed_at")
+    list_filter = ("day",)
+
+    # Close-outs are final
+    def has_change_permission(self, request, obj=None):
+        return False
@@ -0,0 +1,199 @@
+"""
+A local stand-in for the parts of the Paystack API that billing.paystack
+uses, for tests and benchmarks:
+
+    with FakePaystack(transactions=500, latency=0.05) as fake:
+        client = PaystackClient(fake.url, "sk_test_fake")
+
+Each response is delayed by `latency` seconds. With `throttle_every`, every
+nth request gets a 429 asking the client to retry. It keeps connections
+alive (HTTP/1.1) and counts the requests, the connections opened and the
+most requests it was handling at once.
+"""
+import datetime
+import json
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+
+class FakePaystack:
+    def __init__(self, *, transactions=200, subaccounts=("ACCT_fake",), latency=0.0, throttle_every=0,
+                 filters_subaccount=True):
+        self.latency = latency
+        self.throttle_every = throttle_every
+        self.filters_subaccount = filters_subaccount
+        self.requests = 0
+        self.connections = 0
+        self.in_flight = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+        self._server = None
+        started = datetime.datetime(2026, 1, 1, tzinfo=datetime.timezone.utc)
+        # The transactions go round the subaccounts, skipping every fourth round (no subaccount)
+        self.transactions = [
+            {
+                "id": i,
+                "reference": f"ref_{i}",
+                "amount": 1000 * (i % 50 + 1),
+                "currency": "GHS",
+                "status": "failed" if i % 10 == 0 else "success",
+                "createdAt": (started + datetime.timedelta(minutes=i)).isoformat(),
+                "created_at": (started + datetime.timedelta(minutes=i)).isoformat(),
+                "paid_at": (started + datetime.timedelta(minutes=i)).isoformat(),
+                "gateway_response": "Approved",
+                "channel": "card",
+                "customer": {"first_name": "Test", "last_name": f"Customer {i}"},
+                "subaccount": (
+                    None if i // len(subaccounts) % 4 == 0 else {"subaccount_code": subaccounts[i % len(subaccounts)]}
+                ),
+            }
+            for i in range(transactions, 0, -1)  # newest first, as Paystack lists them
+        ]
+        self._by_reference = {tx["reference"]: tx for tx in self.transactions}
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        fake = self
+
+        class Handler(_Handler):
+            paystack = fake
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def list_transactions(self, params):
+        per_page = int(params.get("perPage", 50))
+        page = int(params.get("page", 1))
+        rows = self.transactions
+        code = params.get("subaccount_code")
+        if code and self.filters_subaccount:
+            rows = [tx for tx in rows if (tx["subaccount"] or {}).get("subaccount_code") == code]
+        if params.get("from"):
+            since = datetime.datetime.fromisoformat(params["from"])
+            rows = [tx for tx in rows if datetime.datetime.fromisoformat(tx["createdAt"]) >= since]
+        start = (page - 1) * per_page
+        return 200, {
+            "status": True,
+            "message": "Transactions retrieved",
+            "data": rows[start:start + per_page],
+            "meta": {
+                "total": len(rows),
+                "skipped": start,
+                "perPage": per_page,
+                "page": page,
+                "pageCount": max(1, -(-len(rows) // per_page)),
+            },
+        }
+
+    def verify(self, reference):
+        tx = self._by_reference.get(reference)
+        if tx is None:
+            return 404, {"status": False, "message": "Transaction reference not found"}
+        return 200, {"status": True, "message": "Verification successful", "data": tx}
+
+    def initialize(self, payload):
+        reference = payload.get("reference") or uuid.uuid4().hex[:12]
+        return 200, {
+            "status": True,
+            "message": "Authorization URL created",
+            "data": {
+                "authorization_url": f"{self.url}/checkout/{reference}",
+                "access_code": uuid.uuid4().hex[:12],
+                "reference": reference,
+            },
+        }
+
+    def event(self, reference, secret_key, *, event="charge.success"):
+        """(body, headers) of the webhook Paystack would send about the transaction with `reference`."""
+        from .paystack import signature
+
+        body = json.dumps({"event": event, "data": self._by_reference[reference]}).encode()
+        return body, {"X-Paystack-Signature": signature(body, secret_key)}
+
+    def create_subaccount(self, payload):
+        return 201, {
+            "status": True,
+            "message": "Subaccount created",
+            "data": {"subaccount_code": f"ACCT_{uuid.uuid4().hex[:10]}", "business_name": payload.get("business_name")},
+        }
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out in one write: two small writes on a kept-alive
+    # connection would each wait out the client's delayed ACK
+    wbufsize = -1
+    disable_nagle_algorithm = True
+    paystack = None
+
+    def setup(self):
+        super().setup()
+        with self.paystack._lock:
+            self.paystack.connections += 1
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self._handle()
+
+    def do_POST(self):
+        self._handle()
+
+    def _handle(self):
+        fake = self.paystack
+        url = urlsplit(self.path)
+        length = int(self.headers.get("Content-Length") or 0)
+        payload = json.loads(self.rfile.read(length)) if length else {}
+        with fake._lock:
+            fake.requests += 1
+            throttled = fake.throttle_every and fake.requests % fake.throttle_every == 0
+            fake.in_flight += 1
+            fake.peak = max(fake.peak, fake.in_flight)
+        try:
+            if fake.latency:
+                time.sleep(fake.latency)
+            if throttled:
+                self._send(429, {"status": False, "message": "Too many requests"}, {"Retry-After": "0"})
+            elif self.command == "GET" and url.path == "/transaction":
+                self._send(*fake.list_transactions({k: v[-1] for k, v in parse_qs(url.query).items()}))
+            elif self.command == "GET" and url.path.startswith("/transaction/verify/"):
+                self._send(*fake.verify(url.path.rsplit("/", 1)[-1]))
+            elif self.command == "POST" and url.path == "/transaction/initialize":
+                self._send(*fake.initialize(payload))
+            elif self.command == "POST" and url.path == "/subaccount":
+                self._send(*fake.create_subaccount(payload))
+            else:
+                self._send(404, {"status": False, "message": "Not found"})
+        finally:
+            with fake._lock:
+                fake.in_flight -= 1
+
+    def _send(self, status, body, headers=None):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
@@ -0,0 +1,121 @@
+"""
+Paystack webhook inbox.
+
+The webhook view checks the signature and calls receive(), which inserts
+the event with a single INSERT ... ON CONFLICT DO NOTHING. Paystack gets
+its 200 straight away, a burst of deliveries costs one insert each, and a
+redelivered event (same key) is dropped.
+
+The worker (manage.py process_paystack_events) claims due events in
+batches and applies each batch in one transaction. Successful charges are
+upserted into the transaction mirror, and their pending payments are
+settled by billing.mirror.settle(), which looks payments up by their
+indexed reference and locks them. If a batch fails, its events are
+retried one at a time so one bad event does not hold up the rest. Events
+that keep failing back off and are given up after MAX_ATTEMPTS.
+"""
+import hashlib
+import json
+import random
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from . import mirror
+from .models import PaystackEvent
+
+MAX_ATTEMPTS = 8
+BACKOFF_BASE = 15  # seconds; doubles per attempt
+BACKOFF_MAX = 60 * 60
+# A claimed event is invisible to other workers for this long; if its
+# worker dies mid-batch the event simply becomes due again
+CLAIM_LEASE = timedelta(minutes=5)
+# Events whose data is a transaction; the rest are kept but not acted on
+CHARGE_EVENTS = {"charge.success"}
+
+
+def event_key(event, body):
+    """Identifies a delivery: the event type and Paystack object id, or the body's hash if it has no id."""
+    object_id = (event.get("data") or {}).get("id")
+    source = f"{event.get('event')}:{object_id}".encode() if object_id else body
+    return hashlib.sha256(source).hexdigest()
+
+
+def receive(body):
+    """
+    Stores a verified webhook body, unless an event with its key is already
+    in the inbox. Raises ValueError if the body is not a JSON object.
+    """
+    event = json.loads(body)
+    if not isinstance(event, dict):
+        raise ValueError("Webhook body is not a JSON object")
+    data = event.get("data") or {}
+    PaystackEvent.objects.bulk_create([PaystackEvent(
+        key=event_key(event, body),
+        event=str(event.get("event") or "")[:50],
+        reference=str(data.get("reference") or "")[:100],
+        payload=event,
+    )], ignore_conflicts=True)
+
+
+def backoff(attempts):
+    delay = min(BACKOFF_BASE * 2 ** (attempts - 1), BACKOFF_MAX)
+    return timedelta(seconds=delay + random.uniform(0, delay / 5))
+
+
+def claim_batch(batch_size):
+    """Leases up to `batch_size` due events to this worker, oldest first, and returns them."""
+    now = timezone.now()
+    with transaction.atomic():
+        rows = list(
+            PaystackEvent.objects.select_for_update(skip_locked=True)
+            .filter(status="pending", next_attempt_at__lte=now)
+            .order_by("next_attempt_at", "id")[:batch_size]
+        )
+        for row in rows:
+            row.attempts += 1
+            row.next_attempt_at = now + CLAIM_LEASE
+        PaystackEvent.objects.bulk_update(rows, ["attempts", "next_attempt_at"])
+    return rows
+
+
+def _apply(rows):
+    charges = [row for row in rows if row.event in CHARGE_EVENTS and (row.payload.get("data") or {}).get("id")]
+    with transaction.atomic():
+        if charges:
+            mirror.store([row.payload["data"] for row in charges])
+            mirror.settle({row.reference for row in charges if row.reference})
+    return {row.id for row in charges}
+
+
+def apply_batch(rows):
+    """Applies claimed events and records each one's outcome."""
+    now = timezone.now()
+    try:
+        applied = _apply(rows)
+    except Exception as e:
+        if len(rows) > 1:
+            for row in rows:
+                apply_batch([row])
+            return
+        [row] = rows
+        print(f"Paystack event {row.id} ({row.event}) failed:", e)
+        row.last_error = str(e)
+        if row.attempts >= MAX_ATTEMPTS:
+            row.status = "failed"
+        else:
+            row.status, row.next_attempt_at = "pending", now + backoff(row.attempts)
+    else:
+        for row in rows:
+            row.status = "applied" if row.id in applied else "ignored"
+            row.applied_at, row.last_error = now, ""
+    PaystackEvent.objects.bulk_update(rows, ["status", "next_attempt_at", "last_error", "applied_at"])
+
+
+def process_once(batch_size=200):
+    """Claims and applies one batch. Returns the number of events handled."""
+    rows = claim_batch(batch_size)
+    if rows:
+        apply_batch(rows)
+    return len(rows)
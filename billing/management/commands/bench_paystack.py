@@ -0,0 +1,73 @@
+# billing/management/commands/bench_paystack.py
+import asyncio
+import time
+
+import requests
+from django.core.management.base import BaseCommand
+from billing.fake_paystack import FakePaystack
+from billing.paystack import PER_PAGE, PaystackClient
+
+SUBACCOUNT = 'ACCT_bench0'
+
+
+class Command(BaseCommand):
+    help = ("List a subaccount's transactions from a local fake Paystack: one unpooled request at a time, "
+            "then with the pooled client, and compare page-fetch throughput")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--transactions', type=int, default=2000)
+        parser.add_argument('--subaccounts', type=int, default=4, help='Subaccounts the transactions are split over')
+        parser.add_argument('--latency', type=float, default=0.05, help='Simulated Paystack response time in seconds')
+        parser.add_argument('--concurrency', type=int, default=4)
+        parser.add_argument('--throttle-every', type=int, default=0, help='Answer every nth request with a 429')
+
+    def handle(self, *args, **options):
+        subaccounts = tuple(f'ACCT_bench{i}' for i in range(options['subaccounts']))
+        # Scanning every page: the fake ignores the subaccount filter, as an endpoint without one would
+        with FakePaystack(transactions=options['transactions'], subaccounts=subaccounts, latency=options['latency'],
+                          throttle_every=options['throttle_every'], filters_subaccount=False) as fake:
+            expected = self._round('unpooled, sequential', fake, lambda: self._unpooled(fake))
+            self._round('pooled, sequential', fake, lambda: self._pooled(fake, 1), expected)
+            self._round(f'pooled, {options["concurrency"]} at a time', fake,
+                        lambda: self._pooled(fake, options['concurrency']), expected)
+            fake.filters_subaccount = True
+            self._round('pooled, filtered by Paystack', fake,
+                        lambda: self._pooled(fake, options['concurrency']), expected)
+
+    def _round(self, name, fake, list_all, expected=None):
+        fake.requests = fake.connections = fake.peak = 0
+        started = time.perf_counter()
+        found = list_all()
+        elapsed = time.perf_counter() - started
+        self.stdout.write(f'{name}: {len(found)} transactions from {fake.requests} requests in {elapsed:.2f}s '
+                          f'({fake.requests / elapsed:.0f} requests/s), {fake.connections} connections, '
+                          f'peak {fake.peak} in flight')
+        if expected is not None and [tx['id'] for tx in found] != [tx['id'] for tx in expected]:
+            self.stdout.write(self.style.ERROR('  different transactions from the unpooled listing'))
+        return found
+
+    @staticmethod
+    def _unpooled(fake):
+        """Every page in turn with a new connection each, as billing.utils used to."""
+        found, page = [], 1
+        while True:
+            response = requests.get(f'{fake.url}/transaction', params={'perPage': PER_PAGE, 'page': page},
+                                    headers={'Authorization': 'Bearer sk_test_fake'})
+            if response.status_code == 429:
+                continue
+            body = response.json()
+            found += [tx for tx in body['data'] if (tx['subaccount'] or {}).get('subaccount_code') == SUBACCOUNT]
+            if page >= body['meta']['pageCount']:
+                return found
+            page += 1
+
+    @staticmethod
+    def _pooled(fake, concurrency):
+        async def list_all():
+            client = PaystackClient(fake.url, 'sk_test_fake', concurrency=concurrency)
+            try:
+                return await client.subaccount_transactions(SUBACCOUNT, n=len(fake.transactions))
+            finally:
+                await client.close()
+
+        return asyncio.run(list_all())
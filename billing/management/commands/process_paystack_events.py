@@ -0,0 +1,27 @@
+# billing/management/commands/process_paystack_events.py
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from billing.inbox import process_once
+
+
+class Command(BaseCommand):
+    help = "Apply Paystack webhook events from the inbox in batches, retrying failures with backoff"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=200)
+        parser.add_argument('--idle-sleep', type=float, default=1.0,
+                            help='Seconds to wait when nothing is due')
+        parser.add_argument('--once', action='store_true', help='Apply what is due now, then exit')
+
+    def handle(self, *args, **options):
+        while True:
+            close_old_connections()
+            handled = process_once(options['batch_size'])
+            if handled:
+                self.stdout.write(f'Applied {handled} event(s)')
+            elif options['once']:
+                return
+            else:
+                time.sleep(options['idle_sleep'])
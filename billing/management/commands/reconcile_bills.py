@@ -0,0 +1,39 @@
+# billing/management/commands/reconcile_bills.py
+import time
+
+from django.core.management.base import BaseCommand
+from django.db.models import Max, Min
+from billing.models import Bill
+from billing.services import reconcile
+
+
+class Command(BaseCommand):
+    help = "Recompute bill totals from their items in id-range batches and report every bill that had drifted"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=10000, help='Bill ids per batch')
+        parser.add_argument('--dry-run', action='store_true', help='Report drift without fixing it')
+        parser.add_argument('--show', type=int, default=20, help='How many drifted bills to list')
+
+    def handle(self, *args, **options):
+        bounds = Bill.objects.aggregate(first=Min('id'), last=Max('id'))
+        if bounds['first'] is None:
+            self.stdout.write('No bills.')
+            return
+        batch_size = options['batch_size']
+        started = time.perf_counter()
+        drift = []
+        for first_id in range(bounds['first'], bounds['last'] + 1, batch_size):
+            drift += reconcile(first_id, first_id + batch_size - 1, fix=not options['dry_run'])
+
+        elapsed = time.perf_counter() - started
+        checked = bounds['last'] - bounds['first'] + 1
+        self.stdout.write(f'Checked bill ids {bounds["first"]}..{bounds["last"]} ({checked} ids) in {elapsed:.1f}s.')
+        if not drift:
+            self.stdout.write(self.style.SUCCESS('Every bill total matches its items.'))
+            return
+        net = sum(items_total - total for _, total, items_total in drift)
+        verb = 'Found' if options['dry_run'] else 'Fixed'
+        self.stdout.write(self.style.WARNING(f'{verb} {len(drift)} drifted bills, net {net:+} against their items.'))
+        for bill_id, total, items_total in sorted(drift, key=lambda row: -abs(row[2] - row[1]))[:options['show']]:
+            self.stdout.write(f'  bill #{bill_id}: total {total}, items {items_total} ({items_total - total:+})')
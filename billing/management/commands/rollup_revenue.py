@@ -0,0 +1,49 @@
+# billing/management/commands/rollup_revenue.py
+import datetime
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Min
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from billing.models import Payment
+from billing.revenue import rebuild
+
+
+class Command(BaseCommand):
+    help = "Rebuild the daily revenue rollups from the payments, one transaction per batch of days"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', help='First day to rebuild, YYYY-MM-DD (defaults to the first payment)')
+        parser.add_argument('--until', help='Last day to rebuild, YYYY-MM-DD (defaults to today)')
+        parser.add_argument('--clinic', type=int, help='Only this clinic id')
+        parser.add_argument('--days', type=int, default=31, help='Days per batch')
+
+    def handle(self, *args, **options):
+        since, until = self._day(options['since']), self._day(options['until']) or timezone.localdate()
+        if since is None:
+            first_paid = Payment.objects.filter(paid_at__isnull=False).aggregate(first=Min('paid_at'))['first']
+            if first_paid is None:
+                self.stdout.write('No paid payments.')
+                return
+            since = timezone.localdate(first_paid)
+        started = time.perf_counter()
+        rows = 0
+        first_day = since
+        while first_day <= until:
+            last_day = min(first_day + datetime.timedelta(days=options['days'] - 1), until)
+            rows += rebuild(first_day, last_day, clinic=options['clinic'])
+            first_day = last_day + datetime.timedelta(days=1)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt {since}..{until}: {rows} rollup rows in {elapsed:.1f}s.'
+        ))
+
+    @staticmethod
+    def _day(value):
+        if value is None:
+            return None
+        day = parse_date(value)
+        if day is None:
+            raise CommandError(f'Not a date: {value}')
+        return day
@@ -0,0 +1,44 @@
+# billing/management/commands/sync_paystack.py
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+from django.utils.dateparse import parse_datetime
+from billing import mirror
+from billing.paystack import PaystackError
+
+
+class Command(BaseCommand):
+    help = ("Mirror new Paystack transactions locally, then settle pending payments Paystack reports as paid; "
+            "repeats every --interval seconds")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', help='List from this time (ISO 8601) instead of the high-water mark')
+        parser.add_argument('--interval', type=float, default=300, help='Seconds between syncs')
+        parser.add_argument('--once', action='store_true', help='Sync once, then exit')
+
+    def handle(self, *args, **options):
+        since = None
+        if options['since']:
+            since = parse_datetime(options['since'])
+            if since is None:
+                raise CommandError(f'Not a date and time: {options["since"]}')
+        while True:
+            close_old_connections()
+            started = time.perf_counter()
+            try:
+                stored = mirror.sync(since)
+            except PaystackError as e:
+                self.stderr.write(f'Sync failed: {e}')
+            else:
+                settled, mismatches = mirror.settle()
+                self.stdout.write(f'Mirrored {stored} transactions and settled {len(settled)} payments '
+                                  f'in {time.perf_counter() - started:.1f}s')
+                for payment_id, reference, amount, gateway_amount in mismatches:
+                    self.stdout.write(self.style.WARNING(
+                        f'  payment #{payment_id} ({reference}): {amount} here, {gateway_amount / 100} on Paystack'
+                    ))
+            if options['once']:
+                return
+            since = None
+            time.sleep(options['interval'])
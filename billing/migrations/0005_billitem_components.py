@@ -0,0 +1,18 @@
+# Generated by Django 5.1.1 on 2026-10-18 10:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing', '0004_alter_payment_reference'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='billitem',
+            name='components',
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
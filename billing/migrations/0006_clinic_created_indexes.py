@@ -0,0 +1,19 @@
+# Generated by Django 5.1.1 on 2026-10-18 10:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing', '0005_billitem_components'),
+        ('clinicmanager', '0005_alter_clinicbankdetails_bank_name'),
+        ('patient', '0015_clinic_created_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='bill',
+            index=models.Index(fields=['clinic', 'created_at'], name='bill_clinic_created_idx'),
+        ),
+    ]
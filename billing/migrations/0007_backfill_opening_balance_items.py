@@ -0,0 +1,54 @@
+from decimal import Decimal
+
+from django.db import migrations
+from django.db.models import DecimalField, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+BATCH_SIZE = 10000
+
+
+def backfill_opening_balances(apps, schema_editor):
+    """
+    Bills charged before billing.services kept totals that no item backs
+    (consultation fees, labor charges, prescriptions billed at one unit).
+    Give each such bill one item for the difference, so its items add up
+    to its total and reconcile_bills leaves it alone.
+    """
+    Bill = apps.get_model("billing", "Bill")
+    BillItem = apps.get_model("billing", "BillItem")
+    items_total = Coalesce(
+        Subquery(
+            BillItem.objects.filter(bill=OuterRef("pk")).order_by().values("bill")
+            .annotate(total=Sum("total")).values("total")
+        ),
+        Value(Decimal("0.00")),
+        output_field=DecimalField(max_digits=10, decimal_places=2),
+    )
+    last_id = 0
+    while True:
+        ids = list(Bill.objects.filter(id__gt=last_id).order_by("id").values_list("id", flat=True)[:BATCH_SIZE])
+        if not ids:
+            return
+        last_id = ids[-1]
+        drift = (
+            Bill.objects.filter(id__in=ids).annotate(items_total=items_total)
+            .exclude(total_amount=F("items_total")).values_list("id", "total_amount", "items_total")
+        )
+        BillItem.objects.bulk_create([
+            BillItem(
+                bill_id=bill_id, description="Balance before itemised billing", quantity=1,
+                unit_price=total - items, total=total - items,
+            )
+            for bill_id, total, items in drift
+        ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing', '0006_clinic_created_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_opening_balances, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.1.1 on 2026-10-18 10:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing', '0007_backfill_opening_balance_items'),
+        ('clinicmanager', '0005_alter_clinicbankdetails_bank_name'),
+        ('patient', '0017_transcriptextraction'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='bill',
+            index=models.Index(condition=models.Q(('is_paid', False)), fields=['patient', '-created_at'], name='bill_open_patient_idx'),
+        ),
+    ]
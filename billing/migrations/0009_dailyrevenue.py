@@ -0,0 +1,53 @@
+# Generated by Django 5.1.1 on 2026-10-18 11:02
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+
+
+def roll_up_payments(apps, schema_editor):
+    """Rolls up every payment paid so far, in one aggregate query (see billing.revenue.rebuild)."""
+    Payment = apps.get_model("billing", "Payment")
+    DailyRevenue = apps.get_model("billing", "DailyRevenue")
+    rows = (
+        Payment.objects.filter(paid_at__isnull=False).order_by()
+        .annotate(day=TruncDate("paid_at"))
+        .values("bill__clinic_id", "day", "payment_method", "status")
+        .annotate(payment_count=Count("id"), total=Sum("amount"))
+    )
+    DailyRevenue.objects.bulk_create([
+        DailyRevenue(
+            clinic_id=row["bill__clinic_id"], day=row["day"], payment_method=row["payment_method"],
+            status=row["status"], payment_count=row["payment_count"], amount=row["total"],
+        )
+        for row in rows
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing', '0008_bill_open_patient_idx'),
+        ('clinicmanager', '0005_alter_clinicbankdetails_bank_name'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyRevenue',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('payment_method', models.CharField(max_length=50)),
+                ('status', models.CharField(max_length=20)),
+                ('payment_count', models.IntegerField(default=0)),
+                ('amount', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14)),
+                ('clinic', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_revenue', to='clinicmanager.clinic')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('clinic', 'day', 'payment_method', 'status'), name='uniq_daily_revenue_bucket')],
+            },
+        ),
+        migrations.RunPython(roll_up_payments, migrations.RunPython.noop),
+    ]
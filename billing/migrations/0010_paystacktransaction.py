@@ -0,0 +1,36 @@
+# Generated by Django 5.1.1 on 2026-10-18 11:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing', '0009_dailyrevenue'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PaystackTransaction',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('paystack_id', models.BigIntegerField(unique=True)),
+                ('reference', models.CharField(db_index=True, max_length=100)),
+                ('subaccount_code', models.CharField(blank=True, default='', max_length=255)),
+                ('status', models.CharField(max_length=20)),
+                ('amount', models.BigIntegerField()),
+                ('currency', models.CharField(max_length=3)),
+                ('customer_name', models.CharField(blank=True, default='', max_length=255)),
+                ('channel', models.CharField(blank=True, default='', max_length=30)),
+                ('gateway_response', models.CharField(blank=True, default='', max_length=255)),
+                ('created_at', models.DateTimeField(db_index=True)),
+                ('paid_at', models.DateTimeField(blank=True, null=True)),
+                ('raw', models.JSONField()),
+                ('listed', models.BooleanField(default=False)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['subaccount_code', '-created_at'], name='paystack_tx_subaccount_idx')],
+            },
+        ),
+    ]
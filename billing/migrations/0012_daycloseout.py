@@ -0,0 +1,34 @@
+# Generated by Django 5.1.1 on 2026-10-18 11:11
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing', '0011_paystackevent_payment_reference_idx'),
+        ('clinicmanager', '0005_alter_clinicbankdetails_bank_name'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DayCloseout',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('closed_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('payment_count', models.PositiveIntegerField()),
+                ('total_amount', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('by_method', models.JSONField()),
+                ('clinic', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='closeouts', to='clinicmanager.clinic')),
+                ('closed_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('clinic', 'day'), name='uniq_closeout_clinic_day')],
+            },
+        ),
+    ]
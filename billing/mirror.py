@@ -0,0 +1,169 @@
+"""
+Local mirror of Paystack transactions (PaystackTransaction).
+
+sync() lists the transactions created since the high-water mark, less
+SYNC_OVERLAP, and upserts them by Paystack id. The high-water mark is the
+newest createdAt a previous listing saw. The overlap re-reads recent
+transactions whose status may have changed since. A listing is stored in
+one transaction, so a sync that fails part way leaves the mark where it
+was. Webhook events go through the same upsert (billing.inbox), so an
+event the sync has already seen changes nothing.
+
+settle() marks pending Payments paid, in bulk, when their mirrored
+transaction succeeded for the payment's amount. Payments for a day the
+clinic has closed out are filed under its next open day. `manage.py sync_paystack`
+runs sync() and settle() on a schedule.
+"""
+import datetime
+
+from django.db import transaction
+from django.db.models import Max, OuterRef, Subquery
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from clinicmanager.models import Clinic
+from patient import timeline
+from patient.models import Patient
+from . import paystack, revenue
+from .models import Bill, DayCloseout, Payment, PaystackTransaction
+
+SYNC_OVERLAP = datetime.timedelta(hours=1)
+SYNC_WINDOW = 20  # pages fetched per round trip to the client's loop
+_UPDATE_FIELDS = [
+    "reference", "subaccount_code", "status", "amount", "currency", "customer_name", "channel",
+    "gateway_response", "created_at", "paid_at", "raw", "updated_at",
+]
+
+
+def _row(tx, listed):
+    customer = tx.get("customer") or {}
+    return PaystackTransaction(
+        paystack_id=tx["id"],
+        reference=tx.get("reference") or "",
+        subaccount_code=(tx.get("subaccount") or {}).get("subaccount_code") or "",
+        status=tx.get("status") or "",
+        amount=tx.get("amount") or 0,
+        currency=tx.get("currency") or "",
+        customer_name=" ".join(filter(None, (customer.get("first_name"), customer.get("last_name"))))[:255],
+        channel=tx.get("channel") or "",
+        gateway_response=(tx.get("gateway_response") or "")[:255],
+        created_at=parse_datetime(paystack.created_at(tx)),
+        paid_at=parse_datetime(tx.get("paid_at") or tx.get("paidAt") or ""),
+        raw=tx,
+        listed=listed,
+    )
+
+
+def store(transactions, *, listed=False):
+    """
+    Upserts Paystack transaction objects into the mirror by their Paystack
+    id. `listed` marks them as seen by a sync listing. Returns the number
+    stored.
+    """
+    # A listing can return a row twice when new transactions push it onto the next page
+    rows = {tx["id"]: _row(tx, listed) for tx in transactions if tx.get("id")}
+    PaystackTransaction.objects.bulk_create(
+        rows.values(), batch_size=500, update_conflicts=True, unique_fields=["paystack_id"],
+        update_fields=_UPDATE_FIELDS + (["listed"] if listed else []),
+    )
+    return len(rows)
+
+
+def high_water_mark():
+    """Where the next sync starts listing: None before the first."""
+    latest = PaystackTransaction.objects.filter(listed=True).aggregate(latest=Max("created_at"))["latest"]
+    return latest - SYNC_OVERLAP if latest else None
+
+
+def sync(since=None):
+    """
+    Mirrors every transaction created since `since` (by default the
+    high-water mark, or all of them on the first sync). Returns the number
+    stored.
+    """
+    since = since or high_water_mark()
+    filters = {"from": since.isoformat()} if since else {}
+    data, meta = paystack.transactions_page(1, **filters)
+    page_count = int(meta.get("pageCount") or 1)
+    with transaction.atomic():
+        stored = store(data, listed=True)
+        for first_page in range(2, page_count + 1, SYNC_WINDOW):
+            window = range(first_page, min(first_page + SYNC_WINDOW, page_count + 1))
+            stored += store([tx for page in paystack.pages(window, **filters) for tx in page], listed=True)
+    return stored
+
+
+def _filing_day(clinic_id, day, closed):
+    """The first day on or after `day` that `clinic_id` has not closed out."""
+    while (clinic_id, day) in closed:
+        day += datetime.timedelta(days=1)
+    return day
+
+
+def settle(references=None):
+    """
+    Marks pending payments (those with `references`, or all) paid where
+    their mirrored transaction succeeded for the same amount. Bills are
+    closed, revenue rollups rebuilt for the days paid and the patients'
+    timelines expired, in set-based queries. Returns (settled payment ids,
+    mismatches), where mismatches are (payment id, reference, amount,
+    gateway amount) for payments Paystack took a different amount for.
+
+    A payment whose day its clinic has already closed out (DayCloseout) is
+    filed under the clinic's next open day, from today on, so it still
+    reaches a report.
+    """
+    succeeded = PaystackTransaction.objects.filter(reference=OuterRef("reference"), status="success").order_by("-created_at")
+    pending = Payment.objects.filter(status="pending").exclude(reference="")
+    if references is not None:
+        pending = pending.filter(reference__in=references)
+    pending = pending.annotate(gateway_amount=Subquery(succeeded.values("amount")[:1])).filter(gateway_amount__isnull=False)
+    now = timezone.now()
+    today = timezone.localdate(now)
+    with transaction.atomic():
+        # The clinics first, as close_day() and services.settle_bills() take them, so
+        # no day is closed out while its payments are being settled
+        clinic_ids = set(pending.values_list("bill__clinic_id", flat=True))
+        clinic_ids = list(Clinic.objects.select_for_update().filter(pk__in=clinic_ids).order_by("pk").values_list("pk", flat=True))
+        # Locked, so a payment being settled elsewhere (another batch, the checkout callback) is settled once
+        candidates = (
+            pending.filter(bill__clinic_id__in=clinic_ids).select_for_update(of=("self",))
+            .annotate(gateway_paid_at=Subquery(succeeded.values("paid_at")[:1]))
+            .values_list("id", "bill_id", "bill__clinic_id", "bill__patient_id", "reference", "amount",
+                         "gateway_amount", "gateway_paid_at")
+        )
+        settled, mismatches = [], []
+        for payment_id, bill_id, clinic_id, patient_id, reference, amount, gateway_amount, paid_at in candidates:
+            if amount * 100 == gateway_amount:
+                settled.append((payment_id, bill_id, clinic_id, patient_id, amount, paid_at or now))
+            else:
+                mismatches.append((payment_id, reference, amount, gateway_amount))
+        if not settled:
+            return [], mismatches
+
+        closed = set(
+            DayCloseout.objects.filter(
+                clinic_id__in={clinic_id for _, _, clinic_id, *_ in settled},
+                day__gte=min(timezone.localdate(paid_at) for *_, paid_at in settled),
+            ).values_list("clinic_id", "day")
+        )
+        payments = []
+        for payment_id, bill_id, clinic_id, _, amount, paid_at in settled:
+            if (clinic_id, timezone.localdate(paid_at)) in closed:
+                day = _filing_day(clinic_id, max(timezone.localdate(paid_at), today), closed)
+                paid_at = now if day == today else timezone.make_aware(datetime.datetime.combine(day, datetime.time.min))
+            payments.append(Payment(id=payment_id, bill_id=bill_id, amount=amount, status="success", paid_at=paid_at))
+        # Not per-payment saves, so the rollups are rebuilt below rather than moved one at a time
+        Payment.objects.bulk_update(payments, ["status", "paid_at"], batch_size=500)
+        bill_ids = {payment.bill_id for payment in payments}
+        Bill.objects.filter(id__in=bill_ids).update(is_paid=True, updated_at=now)
+        Patient.objects.filter(open_bill_id__in=bill_ids).update(open_bill=None)
+        for day in {timezone.localdate(payment.paid_at) for payment in payments}:
+            revenue.rebuild(day, day)
+        timeline.patients_changed(patient_id for _, _, _, patient_id, *_ in settled)
+    return [payment.id for payment in payments], mismatches
+
+
+def recent(subaccount_code, n=6):
+    """The `n` most recent mirrored transactions split to `subaccount_code`."""
+    return PaystackTransaction.objects.filter(subaccount_code=subaccount_code).order_by("-created_at")[:n]
@@ -1,5 +1,6 @@
 from django.db import models
 from clinicmanager.models import Clinic
+from clinicmanager.tenancy import ClinicManager
 from django.contrib.auth import get_user_model
 from patient.models import Patient, Consultation
 from decimal import Decimal
@@ -32,9 +33,43 @@ class Bill(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = ClinicManager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["clinic", "created_at"], name="bill_clinic_created_idx"),
+            # Fallback for billing.services.open_bill when Patient.open_bill is stale
+            models.Index(
+                fields=["patient", "-created_at"], condition=models.Q(is_paid=False), name="bill_open_patient_idx"
+            ),
+        ]
+
     def __str__(self):
         return f"Bill #{self.id} - {self.patient}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        bill = super().from_db(db, field_names, values)
+        bill._saved_total = bill.__dict__.get("total_amount")
+        return bill
+
+    def save(self, *args, **kwargs):
+        # total_amount belongs to billing.services, which moves it with F() updates.
+        # A copy loaded before a charge must not write its stale total back, and
+        # a total changed here would no longer match the items.
+        if not self._state.adding and kwargs.get("update_fields") is None:
+            total = self.__dict__.get("total_amount")  # not read if deferred
+            if total != getattr(self, "_saved_total", total):
+                raise ValueError(
+                    "Bill.total_amount follows the bill's items; change it with billing.services.adjust_total()."
+                )
+            kwargs["update_fields"] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name != "total_amount"
+            ]
+        super().save(*args, **kwargs)
+        self._saved_total = self.__dict__.get("total_amount")
+
     @property
     def status(self):
         return "Paid" if self.is_paid else "Unpaid"
@@ -42,7 +77,8 @@ class Bill(models.Model):
 
 class Payment(models.Model):
     bill = models.ForeignKey(Bill, on_delete=models.CASCADE, related_name="payments")
-    reference = models.CharField(max_length=100, unique=False)
+    # Not unique: cash payments share the blank reference
+    reference = models.CharField(max_length=100, unique=False, db_index=True)
     amount = models.DecimalField(max_digits=10, decimal_places=2)
     status = models.CharField(
         max_length=20,
@@ -59,6 +95,9 @@ class Payment(models.Model):
     paystack_response = models.JSONField(null=True, blank=True)
     payment_method = models.CharField(max_length=50, default="CASH")  # e.g., ONLINE, CASH, CARD
 
+    clinic_lookup = "bill__clinic"
+    objects = ClinicManager()
+
     def __str__(self):
         return f"{self.reference} - {self.status}"
 
@@ -70,13 +109,147 @@ class Payment(models.Model):
         self.save()
 
 
+class PaystackTransaction(models.Model):
+    """
+    A Paystack transaction as Paystack last reported it. Mirrored by
+    billing.mirror from the sync job and from webhooks, so pages and
+    reconciliation read it locally instead of paging through the API.
+    """
+    paystack_id = models.BigIntegerField(unique=True)
+    reference = models.CharField(max_length=100, db_index=True)
+    subaccount_code = models.CharField(max_length=255, blank=True, default="")
+    status = models.CharField(max_length=20)
+    amount = models.BigIntegerField()  # in the currency's smallest unit, as Paystack reports it
+    currency = models.CharField(max_length=3)
+    customer_name = models.CharField(max_length=255, blank=True, default="")
+    channel = models.CharField(max_length=30, blank=True, default="")
+    gateway_response = models.CharField(max_length=255, blank=True, default="")
+    created_at = models.DateTimeField(db_index=True)
+    paid_at = models.DateTimeField(null=True, blank=True)
+    raw = models.JSONField()
+    # Seen by a sync listing; the sync resumes from the newest of these, not from webhook rows
+    listed = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["subaccount_code", "-created_at"], name="paystack_tx_subaccount_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.reference} - {self.status}"
+
+
+class PaystackEvent(models.Model):
+    """
+    A Paystack webhook delivery, kept as received. The webhook view only
+    checks the signature and inserts the row, so Paystack gets its answer
+    at once; the inbox worker (manage.py process_paystack_events) applies
+    events in batches. A redelivered event has the same key and is dropped
+    on insert.
+    """
+    STATUS_CHOICES = [
+        ("pending", "Pending"),
+        ("applied", "Applied"),
+        ("ignored", "Ignored"),
+        ("failed", "Failed"),
+    ]
+
+    key = models.CharField(max_length=64, unique=True)  # see billing.inbox.event_key
+    event = models.CharField(max_length=50)
+    reference = models.CharField(max_length=100, blank=True)
+    payload = models.JSONField()
+
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default="pending")
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+
+    received_at = models.DateTimeField(default=timezone.now)
+    applied_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["next_attempt_at"],
+                name="paystackevent_due_idx",
+                condition=models.Q(status="pending"),
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.get_status_display()} {self.event} {self.reference}"
+
+
 class BillItem(models.Model):
     bill = models.ForeignKey(Bill, on_delete=models.CASCADE, related_name='items')
     description = models.CharField(max_length=200)
     quantity = models.PositiveIntegerField(default=1)
     unit_price = models.DecimalField(max_digits=10, decimal_places=2)
     total = models.DecimalField(max_digits=10, decimal_places=2)
+    # Sub-lines of a bundled item, e.g. the tests in a lab panel: [{"name", "price", ...}].
+    # Informational only; `total` is what is billed.
+    components = models.JSONField(null=True, blank=True)
 
     def save(self, *args, **kwargs):
         self.total = self.quantity * self.unit_price
         super().save(*args, **kwargs)
+
+
+class DailyRevenue(models.Model):
+    """
+    Payments per (clinic, day paid, payment method, status): how many and
+    how much. Kept current by billing.revenue as payments are saved, and
+    rebuilt from Payment with `manage.py rollup_revenue`.
+    """
+    clinic = models.ForeignKey(Clinic, on_delete=models.CASCADE, related_name="daily_revenue")
+    day = models.DateField()
+    payment_method = models.CharField(max_length=50)
+    status = models.CharField(max_length=20)
+    # Signed: a correction can reach a row before the rollup is rebuilt
+    payment_count = models.IntegerField(default=0)
+    amount = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal("0.00"))
+
+    objects = ClinicManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["clinic", "day", "payment_method", "status"], name="uniq_daily_revenue_bucket"
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.clinic_id}/{self.day}/{self.payment_method}/{self.status}: {self.payment_count} = {self.amount}"
+
+
+class DayCloseout(models.Model):
+    """
+    A clinic's takings for one day, frozen when the cashier closes the day
+    (billing.services.close_day). Final: it is never updated, and once a
+    day is closed no more cash is taken on it. The close-out receipt and
+    the revenue report read this one row for a closed day.
+    """
+    clinic = models.ForeignKey(Clinic, on_delete=models.CASCADE, related_name="closeouts")
+    day = models.DateField()
+    closed_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name="+")
+    closed_at = models.DateTimeField(default=timezone.now)
+    payment_count = models.PositiveIntegerField()
+    total_amount = models.DecimalField(max_digits=14, decimal_places=2)
+    # {payment_method: {"payments": n, "amount": "123.00"}}
+    by_method = models.JSONField()
+
+    objects = ClinicManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["clinic", "day"], name="uniq_closeout_clinic_day"),
+        ]
+
+    def __str__(self):
+        return f"{self.clinic_id}/{self.day}: {self.payment_count} payments, {self.total_amount}"
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValueError("A day's close-out is final and cannot be changed.")
+        super().save(*args, **kwargs)
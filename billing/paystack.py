@@ -0,0 +1,234 @@
+"""
+Paystack API client.
+
+One httpx.AsyncClient per process keeps its connections to Paystack open
+between calls, on an event loop running on a daemon thread. Views and
+signals call the plain functions at the bottom of this module, which
+block until the loop has the answer. Every call is bounded by
+PAYSTACK_TIMEOUT.
+
+Calls that fail for transient reasons are retried up to PAYSTACK_RETRIES
+times with exponential backoff and jitter. These are connection errors,
+timeouts, 429 and 5xx responses. A 429's Retry-After is honoured. POSTs
+are only retried when Paystack cannot have acted on them (a refused
+connection or a 429), so a payment is never initialized twice.
+
+Listing a subaccount's transactions asks Paystack to filter by subaccount
+and still checks each row, since the filter is not applied on every
+endpoint. Page 1 gives the page count; the rest are fetched
+PAYSTACK_CONCURRENCY at a time until enough matching rows are found.
+
+billing.fake_paystack serves the endpoints used here on localhost, for
+tests and `manage.py bench_paystack`.
+"""
+import asyncio
+import hashlib
+import hmac
+import random
+import threading
+
+import httpx
+from django.conf import settings
+
+PER_PAGE = 50  # Paystack's largest page
+SUBACCOUNT_FILTER = "subaccount_code"
+BACKOFF_BASE = 0.5  # seconds; doubles per attempt
+BACKOFF_MAX = 8
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class PaystackError(Exception):
+    """Paystack could not be reached, or kept failing, after every retry."""
+
+
+class PaystackClient:
+    def __init__(self, base_url, secret_key, *, timeout=10, retries=3, concurrency=4, max_connections=10):
+        self.base_url = base_url.rstrip("/")
+        self.secret_key = secret_key
+        self.timeout = timeout
+        self.retries = retries
+        self.concurrency = concurrency
+        self.max_connections = max_connections
+        self._http = None
+
+    @property
+    def http(self):
+        # Created on first use, on the loop that will run every call
+        if self._http is None:
+            self._http = httpx.AsyncClient(
+                base_url=self.base_url,
+                headers={"Authorization": f"Bearer {self.secret_key}"},
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=self.max_connections, max_keepalive_connections=self.max_connections),
+            )
+        return self._http
+
+    async def close(self):
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+
+    async def request(self, method, path, *, params=None, json=None):
+        """
+        Paystack's JSON body for the call. Paystack reports a rejected
+        call (4xx) in the body, with "status": false and a "message".
+        """
+        for attempt in range(self.retries + 1):
+            try:
+                response = await self.http.request(method, path, params=params, json=json)
+            except httpx.TransportError as e:
+                # A POST that may have reached Paystack is not sent again
+                if attempt == self.retries or (method != "GET" and not isinstance(e, httpx.ConnectError)):
+                    raise PaystackError(f"{method} {path}: {e!r}") from e
+                await asyncio.sleep(self._backoff(attempt))
+                continue
+            if response.status_code not in RETRY_STATUSES:
+                try:
+                    return response.json()
+                except ValueError:
+                    # e.g. a proxy's HTML error page, or an empty body
+                    raise PaystackError(f"{method} {path}: HTTP {response.status_code}, not JSON") from None
+            if attempt == self.retries or (method != "GET" and response.status_code != 429):
+                raise PaystackError(f"{method} {path}: HTTP {response.status_code}")
+            await asyncio.sleep(self._backoff(attempt, response.headers.get("Retry-After")))
+
+    @staticmethod
+    def _backoff(attempt, retry_after=None):
+        if retry_after is not None:
+            try:
+                return float(retry_after)
+            except ValueError:
+                pass
+        delay = min(BACKOFF_BASE * 2 ** attempt, BACKOFF_MAX)
+        return delay + random.uniform(0, delay / 5)
+
+    async def transactions_page(self, page, *, per_page=PER_PAGE, **filters):
+        """(transactions, meta) for one page of the transaction list, newest first."""
+        body = await self.request("GET", "/transaction", params={"perPage": per_page, "page": page, **filters})
+        if not body.get("status"):
+            raise PaystackError(f"GET /transaction: {body.get('message')}")
+        return body.get("data") or [], body.get("meta") or {}
+
+    async def pages(self, pages, *, per_page=PER_PAGE, **filters):
+        """The transactions on each of `pages`, in that order, fetched at most `concurrency` at a time."""
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def fetch(page):
+            async with semaphore:
+                return (await self.transactions_page(page, per_page=per_page, **filters))[0]
+
+        return await asyncio.gather(*(fetch(page) for page in pages))
+
+    async def subaccount_transactions(self, subaccount_code, n=6):
+        """The `n` most recent transactions split to `subaccount_code`, newest first."""
+        filters = {SUBACCOUNT_FILTER: subaccount_code}
+        data, meta = await self.transactions_page(1, **filters)
+        found = _for_subaccount(data, subaccount_code)
+        page_count = int(meta.get("pageCount") or 1)
+        next_page = 2
+        while len(found) < n and next_page <= page_count:
+            # A window of pages at a time: later pages are only fetched if these fall short
+            window = range(next_page, min(next_page + self.concurrency, page_count + 1))
+            for data in await self.pages(window, **filters):
+                found += _for_subaccount(data, subaccount_code)
+            next_page = window.stop
+        found.sort(key=created_at, reverse=True)
+        return found[:n]
+
+    async def verify(self, reference):
+        """The transaction with `reference`, or None if Paystack has none."""
+        body = await self.request("GET", f"/transaction/verify/{reference}")
+        return body["data"] if body.get("status") else None
+
+    async def initialize(self, payload):
+        return await self.request("POST", "/transaction/initialize", json=payload)
+
+    async def create_subaccount(self, payload):
+        return await self.request("POST", "/subaccount", json=payload)
+
+
+def created_at(transaction):
+    """A transaction's creation time as Paystack sent it (ISO 8601); its objects use both spellings."""
+    return transaction.get("createdAt") or transaction.get("created_at") or ""
+
+
+def signature(body, secret_key):
+    """The X-Paystack-Signature of a webhook body: its HMAC-SHA512 under the secret key."""
+    return hmac.new(secret_key.encode(), body, hashlib.sha512).hexdigest()
+
+
+def valid_signature(body, received):
+    return bool(received) and hmac.compare_digest(signature(body, settings.PAYSTACK_SECRET_KEY), received)
+
+
+def _for_subaccount(transactions, subaccount_code):
+    return [tx for tx in transactions if (tx.get("subaccount") or {}).get("subaccount_code") == subaccount_code]
+
+
+# --- blocking calls for sync code ------------------------------------------
+
+_loop = None
+_client = None
+_lock = threading.Lock()
+
+
+def _ensure_loop():
+    global _loop
+    # Started on first use rather than at import, so it survives forking servers
+    with _lock:
+        if _loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="paystack", daemon=True).start()
+            _loop = loop
+    return _loop
+
+
+def run(coroutine):
+    """Runs `coroutine` on the client's loop and returns its result."""
+    return asyncio.run_coroutine_threadsafe(coroutine, _ensure_loop()).result()
+
+
+def get_client():
+    global _client
+    with _lock:
+        if _client is None:
+            _client = PaystackClient(
+                getattr(settings, "PAYSTACK_BASE_URL", "https://api.paystack.co"),
+                settings.PAYSTACK_SECRET_KEY,
+                timeout=getattr(settings, "PAYSTACK_TIMEOUT", 10),
+                retries=getattr(settings, "PAYSTACK_RETRIES", 3),
+                concurrency=getattr(settings, "PAYSTACK_CONCURRENCY", 4),
+            )
+    return _client
+
+
+def set_client(client):
+    """Replaces this process's client, e.g. with one pointed at a FakePaystack in tests."""
+    global _client
+    if _client is not None and _client is not client:
+        run(_client.close())
+    _client = client
+
+
+def subaccount_transactions(subaccount_code, n=6):
+    return run(get_client().subaccount_transactions(subaccount_code, n))
+
+
+def transactions_page(page, **filters):
+    return run(get_client().transactions_page(page, **filters))
+
+
+def pages(pages, **filters):
+    return run(get_client().pages(pages, **filters))
+
+
+def verify(reference):
+    return run(get_client().verify(reference))
+
+
+def initialize(payload):
+    return run(get_client().initialize(payload))
+
+
+def create_subaccount(payload):
+    return run(get_client().create_subaccount(payload))
@@ -0,0 +1,307 @@
+"""
+Revenue reporting.
+
+Payments are rolled up per (clinic, day paid, payment method, status) in
+DailyRevenue, so a report over any range reads one row per day and method
+instead of every payment. A payment counts on the local day of its
+paid_at; payments never paid (no paid_at) are not rolled up.
+
+The rollups are moved as payments are saved or deleted (see
+billing.signals): the change is worked out from the row as it was loaded
+and applied with one upsert per bucket, in the saving transaction.
+Queryset update()s and raw SQL bypass the signals; `manage.py
+rollup_revenue` rebuilds any range of days from Payment.
+
+summary() reads closed days from their DayCloseout, other past days from
+the rollups and today from the payments themselves. csv_stream() and parquet_stream() (when pyarrow is
+installed) stream the payment rows of a range, reading them through a
+server-side cursor so an export of years of payments never sits in memory.
+"""
+import csv
+import datetime
+import importlib.util
+import io
+from collections import defaultdict
+from decimal import Decimal
+from itertools import islice
+
+from django.db import connection, transaction
+from django.db.models import Count, Exists, OuterRef, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import Bill, DailyRevenue, DayCloseout, Payment
+
+ZERO = Decimal("0.00")
+# Payment statuses that are money received
+REVENUE_STATUSES = ("success", "manual")
+EXPORT_COLUMNS = ("id", "reference", "bill_id", "amount", "payment_method", "status", "paid_at")
+EXPORT_CHUNK = 2000
+
+_UNKNOWN = object()  # state of a payment loaded without one of the rolled-up columns
+_STATE_FIELDS = ("bill_id", "paid_at", "payment_method", "status", "amount")
+
+
+def _bounds(first_day, last_day):
+    """Aware datetimes: the start of `first_day` and the start of the day after `last_day`."""
+    start = timezone.make_aware(datetime.datetime.combine(first_day, datetime.time.min))
+    end = timezone.make_aware(datetime.datetime.combine(last_day + datetime.timedelta(days=1), datetime.time.min))
+    return start, end
+
+
+# --- incremental maintenance -----------------------------------------------
+
+def payment_state(payment):
+    """
+    (bill_id, day, payment_method, status, amount) as loaded, None for a
+    payment that was never paid, or _UNKNOWN if a column was deferred.
+    """
+    values = payment.__dict__
+    if any(name not in values for name in _STATE_FIELDS):
+        return _UNKNOWN
+    if values["paid_at"] is None:
+        return None
+    return (
+        values["bill_id"], timezone.localdate(values["paid_at"]),
+        values["payment_method"], values["status"], Decimal(values["amount"]),
+    )
+
+
+def payment_saved(payment, created):
+    before = None if created else getattr(payment, "_revenue_state", _UNKNOWN)
+    after = payment_state(payment)
+    if after is _UNKNOWN:
+        after = payment_state(Payment.objects.get(pk=payment.pk))
+    payment._revenue_state = after
+    if before is _UNKNOWN:
+        # We can't tell what it was: recount the day it is in now
+        if after:
+            clinic_id = _clinics([after[0]], _cached_clinic(payment))[after[0]]
+            rebuild(after[1], after[1], clinic=clinic_id)
+        return
+    payments_changed([(before, after)], clinics=_cached_clinic(payment))
+
+
+def payment_deleted(payment):
+    before = getattr(payment, "_revenue_state", _UNKNOWN)
+    if before and before is not _UNKNOWN:
+        payments_changed([(before, None)], clinics=_cached_clinic(payment))
+
+
+def payments_created(payments):
+    """Rolls up payments saved without signals (bulk_create). Their bills should be cached on them."""
+    clinics = {}
+    for payment in payments:
+        clinics.update(_cached_clinic(payment))
+    payments_changed([(None, payment_state(payment)) for payment in payments], clinics=clinics)
+
+
+def _cached_clinic(payment):
+    """{bill_id: clinic_id} from the payment's cached bill, if it has one."""
+    bill = payment._state.fields_cache.get("bill")
+    return {bill.pk: bill.clinic_id} if bill is not None else {}
+
+
+def _clinics(bill_ids, known):
+    """{bill_id: clinic_id} for `bill_ids`, looking up those not in `known`."""
+    missing = set(bill_ids) - set(known)
+    if not missing:
+        return known
+    return {**known, **dict(Bill.objects.filter(pk__in=missing).values_list("id", "clinic_id"))}
+
+
+def payments_changed(changes, *, clinics=None):
+    """
+    Moves the rollups by (before, after) payment states, where either side
+    may be None for a payment entering or leaving them. `clinics` may give
+    the clinic of some bills ({bill_id: clinic_id}) to save looking them up.
+    """
+    changes = [(before, after) for before, after in changes if before or after]
+    if not changes:
+        return
+    clinics = _clinics([state[0] for change in changes for state in change if state], clinics or {})
+    deltas = defaultdict(lambda: [0, ZERO])
+    for before, after in changes:
+        for state, sign in ((before, -1), (after, 1)):
+            if state:
+                bill_id, day, method, status, amount = state
+                delta = deltas[(clinics[bill_id], day, method, status)]
+                delta[0] += sign
+                delta[1] += sign * amount
+    deltas = {bucket: delta for bucket, delta in deltas.items() if delta[0] or delta[1]}
+    if not deltas:
+        return
+    table = connection.ops.quote_name(DailyRevenue._meta.db_table)
+    sql = (
+        f"INSERT INTO {table} (clinic_id, day, payment_method, status, payment_count, amount) "
+        f"VALUES (%s, %s, %s, %s, %s, %s) "
+        f"ON CONFLICT (clinic_id, day, payment_method, status) DO UPDATE SET "
+        f"payment_count = {table}.payment_count + EXCLUDED.payment_count, "
+        f"amount = {table}.amount + EXCLUDED.amount"
+    )
+    with transaction.atomic(), connection.cursor() as cursor:
+        for (clinic_id, day, method, status), (count, amount) in deltas.items():
+            cursor.execute(sql, [clinic_id, day, method, status, count, amount])
+
+
+def rebuild(first_day, last_day, *, clinic=None):
+    """
+    Recomputes the rollups for [first_day, last_day] (for one clinic, or
+    all) from the payments, in one aggregate query and one transaction.
+    Returns the number of rollup rows written.
+    """
+    start, end = _bounds(first_day, last_day)
+    payments = Payment.objects.filter(paid_at__gte=start, paid_at__lt=end)
+    rollups = DailyRevenue.objects.filter(day__range=(first_day, last_day))
+    if clinic is not None:
+        payments = payments.for_clinic(clinic)
+        rollups = rollups.for_clinic(clinic)
+    rows = (
+        payments.order_by()
+        .annotate(day=TruncDate("paid_at"))
+        .values("bill__clinic_id", "day", "payment_method", "status")
+        .annotate(payment_count=Count("id"), total=Sum("amount"))
+    )
+    with transaction.atomic():
+        rollups.delete()
+        created = DailyRevenue.objects.bulk_create([
+            DailyRevenue(
+                clinic_id=row["bill__clinic_id"], day=row["day"], payment_method=row["payment_method"],
+                status=row["status"], payment_count=row["payment_count"], amount=row["total"],
+            )
+            for row in rows
+        ], batch_size=1000)
+    return len(created)
+
+
+# --- reports ---------------------------------------------------------------
+
+def summary(clinic, first_day=None, last_day=None, *, statuses=REVENUE_STATUSES, closeouts=True):
+    """
+    {"day", "payment_method", "payments", "amount"} for each day and method
+    with payments in [first_day, last_day] (open ends: since the first
+    payment, up to today), newest day first. Closed days come from their
+    DayCloseout (which counts REVENUE_STATUSES), other past days from the
+    rollups and today from the payments.
+    """
+    today = timezone.localdate()
+    last_day = min(last_day or today, today)
+    rollups = DailyRevenue.objects.for_clinic(clinic).filter(status__in=statuses, day__lt=today, day__lte=last_day)
+    closed = DayCloseout.objects.for_clinic(clinic).filter(day__lte=last_day)
+    if first_day is not None:
+        rollups = rollups.filter(day__gte=first_day)
+        closed = closed.filter(day__gte=first_day)
+
+    rows = []
+    closed_days = set()
+    if closeouts:
+        for day, by_method in closed.values_list("day", "by_method"):
+            closed_days.add(day)
+            rows += [
+                {"day": day, "payment_method": method, "payments": totals["payments"], "amount": Decimal(totals["amount"])}
+                for method, totals in by_method.items()
+            ]
+        rollups = rollups.exclude(Exists(
+            DayCloseout.objects.filter(clinic_id=OuterRef("clinic_id"), day=OuterRef("day"))
+        ))
+    rows += (
+        rollups.order_by().values("day", "payment_method")
+        .annotate(payments=Sum("payment_count"), amount=Sum("amount"))
+        .exclude(payments=0)
+    )
+    if last_day == today and (first_day is None or first_day <= today) and today not in closed_days:
+        start, end = _bounds(today, today)
+        rows += [
+            {"day": today, **row}
+            for row in Payment.objects.for_clinic(clinic)
+            .filter(status__in=statuses, paid_at__gte=start, paid_at__lt=end)
+            .order_by().values("payment_method")
+            .annotate(payments=Count("id"), amount=Sum("amount"))
+        ]
+    rows.sort(key=lambda row: (row["day"], row["payment_method"]), reverse=True)
+    return rows
+
+
+def payments(clinic, first_day=None, last_day=None, *, statuses=REVENUE_STATUSES):
+    """The clinic's payments paid in [first_day, last_day] (open ends allowed), oldest first."""
+    rows = Payment.objects.for_clinic(clinic).filter(status__in=statuses, paid_at__isnull=False)
+    if first_day is not None:
+        rows = rows.filter(paid_at__gte=_bounds(first_day, first_day)[0])
+    if last_day is not None:
+        rows = rows.filter(paid_at__lt=_bounds(last_day, last_day)[1])
+    return rows.order_by("paid_at", "id")
+
+
+# --- exports ---------------------------------------------------------------
+
+def parquet_available():
+    return importlib.util.find_spec("pyarrow") is not None
+
+
+def _chunks(queryset):
+    # iterator() reads through a server-side cursor on PostgreSQL, EXPORT_CHUNK rows per fetch
+    rows = queryset.values_list(*EXPORT_COLUMNS).iterator(chunk_size=EXPORT_CHUNK)
+    while chunk := list(islice(rows, EXPORT_CHUNK)):
+        yield chunk
+
+
+def csv_stream(queryset):
+    """The CSV text of `queryset`'s export columns, one chunk of rows at a time."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    for chunk in _chunks(queryset):
+        writer.writerows(chunk)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+class _Sink(io.RawIOBase):
+    """A write-only stream whose contents are handed on (drained) as they are written."""
+
+    def __init__(self):
+        self._chunks = []
+        self._written = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._written += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._written
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def parquet_stream(queryset):
+    """The bytes of a Parquet file of `queryset`'s export columns, one row group per chunk of rows."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([
+        ("id", pa.int64()),
+        ("reference", pa.string()),
+        ("bill_id", pa.int64()),
+        ("amount", pa.decimal128(14, 2)),
+        ("payment_method", pa.string()),
+        ("status", pa.string()),
+        ("paid_at", pa.timestamp("us", tz="UTC")),
+    ])
+    sink = _Sink()
+    with pq.ParquetWriter(sink, schema) as writer:
+        for chunk in _chunks(queryset):
+            columns = zip(*chunk)
+            writer.write_batch(pa.record_batch(
+                [pa.array(column, type=field.type) for column, field in zip(columns, schema)], schema=schema
+            ))
+            yield sink.drain()
+    yield sink.drain()
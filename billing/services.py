@@ -0,0 +1,247 @@
+"""
+Billing ledger.
+
+BillItems are the source of truth: a bill's total_amount is the sum of
+its items' totals. It is never read, changed and saved back in Python.
+Every charge goes through add_items() (or charge(), which finds the bill
+first). add_items() inserts the items and moves the total with a single
+UPDATE ... SET total_amount = total_amount + delta, in one transaction,
+so concurrent charges to the same bill add up instead of overwriting
+each other.
+
+A patient's current open bill is found through Patient.open_bill, which
+is set when a bill is opened and cleared when it is paid (see
+billing.signals). Patient.visit_count counts their bills, so the
+consultation fee tier needs no COUNT(*) over the bills table.
+
+`manage.py reconcile_bills` recomputes totals from the items in batched,
+set-based queries and reports any bill whose total had drifted.
+
+At the desk, settle_bills() takes cash for any number of bills at once,
+and close_day() freezes the day's takings into a DayCloseout.
+"""
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import DecimalField, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from clinicmanager.models import Clinic
+from patient import timeline
+from patient.models import Patient
+from . import revenue
+from .models import Bill, BillItem, DayCloseout, Payment
+
+ZERO = Decimal("0.00")
+FIRST_VISIT_FEE = Decimal("1500")
+RETURN_VISIT_FEE = Decimal("1300")
+
+
+def _lock_patient(patient):
+    return Patient.objects.select_for_update().only("id", "clinic_id", "open_bill_id", "visit_count").get(pk=patient.pk)
+
+
+def _new_bill(patient, consultation=None):
+    """Opens a bill and makes it the patient's open bill. `patient` must be locked."""
+    bill = Bill.objects.create(clinic_id=patient.clinic_id, patient_id=patient.pk, consultation=consultation)
+    Patient.objects.filter(pk=patient.pk).update(open_bill=bill, visit_count=F("visit_count") + 1)
+    return bill
+
+
+def open_bill(patient, *, consultation=None):
+    """
+    The patient's open bill, locked for the current transaction, or a new
+    bill for `consultation` if they have none. Two primary key lookups.
+    """
+    locked = _lock_patient(patient)
+    bill = None
+    if locked.open_bill_id:
+        bill = Bill.objects.select_for_update().filter(pk=locked.open_bill_id, is_paid=False).first()
+        if bill is None:
+            # Paid without a save() (a queryset update): find the newest unpaid bill, if any
+            bill = (
+                Bill.objects.select_for_update()
+                .filter(patient_id=locked.pk, is_paid=False)
+                .order_by("-created_at")
+                .first()
+            )
+            Patient.objects.filter(pk=locked.pk).update(open_bill=bill)
+    if bill is None:
+        bill = _new_bill(locked, consultation)
+    return bill
+
+
+def start_visit(patient):
+    """
+    Opens a new bill for a visit, charged the consultation fee: the first
+    visit's or a returning patient's. Returns (bill, fee).
+    """
+    with transaction.atomic():
+        locked = _lock_patient(patient)
+        fee = FIRST_VISIT_FEE if locked.visit_count == 0 else RETURN_VISIT_FEE
+        bill = _new_bill(locked)
+        add_items(bill, [BillItem(description="Consultation fee", quantity=1, unit_price=fee)])
+    return bill, fee
+
+
+def bill_closed(bill):
+    """Clears the patient's open bill pointer if it points at `bill`. Called once a bill is paid."""
+    Patient.objects.filter(pk=bill.patient_id, open_bill_id=bill.pk).update(open_bill=None)
+
+
+def add_items(bill, items):
+    """
+    Adds unsaved BillItems to `bill` and raises its total by theirs, with
+    one INSERT and one UPDATE. Returns the saved items.
+    """
+    for item in items:
+        item.bill = bill
+        # bulk_create bypasses BillItem.save()
+        item.total = item.quantity * item.unit_price
+    if not items:
+        return []
+    with transaction.atomic():
+        items = BillItem.objects.bulk_create(items)
+        _move_total(bill, sum((item.total for item in items), ZERO))
+    return items
+
+
+def charge(patient, description, unit_price, *, quantity=1, consultation=None, components=None):
+    """Bills `quantity` x `unit_price` to the patient's open bill. Returns (bill, item)."""
+    with transaction.atomic():
+        bill = open_bill(patient, consultation=consultation)
+        [item] = add_items(bill, [BillItem(
+            description=description, quantity=quantity, unit_price=unit_price, components=components,
+        )])
+    return bill, item
+
+
+def remove_item(item):
+    """Deletes a line item and lowers its bill's total by the item's."""
+    with transaction.atomic():
+        item.delete()
+        _move_total(item.bill, -item.total)
+
+
+def adjust_total(bill, new_total, *, description="Adjustment"):
+    """
+    Brings `bill` to `new_total` by adding an adjustment item for the
+    difference, so the items still add up to the total. Returns the item,
+    or None if the total already matched.
+    """
+    with transaction.atomic():
+        current = Bill.objects.select_for_update().values_list("total_amount", flat=True).get(pk=bill.pk)
+        delta = new_total - current
+        if not delta:
+            return None
+        # A negative adjustment is one "unit" at a negative price: quantity is unsigned
+        [item] = add_items(bill, [BillItem(description=description, quantity=1, unit_price=delta)])
+    return item
+
+
+def _move_total(bill, delta):
+    Bill.objects.filter(pk=bill.pk).update(total_amount=F("total_amount") + delta, updated_at=timezone.now())
+    # Keep the caller's copy current without rereading the row
+    bill.total_amount = bill._saved_total = (bill.total_amount or ZERO) + delta
+
+
+def items_total():
+    """Subquery: the sum of the outer Bill's item totals (0 without items)."""
+    return Coalesce(
+        Subquery(
+            BillItem.objects.filter(bill=OuterRef("pk")).order_by().values("bill")
+            .annotate(total=Sum("total")).values("total")
+        ),
+        Value(ZERO),
+        output_field=DecimalField(max_digits=10, decimal_places=2),
+    )
+
+
+def drifted_bills(bills):
+    """(id, total_amount, items_total) for each bill in `bills` whose total is not the sum of its items."""
+    return list(
+        bills.annotate(items_total=items_total())
+        .exclude(total_amount=F("items_total"))
+        .values_list("id", "total_amount", "items_total")
+    )
+
+
+def reconcile(first_id, last_id, *, fix=True):
+    """
+    Finds the bills with ids in [first_id, last_id] whose total has
+    drifted from their items and, with `fix`, resets those totals from
+    the items. Returns the drift found, as drifted_bills() does.
+    """
+    drift = drifted_bills(Bill.objects.filter(id__range=(first_id, last_id)))
+    if drift and fix:
+        with transaction.atomic():
+            # Lock first so charges committed meanwhile are counted, then check again
+            ids = list(Bill.objects.select_for_update().filter(id__in=[row[0] for row in drift]).values_list("id", flat=True))
+            drift = drifted_bills(Bill.objects.filter(id__in=ids))
+            Bill.objects.filter(id__in=[row[0] for row in drift]).update(
+                total_amount=items_total(), updated_at=timezone.now()
+            )
+    return drift
+
+
+def settle_bills(bills, *, user=None, payment_method="CASH"):
+    """
+    Takes payment in full for the unpaid bills among `bills` (a queryset),
+    in one transaction: their Payments go in with one INSERT and the bills
+    are marked paid with one UPDATE. Returns the new payments. Raises
+    ValueError if a clinic has already closed out today.
+    """
+    now = timezone.now()
+    unpaid = bills.filter(is_paid=False)
+    with transaction.atomic():
+        # The clinics before the bills, in the order close_day() and mirror.settle() take them, so
+        # a day is never closed with a settlement half counted and the lockers cannot deadlock
+        clinic_ids = set(unpaid.values_list("clinic_id", flat=True))
+        list(Clinic.objects.select_for_update().filter(pk__in=clinic_ids).order_by("pk").values_list("pk", flat=True))
+        unpaid = list(
+            unpaid.filter(clinic_id__in=clinic_ids).select_for_update()
+            .only("id", "clinic_id", "patient_id", "total_amount")
+        )
+        if not unpaid:
+            return []
+        if DayCloseout.objects.filter(clinic_id__in={bill.clinic_id for bill in unpaid}, day=timezone.localdate(now)).exists():
+            raise ValueError("Today has been closed out; no more payments can be taken on it.")
+        payments = Payment.objects.bulk_create([
+            Payment(
+                bill=bill, amount=bill.total_amount, status="manual", paid_at=now,
+                created_by=user, payment_method=payment_method,
+            )
+            for bill in unpaid
+        ])
+        bill_ids = [bill.id for bill in unpaid]
+        # One UPDATE instead of a save() per bill: clear the open-bill pointers close_paid_bill would have
+        Bill.objects.filter(id__in=bill_ids).update(is_paid=True, updated_at=now)
+        Patient.objects.filter(open_bill_id__in=bill_ids).update(open_bill=None)
+        revenue.payments_created(payments)
+        timeline.patients_changed(bill.patient_id for bill in unpaid)
+    return payments
+
+
+def close_day(clinic, *, user=None, day=None):
+    """
+    Freezes `clinic`'s takings for `day` (today by default), per payment
+    method, into a DayCloseout and returns it. Raises ValueError if the day
+    is already closed.
+    """
+    day = day or timezone.localdate()
+    try:
+        with transaction.atomic():
+            list(Clinic.objects.select_for_update().filter(pk=clinic.pk).values_list("pk", flat=True))
+            by_method = {
+                row["payment_method"]: {"payments": row["payments"], "amount": str(row["amount"])}
+                for row in revenue.summary(clinic, day, day, closeouts=False)
+            }
+            return DayCloseout.objects.create(
+                clinic=clinic, day=day, closed_by=user,
+                payment_count=sum(totals["payments"] for totals in by_method.values()),
+                total_amount=sum((Decimal(totals["amount"]) for totals in by_method.values()), ZERO),
+                by_method=by_method,
+            )
+    except IntegrityError:
+        raise ValueError(f"{day} has already been closed out.")
@@ -1,11 +1,10 @@
-import requests
 from django.conf import settings
 from django.dispatch import receiver
-from django.db.models.signals import post_save,pre_save
+from django.db.models.signals import post_save, pre_save, post_init, post_delete
 from clinicmanager.models import ClinicBankDetails
-from .models import PaystackSubaccount
+from .models import Bill, Payment, PaystackSubaccount
+from . import paystack, revenue, services
 
-PAYSTACK_BASE = getattr(settings, 'PAYSTACK_BASE_URL', 'https://api.paystack.co')
 PAYSTACK_SECRET = getattr(settings, 'PAYSTACK_SECRET_KEY', None)
 
 @receiver(post_save, sender=ClinicBankDetails)
@@ -23,15 +22,9 @@ def create_paystack_subaccount(sender, instance, created, **kwargs):
         "percentage_charge": 0,
         # Additional optional fields...
     }
-    headers = {
-        "Authorization": f"Bearer {PAYSTACK_SECRET}",
-        "Content-Type": "application/json",
-    }
-    url = f"{PAYSTACK_BASE}/subaccount"
     try:
-        r = requests.post(url, json=payload, headers=headers, timeout=10)
-        data = r.json()
-        if r.status_code in (200,201) and data.get('status'):
+        data = paystack.create_subaccount(payload)
+        if data.get('status'):
             sub = PaystackSubaccount.objects.create(
                 clinic=instance.clinic,
                 subaccount_code=data['data'].get('subaccount_code'),
@@ -47,3 +40,23 @@ def create_paystack_subaccount(sender, instance, created, **kwargs):
     except Exception as e:
         PaystackSubaccount.objects.create(clinic=instance.clinic, raw_response={'error': str(e)})
 
+
+@receiver(post_save, sender=Bill)
+def close_paid_bill(sender, instance, **kwargs):
+    if instance.is_paid:
+        services.bill_closed(instance)
+
+
+@receiver(post_init, sender=Payment)
+def remember_payment_state(sender, instance, **kwargs):
+    instance._revenue_state = revenue.payment_state(instance)
+
+
+@receiver(post_save, sender=Payment)
+def roll_up_payment(sender, instance, created, **kwargs):
+    revenue.payment_saved(instance, created)
+
+
+@receiver(post_delete, sender=Payment)
+def unroll_payment(sender, instance, **kwargs):
+    revenue.payment_deleted(instance)
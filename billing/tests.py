@@ -1,3 +1,272 @@
-from django.test import TestCase
+import asyncio
+import datetime
+import json
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+import httpx
+from django.core.cache import cache
+from django.db.models import Sum
+from django.test import SimpleTestCase, TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from authentication.models import User
+from patient import timeline
+from patient.models import Patient
+from patient.tests import make_clinic, make_patient
+from . import inbox, mirror, paystack, revenue, services
+from .models import Bill, BillItem, DayCloseout, Payment, PaystackEvent, PaystackTransaction
+
+
+def items_sum(bill):
+    return bill.items.aggregate(total=Sum("total"))["total"] or Decimal("0.00")
+
+
+class BillLedgerTests(TestCase):
+    def setUp(self):
+        self.patient = make_patient(make_clinic())
+        self.bill = Bill.objects.create(clinic=self.patient.clinic, patient=self.patient)
+
+    def assertTotalMatchesItems(self):
+        bill = Bill.objects.get(pk=self.bill.pk)
+        self.assertEqual(bill.total_amount, items_sum(bill))
+        # The caller's copy is kept current too
+        self.assertEqual(self.bill.total_amount, bill.total_amount)
+        return bill.total_amount
+
+    def test_add_and_remove_items_keep_the_total(self):
+        items = services.add_items(self.bill, [
+            BillItem(description="Consultation fee", quantity=1, unit_price=Decimal("1500")),
+            BillItem(description="Malaria test", quantity=2, unit_price=Decimal("250.50")),
+        ])
+        self.assertEqual(self.assertTotalMatchesItems(), Decimal("2001.00"))
+
+        services.remove_item(items[1])
+        self.assertEqual(self.assertTotalMatchesItems(), Decimal("1500.00"))
+
+    def test_adjust_total_records_the_difference_as_an_item(self):
+        services.add_items(self.bill, [BillItem(description="Fee", quantity=1, unit_price=Decimal("1000"))])
+        item = services.adjust_total(self.bill, Decimal("800"))
+        self.assertEqual(item.total, Decimal("-200"))
+        self.assertEqual(self.assertTotalMatchesItems(), Decimal("800.00"))
+        self.assertIsNone(services.adjust_total(self.bill, Decimal("800")))
+
+    def test_charge_opens_one_bill_per_visit(self):
+        bill, _ = services.charge(self.patient, "Dressing", Decimal("300"))
+        again, _ = services.charge(self.patient, "Injection", Decimal("200"))
+        self.assertEqual(bill.pk, again.pk)
+        self.assertEqual(Bill.objects.get(pk=bill.pk).total_amount, Decimal("500.00"))
+
+    def test_reconcile_fixes_drifted_totals(self):
+        services.add_items(self.bill, [BillItem(description="Fee", quantity=1, unit_price=Decimal("1000"))])
+        Bill.objects.filter(pk=self.bill.pk).update(total_amount=Decimal("1"))
+        drift = services.reconcile(self.bill.pk, self.bill.pk)
+        self.assertEqual(drift, [(self.bill.pk, Decimal("1.00"), Decimal("1000.00"))])
+        self.assertEqual(services.reconcile(self.bill.pk, self.bill.pk), [])
+
+
+class BillSaveTests(TestCase):
+    def setUp(self):
+        patient = make_patient(make_clinic())
+        self.bill = Bill.objects.create(clinic=patient.clinic, patient=patient)
+        services.add_items(self.bill, [BillItem(description="Fee", quantity=1, unit_price=Decimal("1000"))])
+
+    def test_changing_the_total_directly_is_refused(self):
+        bill = Bill.objects.get(pk=self.bill.pk)
+        bill.total_amount = Decimal("1")
+        with self.assertRaises(ValueError):
+            bill.save()
+        self.assertEqual(Bill.objects.get(pk=bill.pk).total_amount, Decimal("1000.00"))
+
+    def test_stale_copy_does_not_write_its_total_back(self):
+        stale = Bill.objects.get(pk=self.bill.pk)
+        services.add_items(self.bill, [BillItem(description="Test", quantity=1, unit_price=Decimal("200"))])
+        stale.is_paid = True
+        stale.save()
+        bill = Bill.objects.get(pk=self.bill.pk)
+        self.assertEqual((bill.is_paid, bill.total_amount), (True, Decimal("1200.00")))
+
+    def test_copy_moved_by_the_services_can_still_be_saved(self):
+        self.bill.is_paid = True
+        self.bill.save()
+        self.assertTrue(Bill.objects.get(pk=self.bill.pk).is_paid)
+
+
+class MirrorSettleTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.patient = make_patient(make_clinic())
+        self.clinic = self.patient.clinic
+        bill = Bill.objects.create(clinic=self.clinic, patient=self.patient)
+        services.add_items(bill, [BillItem(description="Fee", quantity=1, unit_price=Decimal("1000"))])
+        self.payment = Payment.objects.create(bill=bill, reference="ref_1", amount=Decimal("1000"), payment_method="ONLINE")
+        self.yesterday = timezone.now() - datetime.timedelta(days=1)
+
+    def paystack_paid(self, amount, paid_at):
+        PaystackTransaction.objects.create(
+            paystack_id=1, reference="ref_1", status="success", amount=amount, currency="NGN",
+            created_at=paid_at, paid_at=paid_at, raw={},
+        )
+
+    def events(self):
+        return timeline.patient_events(Patient.objects.for_clinic(self.clinic), self.patient.id)
+
+    def test_settles_at_paystacks_time(self):
+        self.paystack_paid(100000, self.yesterday)
+        self.assertEqual(mirror.settle(), ([self.payment.id], []))
+        payment = Payment.objects.get(pk=self.payment.pk)
+        self.assertEqual((payment.status, payment.paid_at), ("success", self.yesterday))
+        self.assertTrue(payment.bill.is_paid)
+
+    def test_different_amount_is_reported_not_settled(self):
+        self.paystack_paid(50000, self.yesterday)
+        self.assertEqual(mirror.settle(), ([], [(self.payment.id, "ref_1", Decimal("1000.00"), 50000)]))
+        self.assertEqual(Payment.objects.get(pk=self.payment.pk).status, "pending")
+
+    def test_payment_for_a_closed_day_is_filed_under_today(self):
+        self.paystack_paid(100000, self.yesterday)
+        services.close_day(self.clinic, day=timezone.localdate(self.yesterday))
+        self.assertEqual(len(self.events()), 0)  # cached
+        with self.captureOnCommitCallbacks(execute=True):
+            mirror.settle(["ref_1"])
+        self.assertEqual(timezone.localdate(Payment.objects.get(pk=self.payment.pk).paid_at), timezone.localdate())
+        today = timezone.localdate()
+        self.assertEqual(
+            [(row["day"], row["amount"]) for row in revenue.summary(self.clinic, today, today)],
+            [(today, Decimal("1000.00"))],
+        )
+        self.assertEqual([event["kind"] for event in self.events()], ["payment"])
+
+
+class SettleBillsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.patient = make_patient(make_clinic())
+        self.clinic = self.patient.clinic
+        self.bill = Bill.objects.create(clinic=self.clinic, patient=self.patient)
+        services.add_items(self.bill, [BillItem(description="Fee", quantity=1, unit_price=Decimal("1000"))])
+
+    def events(self):
+        return timeline.patient_events(Patient.objects.for_clinic(self.clinic), self.patient.id)
+
+    def test_settles_unpaid_bills_once(self):
+        self.assertEqual(len(self.events()), 0)  # cached
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(len(services.settle_bills(Bill.objects.all())), 1)
+        self.assertTrue(Bill.objects.get(pk=self.bill.pk).is_paid)
+        self.assertEqual([event["kind"] for event in self.events()], ["payment"])
+        self.assertEqual(services.settle_bills(Bill.objects.all()), [])
+
+    def test_closed_day_is_refused(self):
+        closeout = services.close_day(self.clinic)
+        self.assertEqual(closeout.payment_count, 0)
+        with self.assertRaises(ValueError):
+            services.close_day(self.clinic)
+        with self.assertRaises(ValueError):
+            services.settle_bills(Bill.objects.all())
+        self.assertFalse(Payment.objects.exists())
+
+
+class DayViewTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.patient = make_patient(make_clinic())
+        self.clinic = self.patient.clinic
+        self.clinic.staff.add(self.clinic.created_by)
+        self.bill = Bill.objects.create(clinic=self.clinic, patient=self.patient)
+        services.add_items(self.bill, [BillItem(description="Fee", quantity=1, unit_price=Decimal("1000"))])
+
+    def settle(self):
+        return self.client.post(reverse("settle_bills"), {"bill_ids": [self.bill.id]}, content_type="application/json")
+
+    def test_need_a_login(self):
+        self.assertEqual(self.settle().status_code, 302)
+        self.assertEqual(self.client.post(reverse("close_day")).status_code, 302)
+        self.assertFalse(Payment.objects.exists() or DayCloseout.objects.exists())
+
+    def test_user_without_a_clinic_gets_404(self):
+        self.client.force_login(User.objects.create_user(username="drifter", password="x"))
+        self.assertEqual(self.settle().status_code, 404)
+        self.assertEqual(self.client.get(reverse("close_day")).status_code, 404)
+        self.assertEqual(self.client.post(reverse("close_day")).status_code, 404)
+
+    def test_transactions_page_without_a_clinic_is_empty(self):
+        self.client.force_login(User.objects.create_user(username="drifter", password="x"))
+        response = self.client.get(reverse("transactions_view"))
+        self.assertEqual((response.status_code, response.context["transactions"]), (200, []))
+
+    def test_settle_then_close_the_day(self):
+        self.client.force_login(self.clinic.created_by)
+        self.assertEqual(self.settle().json()["settled"], [self.bill.id])
+        response = self.client.post(reverse("close_day"))
+        closeout = DayCloseout.objects.get(clinic=self.clinic)
+        self.assertRedirects(response, reverse("closeout_receipt", args=[closeout.pk]), fetch_redirect_response=False)
+        self.assertEqual((closeout.payment_count, closeout.total_amount, closeout.closed_by), (1, Decimal("1000.00"), self.clinic.created_by))
+
+
+class InboxTests(TestCase):
+    def setUp(self):
+        patient = make_patient(make_clinic())
+        bill = Bill.objects.create(clinic=patient.clinic, patient=patient)
+        self.payment = Payment.objects.create(bill=bill, reference="ref_1", amount=Decimal("1000"), payment_method="ONLINE")
+        paid_at = timezone.now().isoformat()
+        self.body = json.dumps({"event": "charge.success", "data": {
+            "id": 1, "reference": "ref_1", "status": "success", "amount": 100000, "currency": "NGN",
+            "created_at": paid_at, "paid_at": paid_at,
+        }}).encode()
+
+    def test_redelivered_event_is_stored_once(self):
+        inbox.receive(self.body)
+        inbox.receive(self.body)
+        self.assertEqual(PaystackEvent.objects.count(), 1)
+
+    def test_charge_event_settles_its_payment(self):
+        inbox.receive(self.body)
+        self.assertEqual(inbox.process_once(), 1)
+        self.assertEqual(PaystackEvent.objects.get().status, "applied")
+        self.assertEqual(Payment.objects.get(pk=self.payment.pk).status, "success")
+        self.assertEqual(inbox.process_once(), 0)
+
+    def test_body_that_is_not_an_object_is_refused(self):
+        with self.assertRaises(ValueError):
+            inbox.receive(b"[]")
+
+
+@mock.patch.object(paystack, "BACKOFF_BASE", 0)
+class PaystackClientTests(SimpleTestCase):
+    def request(self, *responses, method="GET"):
+        """Runs one client call against `responses`, served in turn. Returns (result, requests made)."""
+        responses, seen = list(responses), []
+
+        def handler(request):
+            seen.append(request)
+            return responses.pop(0)
+
+        async def call():
+            client = paystack.PaystackClient("https://paystack.test", "sk_test", retries=2)
+            client._http = httpx.AsyncClient(base_url=client.base_url, transport=httpx.MockTransport(handler))
+            try:
+                return await client.request(method, "/transaction/verify/ref_1")
+            finally:
+                await client.close()
+
+        return asyncio.run(call()), len(seen)
+
+    def test_transient_failures_are_retried(self):
+        body = {"status": True, "data": {"reference": "ref_1"}}
+        result, requests = self.request(httpx.Response(503), httpx.Response(429), httpx.Response(200, json=body))
+        self.assertEqual((result, requests), (body, 3))
+
+    def test_non_json_body_is_a_paystack_error(self):
+        for response in (httpx.Response(200, text="<html>Bad gateway</html>"), httpx.Response(404, text="")):
+            with self.assertRaises(paystack.PaystackError):
+                self.request(response)
+
+    def test_gives_up_after_the_retries(self):
+        with self.assertRaisesMessage(paystack.PaystackError, "HTTP 502"):
+            self.request(*[httpx.Response(502, text="<html>Bad gateway</html>")] * 3)
+
+    def test_post_is_not_resent_after_a_server_error(self):
+        with self.assertRaises(paystack.PaystackError):
+            self.request(httpx.Response(500), method="POST")
@@ -9,10 +9,15 @@ urlpatterns = [
     path("<int:pk>/", views.bill_detail, name="bill_detail"),
     path("edit/<int:pk>/", views.bill_edit, name="bill_edit"),
     path("<int:pk>/mark-paid/", views.mark_bill_paid, name="mark_bill_paid"),
+    path("settle/", views.settle_bills, name="settle_bills"),
+    path("close-day/", views.close_day, name="close_day"),
+    path("closeouts/<int:pk>/", views.closeout_receipt, name="closeout_receipt"),
     path("<int:pk>/print/", views.print_receipt, name="print_receipt"),
     path("revenue/", views.revenue_report, name="revenue_report"),
+    path("revenue/export/", views.revenue_export, name="revenue_export"),
     path("initiate/<int:bill_id>/", views.initiate_payment, name="initiate_payment"),
     path("paystack/callback/", views.paystack_webhook, name="paystack_webhook"),
+    path("paystack/webhook/", views.paystack_event, name="paystack_event"),
     path("transactions/", views.transactions_view, name="transactions_view"),
 
 ]
@@ -1,33 +1,26 @@
 import json
 from decimal import Decimal
-from django.conf import settings
 from django.utils import timezone
-from django.http import JsonResponse, HttpResponseRedirect
+from django.core.paginator import Paginator
+from django.http import Http404, HttpResponse, JsonResponse, HttpResponseBadRequest, HttpResponseRedirect, StreamingHttpResponse
 from django.shortcuts import render, get_object_or_404
-from django.db.models import Sum
 from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.urls import reverse
 from django.shortcuts import redirect
-import requests
-from django.utils.timezone import now
-from .utils import get_last_n_subaccount_transactions, get_transaction_by_reference
-from .models import Bill, Payment
+from django.utils.dateparse import parse_date
+from .utils import get_transaction_by_reference
+from patient.models import consultation_notes
+from . import inbox, mirror, paystack, revenue, services
+from .models import Bill, DayCloseout, Payment, PaystackTransaction
 from .forms import BillEditForm
 
-PAYSTACK_SECRET_KEY = settings.PAYSTACK_SECRET_KEY
-PAYSTACK_BASE_URL = "https://api.paystack.co"
-
 
 
 def billing_dashboard(request):
-    today = now().date()
-    bills = Bill.objects.filter(is_paid=False)
-    last_3_bills = Bill.objects.filter(is_paid=True).order_by('-created_at')[:3]
-
-    # Calculate total revenue for these last 3 bills
-    total_revenue_last_3 = last_3_bills.aggregate(total=Sum("total_amount"))["total"] or 0
-
+    bills = Bill.objects.for_clinic(request.clinic).filter(is_paid=False)
     return render(
         request,                
         "billing/dashboard.html",
@@ -36,7 +29,7 @@ def billing_dashboard(request):
 
 
 def billing_list(request):
-    bills = Bill.objects.select_related("patient", "consultation").order_by("-created_at")
+    bills = Bill.objects.for_clinic(request.clinic).select_related("patient", "consultation").defer(*consultation_notes("consultation__")).order_by("-created_at")
     unpaid_bills = bills.filter(is_paid=False)
     return render(request, "billing/billing_list.html", {"bills": bills, "unpaid_bills": unpaid_bills})
 
@@ -57,7 +50,8 @@ def bill_edit(request, pk):
     if request.method == "POST":
         form = BillEditForm(request.POST, instance=bill)
         if form.is_valid():
-            form.save()
+            # The total follows the items: record the change as an adjustment line
+            services.adjust_total(bill, form.cleaned_data["total_amount"], description="Manual adjustment")
             messages.success(request, f"Bill #{bill.id} updated successfully.")
             return redirect("billing_dashboard")
         else:
@@ -80,44 +74,157 @@ def print_receipt(request, pk):
 
 def mark_bill_paid(request, pk):
     bill = get_object_or_404(Bill, pk=pk)
+    user = request.user if request.user.is_authenticated else None
 
     # Record manual payment
-    Payment.objects.create(
-        bill=bill,
-        amount=bill.total_amount,
-        payment_method="CASH", # options 
-    )
-
-    bill.is_paid = True
-    bill.save()
+    try:
+        services.settle_bills(Bill.objects.filter(pk=bill.pk), user=user)
+    except ValueError as e:
+        messages.error(request, str(e))
+        return redirect("billing_dashboard")
 
     messages.success(request, f"Bill #{bill.id} marked as paid.")
     # Redirect to print the receipt
     return redirect("print_receipt", pk=bill.id)
 
 
-def revenue_report(request):
-    start_date = request.GET.get("start")
-    end_date = request.GET.get("end")
-    payments = Payment.objects.filter(status__in=["success", "manual"])
+@login_required
+@require_POST
+def settle_bills(request):
+    """
+    Takes cash for several bills at once: the dashboard form's bill_ids, or
+    a JSON body {"bill_ids": [...], "payment_method": "CASH"}, answered in JSON.
+    """
+    as_json = request.content_type == "application/json"
+    if as_json:
+        try:
+            data = json.loads(request.body)
+            bill_ids = [int(bill_id) for bill_id in data.get("bill_ids", [])]
+        except (ValueError, TypeError, AttributeError):
+            return JsonResponse({"error": "Expected {\"bill_ids\": [...]}"}, status=400)
+        payment_method = data.get("payment_method") or "CASH"
+    else:
+        bill_ids = [int(bill_id) for bill_id in request.POST.getlist("bill_ids") if bill_id.isdigit()]
+        payment_method = request.POST.get("payment_method") or "CASH"
+    if request.clinic is None:
+        raise Http404("No clinic")
+
+    try:
+        payments = services.settle_bills(
+            Bill.objects.for_clinic(request.clinic).filter(id__in=bill_ids), user=request.user, payment_method=payment_method,
+        )
+    except ValueError as e:
+        if as_json:
+            return JsonResponse({"error": str(e)}, status=409)
+        messages.error(request, str(e))
+        return redirect("billing_dashboard")
+
+    total = sum((payment.amount for payment in payments), Decimal("0.00"))
+    if as_json:
+        return JsonResponse({
+            "settled": [payment.bill_id for payment in payments],
+            "skipped": sorted(set(bill_ids) - {payment.bill_id for payment in payments}),
+            "total": str(total),
+        })
+    messages.success(request, f"{len(payments)} bill(s) marked as paid, {total} taken.")
+    return redirect("billing_dashboard")
 
-    if start_date and end_date:
-        payments = payments.filter(paid_at__range=[start_date, end_date])
 
-    total_revenue = payments.aggregate(Sum("amount"))["amount__sum"] or Decimal("0.00")
+@login_required
+def close_day(request):
+    if request.clinic is None:
+        raise Http404("No clinic")
+    today = timezone.localdate()
+    closeout = DayCloseout.objects.for_clinic(request.clinic).filter(day=today).first()
+    if closeout is not None:
+        return redirect("closeout_receipt", pk=closeout.pk)
+    if request.method == "POST":
+        try:
+            closeout = services.close_day(request.clinic, user=request.user)
+        except ValueError as e:
+            messages.error(request, str(e))
+            return redirect("billing_dashboard")
+        messages.success(request, f"{today} closed out.")
+        return redirect("closeout_receipt", pk=closeout.pk)
+
+    rows = revenue.summary(request.clinic, today, today)
+    return render(request, "billing/close_day.html", {
+        "day": today,
+        "rows": rows,
+        "total": sum((row["amount"] for row in rows), Decimal("0.00")),
+        "unpaid": Bill.objects.for_clinic(request.clinic).filter(is_paid=False).count(),
+    })
+
+
+def closeout_receipt(request, pk):
+    closeout = get_object_or_404(DayCloseout.objects.for_clinic(request.clinic).select_related("clinic", "closed_by"), pk=pk)
+    return render(request, "billing/closeout_receipt.html", {"closeout": closeout})
+
+
+def _report_range(request):
+    """The (start, end) days of a revenue report; None for an open end."""
+    days = []
+    for name in ("start", "end"):
+        try:
+            days.append(parse_date(request.GET.get(name) or ""))
+        except ValueError:
+            days.append(None)
+    return days
+
+
+def revenue_report(request):
+    first_day, last_day = _report_range(request)
+    rows = revenue.summary(request.clinic, first_day, last_day)
+
+    # Totals per day (with its rows by method) and per method over the range
+    days, methods = {}, {}
+    for row in rows:
+        day = days.setdefault(row["day"], {"day": row["day"], "methods": [], "payments": 0, "amount": Decimal("0.00")})
+        method = methods.setdefault(row["payment_method"], {"payment_method": row["payment_method"], "payments": 0, "amount": Decimal("0.00")})
+        for total in (day, method):
+            total["payments"] += row["payments"]
+            total["amount"] += row["amount"]
+        day["methods"].append(row)
+
+    total_revenue = sum((method["amount"] for method in methods.values()), Decimal("0.00"))
     tithe = total_revenue * Decimal("0.10")
+    today = timezone.localdate()
+    todays_payments = []
+    if (first_day is None or first_day <= today) and (last_day is None or last_day >= today):
+        todays_payments = revenue.payments(request.clinic, today, today).only(
+            "reference", "bill_id", "amount", "status", "payment_method", "paid_at"
+        )
     return render(request, "billing/revenue_report.html", {
-        "payments": payments,
+        "days": Paginator(list(days.values()), 31).get_page(request.GET.get("page")),
+        "methods": sorted(methods.values(), key=lambda method: -method["amount"]),
+        "todays_payments": todays_payments,
         "total_revenue": total_revenue,
         "tithe": tithe,
-        "start_date": start_date,
-        "end_date": end_date,
+        "start_date": request.GET.get("start", ""),
+        "end_date": request.GET.get("end", ""),
+        "parquet": revenue.parquet_available(),
     })
 
 
+def revenue_export(request):
+    """Streams the report's payments as ?format=csv (the default) or parquet."""
+    first_day, last_day = _report_range(request)
+    payments = revenue.payments(request.clinic, first_day, last_day)
+    filename = f"revenue_{first_day or 'start'}_{last_day or timezone.localdate()}"
+    if request.GET.get("format") == "parquet":
+        if not revenue.parquet_available():
+            return HttpResponseBadRequest("Parquet export needs pyarrow installed.")
+        response = StreamingHttpResponse(revenue.parquet_stream(payments), content_type="application/vnd.apache.parquet")
+        filename += ".parquet"
+    else:
+        response = StreamingHttpResponse(revenue.csv_stream(payments), content_type="text/csv")
+        filename += ".csv"
+    response["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return response
+
+
 def initiate_payment(request, bill_id):
     bill = get_object_or_404(Bill, pk=bill_id)
-    headers = {"Authorization": f"Bearer {PAYSTACK_SECRET_KEY}"}
     data = {
         "email": bill.patient.email,
         "amount": int(bill.total_amount * 100),
@@ -127,8 +234,12 @@ def initiate_payment(request, bill_id):
     if bill.clinic.paystack_subaccount_id:
         data["subaccount"] = bill.clinic.paystack_subaccount_id
 
-    response = requests.post(f"{PAYSTACK_BASE_URL}/transaction/initialize", headers=headers, json=data)
-    res_data = response.json()
+    try:
+        res_data = paystack.initialize(data)
+    except paystack.PaystackError as e:
+        print("Paystack initialize failed:", e)
+        messages.error(request, "Could not reach Paystack. Please try again.")
+        return redirect("billing_dashboard")
     if res_data["status"]:
         Payment.objects.create(
             bill=bill,
@@ -142,40 +253,53 @@ def initiate_payment(request, bill_id):
 
 @csrf_exempt
 def paystack_webhook(request):
-    # import pdb; pdb.set_trace()
+    # Paystack's redirect back after checkout (the callback_url)
     reference_id = request.GET.get("trxref")
-    txn = get_transaction_by_reference(reference_id)
-
-    if txn and txn['status'] == 'success':
+    # The webhook has usually mirrored the charge already; only ask Paystack if not
+    if reference_id and not PaystackTransaction.objects.filter(reference=reference_id, status="success").exists():
         try:
-            payment = Payment.objects.get(reference=reference_id)
-            payment.status = "success"
-            payment.paid_at = timezone.now()
-            payment.save()
-            payment.bill.is_paid = True
-            payment.bill.save()
-        except Payment.DoesNotExist:
-            pass
+            txn = get_transaction_by_reference(reference_id)
+        except paystack.PaystackError as e:
+            print(f"Paystack verify failed for {reference_id}:", e)
+            messages.error(request, "Could not confirm the payment with Paystack yet.")
+            return redirect("billing_dashboard")
+        if txn:
+            mirror.store([txn])
+    if reference_id:
+        mirror.settle([reference_id])
     return redirect("billing_dashboard")
 
 
+@csrf_exempt
+@require_POST
+def paystack_event(request):
+    """Paystack's webhook: verified and queued for process_paystack_events, then acknowledged."""
+    if not paystack.valid_signature(request.body, request.headers.get("X-Paystack-Signature")):
+        return HttpResponseBadRequest("Bad signature")
+    try:
+        inbox.receive(request.body)
+    except ValueError:
+        return HttpResponseBadRequest("Bad JSON")
+    return HttpResponse(status=200)
+
 
 def transactions_view(request):
-    clinic_subaccount_code = request.user.clinics.last().paystack_subaccount_id  # replace with your clinic object if dynamic
-    transactions = get_last_n_subaccount_transactions(clinic_subaccount_code, n=6)
+    clinic_subaccount_code = request.clinic.paystack_subaccount_id if request.clinic is not None else None
+    # Read from the local mirror, kept current by `manage.py sync_paystack` and the webhook
+    transactions = mirror.recent(clinic_subaccount_code, n=6) if clinic_subaccount_code else []
 
     # Format transactions for the template
     formatted_txns = []
     for tx in transactions:
         formatted_txns.append({
-            "reference": tx["reference"],
-            "status": tx["status"].capitalize(),
-            "amount": tx["amount"] / 100,  # Paystack amounts are in the smallest currency unit
-            "currency": tx["currency"],
-            "paid_at": tx.get("paid_at") or tx.get("paidAt"),
-            "gateway": tx.get("gateway_response") or "-",
-            "customer_name": f"{tx['customer']['first_name']} {tx['customer']['last_name']}" if tx.get("customer") else "-",
-            "channel": tx.get("channel"),
+            "reference": tx.reference,
+            "status": tx.status.capitalize(),
+            "amount": tx.amount / 100,  # Paystack amounts are in the smallest currency unit
+            "currency": tx.currency,
+            "paid_at": tx.paid_at,
+            "gateway": tx.gateway_response or "-",
+            "customer_name": tx.customer_name or "-",
+            "channel": tx.channel,
         })
 
     return render(request, "billing/transactions.html", {"transactions": formatted_txns})
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class ClinicmanagerConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'clinicmanager'
+
+    def ready(self):
+        import clinicmanager.signals
@@ -0,0 +1,16 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from .models import Clinic
+from . import tenancy
+
+
+@receiver(post_save, sender=Clinic)
+@receiver(post_delete, sender=Clinic)
+def expire_cached_clinic(sender, instance, **kwargs):
+    tenancy.clinic_changed(instance.pk)
+
+
+@receiver(m2m_changed, sender=Clinic.staff.through)
+def expire_active_clinics(sender, action, **kwargs):
+    if action in ("post_add", "post_remove", "post_clear"):
+        tenancy.memberships_changed()
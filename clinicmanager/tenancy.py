@@ -0,0 +1,107 @@
+"""
+Multi-clinic (tenant) scoping.
+
+ActiveClinicMiddleware sets request.clinic, the clinic the signed-in user
+works in. It is the last clinic they are staff of, as
+`request.user.clinics.last()` used to be. The clinic id is resolved once
+and kept in the session. The Clinic row is kept in the cache, so a request
+costs one cache read rather than an M2M query. A change to clinic
+membership bumps a generation number, which makes every session resolve
+its clinic again.
+
+Models owned by a clinic use ClinicManager, so views filter with
+`Model.objects.for_clinic(request.clinic)`. Models that reach their clinic
+through a relation name it in `clinic_lookup`, e.g. "patient__clinic".
+"""
+import time
+
+from django.core.cache import cache
+from django.db import models
+
+SESSION_KEY = "_active_clinic"
+GENERATION_KEY = "tenancy:generation"
+CLINIC_TTL = 60 * 60
+
+
+def _clinic_key(clinic_id):
+    return f"tenancy:clinic:{clinic_id}"
+
+
+def user_clinic(user):
+    """The clinic `user` works in, straight from the database."""
+    if not user.is_authenticated:
+        return None
+    return user.clinics.order_by("id").last()
+
+
+def get_clinic(clinic_id):
+    from .models import Clinic
+
+    if clinic_id is None:
+        return None
+    clinic = cache.get(_clinic_key(clinic_id))
+    if clinic is None:
+        clinic = Clinic.objects.filter(pk=clinic_id).first()
+        if clinic is not None:
+            cache.set(_clinic_key(clinic_id), clinic, CLINIC_TTL)
+    return clinic
+
+
+def active_clinic(request):
+    """
+    The request user's clinic, through the session and the cache.
+    Falls back to user_clinic() when the session entry is missing, belongs
+    to another user or predates a membership change.
+    """
+    user = request.user
+    if not user.is_authenticated:
+        return None
+    cache.add(GENERATION_KEY, time.time_ns(), None)
+    stored = request.session.get(SESSION_KEY)
+    if stored:
+        user_id, clinic_id, generation = stored
+        cached = cache.get_many([GENERATION_KEY, _clinic_key(clinic_id)])
+        if user_id == user.pk and generation == cached.get(GENERATION_KEY):
+            return cached.get(_clinic_key(clinic_id)) or get_clinic(clinic_id)
+
+    generation = cache.get(GENERATION_KEY)
+    clinic = user_clinic(user)
+    request.session[SESSION_KEY] = [user.pk, clinic.pk if clinic else None, generation]
+    if clinic is not None:
+        cache.set(_clinic_key(clinic.pk), clinic, CLINIC_TTL)
+    return clinic
+
+
+def clinic_changed(clinic_id):
+    """Drops the cached Clinic row. Called when a clinic is saved or deleted."""
+    cache.delete(_clinic_key(clinic_id))
+
+
+def memberships_changed():
+    """Makes every session look its clinic up again. Called when clinic staff change."""
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        cache.add(GENERATION_KEY, time.time_ns(), None)
+
+
+class ActiveClinicMiddleware:
+    """Sets request.clinic (None for anonymous users or users without a clinic)."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.clinic = active_clinic(request)
+        return self.get_response(request)
+
+
+class ClinicQuerySet(models.QuerySet):
+    def for_clinic(self, clinic):
+        """Rows belonging to `clinic` (a Clinic or id); none at all for None."""
+        if clinic is None:
+            return self.none()
+        return self.filter(**{getattr(self.model, "clinic_lookup", "clinic"): clinic})
+
+
+ClinicManager = models.Manager.from_queryset(ClinicQuerySet)
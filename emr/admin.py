@@ -1,14 +1,29 @@
 from django.contrib import admin
-from .models import LabResult, LabTest, Lab, LabQueue
+from .models import LabResult, LabTest, LabPanel, LabReferenceRange, Lab, LabQueue
 # Register your models here.
 
 
 
+class LabReferenceRangeInline(admin.TabularInline):
+    model = LabReferenceRange
+    extra = 0
+
+
 @admin.register(LabTest)
 class LabTestAdmin(admin.ModelAdmin):
-    list_display = ("id", "name", "unit", "price", )
+    list_display = ("id", "name", "unit", "normal_min", "normal_max", "price", )
+    inlines = [LabReferenceRangeInline]
     list_filter = ("created_at",)
     search_fields = ("name",)
+
+
+@admin.register(LabPanel)
+class LabPanelAdmin(admin.ModelAdmin):
+    list_display = ("id", "name", "price", "is_active")
+    search_fields = ("name",)
+    filter_horizontal = ("tests",)
+    readonly_fields = ("price", "reference_ranges")
+
 admin.site.register(LabResult)
 admin.site.register(Lab)
 admin.site.register(LabQueue)
\ No newline at end of file
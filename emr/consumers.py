@@ -1,17 +1,52 @@
 from channels.generic.websocket import AsyncWebsocketConsumer
+from channels.db import database_sync_to_async
+from urllib.parse import parse_qs
 import json
 
+from clinicmanager import tenancy
+from patient import live_queue
+
+
 class LabQueueConsumer(AsyncWebsocketConsumer):
     async def connect(self):
-        self.group_name = "lab_notifications"
+        subscription = await self.get_subscription()
+        if subscription is None:
+            await self.close()
+            return
+        self.group_name, snapshot = subscription
         await self.channel_layer.group_add(self.group_name, self.channel_name)
         print("WebSocket connection established.")
         await self.accept()
+        # Current counts up front; deltas follow as queue_state events
+        await self.send(text_data=json.dumps(snapshot))
 
     async def disconnect(self, close_code):
-        await self.channel_layer.group_discard(self.group_name, self.channel_name)
+        if getattr(self, "group_name", None):
+            await self.channel_layer.group_discard(self.group_name, self.channel_name)
 
     async def send_lab_notification(self, event):
         message = event['message']
         print(f"Sending lab notification: {message}")
         await self.send(text_data=json.dumps({'message': message}))
+
+    async def queue_state(self, event):
+        await self.send(text_data=json.dumps(event))
+
+    @database_sync_to_async
+    def get_subscription(self):
+        """
+        Clinic-wide group by default, or one lab's group within the clinic
+        with ?lab=<id>. Labs are shared, so that group carries only this
+        clinic's rows for the lab.
+        """
+        from .models import Lab, LabQueue
+        user = self.scope.get("user")
+        clinic = tenancy.user_clinic(user) if user else None
+        if clinic is None:
+            return None
+        scopes = [f"clinic:{clinic.id}"]
+        lab_id = parse_qs(self.scope["query_string"].decode()).get("lab", [""])[0]
+        if lab_id.isdigit() and Lab.objects.filter(id=lab_id).exists():
+            scopes.append(live_queue.owner_scope(LabQueue, clinic.id, int(lab_id)))
+        snapshot = {"type": "queue_state", "table": "emr.labqueue", **live_queue.snapshot(LabQueue, scopes)}
+        return live_queue.group_name(LabQueue, scopes[-1]), snapshot
@@ -2,6 +2,7 @@ from django import forms
 from django_select2.forms import Select2Widget, ModelSelect2Widget
 from .models import LabResult, LabTest
 from patient.models import Consultation
+from patient.search import patient_q
 
 
 
@@ -17,6 +18,12 @@ class ConsultationWidget(ModelSelect2Widget):
         'patient__name__icontains',
     ]
 
+    def filter_queryset(self, request, term, queryset=None, **dependent_fields):
+        # Same name / phone / date-of-birth matching as the rest of the app
+        if queryset is None:
+            queryset = self.get_queryset()
+        return queryset.filter(patient_q(term, 'patient__'), **dependent_fields).select_related('patient')
+
 
 class LabResultForm(forms.ModelForm):
     class Meta:
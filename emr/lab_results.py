@@ -0,0 +1,286 @@
+"""
+Lab results queries shared by the lab dashboards.
+
+Filters are parsed once from the request. Pages are fetched with keyset
+(seek) pagination on (date, id) instead of OFFSET, so deep pages cost the
+same as the first one. Summary pages seek the same way through the
+results, and only the consultations found on the page are aggregated. The
+per-consultation summaries are cached for SUMMARY_TTL seconds. Any LabResult write bumps a generation number (see
+emr.signals), which retires every cached summary page at once.
+"""
+import base64
+import hashlib
+import time
+from datetime import datetime, timedelta
+
+from django.core.cache import cache
+from django.db.models import Count, Max, Q
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from patient.models import consultation_notes
+from patient.search import patient_q
+
+from .models import ABNORMAL_FLAGS, ACTIVE_LAB_QUEUE_STATUSES, LabQueue, LabResult
+
+PAGE_SIZE = 10
+SCAN_CHUNK = 200  # results read per step while looking for a summary page's consultations
+SUMMARY_TTL = 60
+GENERATION_KEY = "lab-results:generation"
+
+
+def parse_filters(params):
+    """Reads the dashboard filters from a QueryDict (request.GET)."""
+    def date(name):
+        try:
+            return parse_date(params.get(name, "").strip())
+        except ValueError:  # well formed but impossible, e.g. 2024-13-45: no filter
+            return None
+
+    return {
+        "search": params.get("search", "").strip(),
+        "patient": params.get("patient", "").strip(),
+        "lab_test": params.get("lab_test", "").strip(),
+        "result_date": date("result_date"),
+        "result_date_from": date("result_date_from"),
+        "result_date_to": date("result_date_to"),
+        "abnormal": bool(params.get("abnormal")),
+    }
+
+
+def filter_results(filters, clinic):
+    """The clinic's LabResults matching the parsed filters."""
+    q = Q()
+    if filters["search"]:
+        q &= patient_q(filters["search"], "consultation__patient__")
+    if filters["patient"]:
+        q &= patient_q(filters["patient"], "consultation__patient__")
+    if filters["lab_test"]:
+        q &= Q(lab_test__name__icontains=filters["lab_test"])
+    # Day bounds as datetimes rather than __date, so the result_date index stays usable
+    date_from = filters["result_date"] or filters["result_date_from"]
+    date_to = filters["result_date"] or filters["result_date_to"]
+    if date_from:
+        q &= Q(result_date__gte=_day_start(date_from))
+    if date_to:
+        q &= Q(result_date__lt=_day_start(date_to + timedelta(days=1)))
+    if filters["abnormal"]:
+        q &= Q(flag__in=ABNORMAL_FLAGS)
+    return LabResult.objects.for_clinic(clinic).filter(q)
+
+
+def _day_start(day):
+    return timezone.make_aware(datetime.combine(day, datetime.min.time()))
+
+
+class KeysetPage:
+    """One page of rows plus the cursors to the pages either side."""
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next or self.has_previous
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+def encode_cursor(moment, pk):
+    return base64.urlsafe_b64encode(f"{moment.isoformat()}|{pk}".encode()).decode()
+
+
+def decode_cursor(cursor):
+    """(datetime, id) from a cursor, or None if it is missing or malformed."""
+    if not cursor:
+        return None
+    try:
+        moment, pk = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(moment), int(pk)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+def keyset_page(queryset, *, date_field, id_field, key, after=None, before=None, size=PAGE_SIZE):
+    """
+    Newest-first page of `queryset` ordered by (date_field, id_field).
+    `after` / `before` are cursors from a previous page's next/previous links;
+    `key(row)` returns a row's (date, id).
+    """
+    after, before = decode_cursor(after), decode_cursor(before)
+    if before:
+        moment, pk = before
+        rows = list(
+            queryset.filter(**{f"{date_field}__gte": moment})
+            .filter(Q(**{f"{date_field}__gt": moment}) | Q(**{f"{id_field}__gt": pk}))
+            .order_by(date_field, id_field)[:size + 1]
+        )
+        has_previous, has_next = len(rows) > size, True
+        rows = rows[:size][::-1]
+    else:
+        if after:
+            moment, pk = after
+            # The plain range condition lets the planner seek the (date, id) index
+            queryset = queryset.filter(**{f"{date_field}__lte": moment}).filter(
+                Q(**{f"{date_field}__lt": moment}) | Q(**{f"{id_field}__lt": pk})
+            )
+        rows = list(queryset.order_by(f"-{date_field}", f"-{id_field}")[:size + 1])
+        has_previous, has_next = after is not None, len(rows) > size
+        rows = rows[:size]
+    if not rows:
+        return KeysetPage([])
+    return KeysetPage(
+        rows,
+        next_cursor=encode_cursor(*key(rows[-1])) if has_next else None,
+        previous_cursor=encode_cursor(*key(rows[0])) if has_previous else None,
+    )
+
+
+def results_page(filters, clinic, *, after=None, before=None, size=PAGE_SIZE):
+    """A page of the clinic's individual results, newest first."""
+    queryset = filter_results(filters, clinic).select_related("consultation__patient", "lab_test")
+    return keyset_page(
+        queryset, date_field="result_date", id_field="id",
+        key=lambda row: (row.result_date, row.id), after=after, before=before, size=size,
+    )
+
+
+def _generation():
+    cache.add(GENERATION_KEY, time.time_ns(), None)
+    return cache.get(GENERATION_KEY)
+
+
+def results_changed():
+    """Retires every cached summary page. Called on LabResult writes."""
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        _generation()
+
+
+def _summaries(results, consultation_ids):
+    """{consultation_id: summary row} over every matching result of those consultations."""
+    rows = (
+        results.filter(consultation_id__in=consultation_ids)
+        .values("consultation_id", "consultation__patient__name")
+        .annotate(total_tests=Count("id"), last_test=Max("result_date"))
+    )
+    return {row["consultation_id"]: row for row in rows}
+
+
+def _summary_key(row):
+    return row["last_test"], row["consultation_id"]
+
+
+def _seek_summaries(results, cursor, *, newer, size):
+    """
+    Up to `size` consultations whose (last_test, consultation_id) comes just
+    before `cursor` (or just after it if `newer`), nearest first.
+
+    Results are read in date order starting at the cursor. A consultation
+    turns up at its own last result at the latest, so once the scan has
+    passed a date, every consultation last tested on the near side of it
+    has been seen. Only the consultations seen are aggregated.
+    """
+    moment = cursor[0] if cursor else None
+    if newer:
+        scan = results.filter(result_date__gte=moment).order_by("result_date", "id")
+    else:
+        scan = results.filter(result_date__lte=moment) if cursor else results
+        scan = scan.order_by("-result_date", "-id")
+    scan = scan.filter(consultation__isnull=False).values_list("result_date", "id", "consultation_id")
+
+    found, boundary = {}, None
+    while True:
+        if boundary:
+            date, pk = boundary
+            seek = Q(result_date__gt=date) | Q(result_date=date, id__gt=pk) if newer \
+                else Q(result_date__lt=date) | Q(result_date=date, id__lt=pk)
+            chunk = list(scan.filter(seek)[:SCAN_CHUNK])
+        else:
+            chunk = list(scan[:SCAN_CHUNK])
+        new_ids = {consultation_id for _, _, consultation_id in chunk} - found.keys()
+        if new_ids:
+            found.update(_summaries(results, new_ids))
+        exhausted = len(chunk) < SCAN_CHUNK
+        if chunk:
+            boundary = chunk[-1][:2]
+        # Candidates on the cursor's side, and of those the ones no unread result can come before
+        candidates = [
+            row for row in found.values()
+            if cursor is None or (_summary_key(row) > cursor if newer else _summary_key(row) < cursor)
+        ]
+        if not exhausted:
+            candidates = [
+                row for row in candidates
+                if (row["last_test"] < boundary[0] if newer else row["last_test"] > boundary[0])
+            ]
+        candidates.sort(key=_summary_key, reverse=not newer)
+        if exhausted or len(candidates) >= size:
+            return candidates[:size]
+
+
+def summary_page(filters, clinic, *, after=None, before=None, size=PAGE_SIZE):
+    """
+    A page of per-consultation summaries ({"consultation_id",
+    "consultation__patient__name", "total_tests", "last_test"}), most
+    recently tested first. Cached until the next LabResult write or SUMMARY_TTL.
+    """
+    signature = repr((sorted(filters.items()), getattr(clinic, "pk", clinic), after, before, size)).encode()
+    cache_key = f"lab-results:summaries:{_generation()}:{hashlib.md5(signature).hexdigest()}"
+    page = cache.get(cache_key)
+    if page is None:
+        results = filter_results(filters, clinic)
+        after, before = decode_cursor(after), decode_cursor(before)
+        if before:
+            rows = _seek_summaries(results, before, newer=True, size=size + 1)
+            has_previous, has_next = len(rows) > size, True
+            rows = rows[:size][::-1]
+        else:
+            rows = _seek_summaries(results, after, newer=False, size=size + 1)
+            has_previous, has_next = after is not None, len(rows) > size
+            rows = rows[:size]
+        page = KeysetPage(
+            rows,
+            next_cursor=encode_cursor(*_summary_key(rows[-1])) if rows and has_next else None,
+            previous_cursor=encode_cursor(*_summary_key(rows[0])) if rows and has_previous else None,
+        )
+        cache.set(cache_key, page, SUMMARY_TTL)
+    return page
+
+
+def active_lab_queue(clinic):
+    """
+    The clinic's waiting/in-progress LabQueue rows, one per patient (their
+    latest consultation's). Read through the partial active-status index and
+    de-duplicated here rather than with DISTINCT ON.
+    """
+    rows = (
+        LabQueue.objects.for_clinic(clinic).filter(status__in=ACTIVE_LAB_QUEUE_STATUSES)
+        .select_related("patient", "lab_test", "consultation")
+        .defer(*consultation_notes("consultation__"))
+        .order_by("queue_date", "queue_number")
+    )
+    latest = {}
+    for row in rows:
+        current = latest.get(row.patient_id)
+        if current is None or _consultation_date(row) > _consultation_date(current):
+            latest[row.patient_id] = row
+    return list(latest.values())
+
+
+def _consultation_date(row):
+    return row.consultation.date.timestamp() if row.consultation else float("-inf")
@@ -0,0 +1,37 @@
+# emr/management/commands/backfill_lab_values.py
+from django.core.management.base import BaseCommand
+from emr.models import LabResult
+from emr.reference_ranges import refresh_flags
+
+
+class Command(BaseCommand):
+    help = "Parse historical lab result text into patient, numeric_value and unit, then re-flag"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000)
+        parser.add_argument('--all', action='store_true',
+                            help='Reparse every row, not only rows never parsed')
+
+    def handle(self, *args, **options):
+        results = LabResult.objects.all() if options['all'] else LabResult.objects.filter(parsed=False)
+        results = results.select_related('consultation', 'lab_test').order_by('id')
+        batch_size = options['batch_size']
+
+        parsed = numeric = 0
+        last_id = 0
+        while True:
+            batch = list(results.filter(id__gt=last_id)[:batch_size])
+            if not batch:
+                break
+            for result in batch:
+                result.fill_structured_fields()
+                numeric += result.numeric_value is not None
+            LabResult.objects.bulk_update(batch, ['patient', 'numeric_value', 'unit', 'parsed'])
+            parsed += len(batch)
+            last_id = batch[-1].id
+            self.stdout.write(f'{parsed} parsed, {numeric} numeric')
+
+        flagged = refresh_flags(LabResult.objects.all(), batch_size=batch_size)
+        self.stdout.write(self.style.SUCCESS(
+            f'Parsed {parsed} lab result(s), {numeric} numeric; {flagged} flag(s) changed'
+        ))
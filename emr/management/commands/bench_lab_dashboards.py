@@ -0,0 +1,120 @@
+# emr/management/commands/bench_lab_dashboards.py
+import datetime
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.paginator import Paginator
+from django.db import connection
+from django.db.models import Count, Max
+from django.utils import timezone
+from clinicmanager.models import Clinic
+from emr import lab_results
+from emr.models import LabResult, LabTest
+from patient.models import Consultation, Patient
+
+
+class Command(BaseCommand):
+    help = "Seed lab results and compare OFFSET pagination with the keyset/cached lab results queries"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clinic', type=int, help='Clinic id (defaults to the first clinic)')
+        parser.add_argument('--results', type=int, default=500000)
+        parser.add_argument('--per-consultation', type=int, default=10)
+        parser.add_argument('--repeat', type=int, default=10)
+
+    def handle(self, *args, **options):
+        clinic = Clinic.objects.filter(id=options['clinic']).first() if options['clinic'] else Clinic.objects.first()
+        if clinic is None:
+            raise CommandError('No clinic to run against.')
+
+        patient = Patient.objects.create(
+            clinic=clinic, name='Benchmark Lab Patient', date_of_birth=datetime.date(1990, 1, 1), phone_number='0'
+        )
+        tests = [LabTest.objects.create(name=f'Benchmark test {i}', normal_min=1, normal_max=10) for i in range(5)]
+        try:
+            started = time.perf_counter()
+            consultation_ids = self._seed(patient, tests, options['results'], options['per_consultation'])
+            self.stdout.write(f'Seeded {options["results"]} results over {len(consultation_ids)} consultations '
+                              f'in {time.perf_counter() - started:.1f}s')
+            self._report(clinic, options['repeat'])
+        finally:
+            with connection.cursor() as cursor:
+                # Plain DELETE: per-row signals would load all seeded rows
+                cursor.execute(
+                    f'DELETE FROM {connection.ops.quote_name(LabResult._meta.db_table)} WHERE patient_id = %s',
+                    [patient.id],
+                )
+            Consultation.objects.filter(patient=patient).delete()
+            LabTest.objects.filter(id__in=[t.id for t in tests]).delete()
+            patient.delete()
+            lab_results.results_changed()
+
+    def _seed(self, patient, tests, total, per_consultation, batch_size=10000):
+        now = timezone.now()
+        consultations = Consultation.objects.bulk_create([
+            Consultation(patient=patient, doctor=patient.doctor, date=now - datetime.timedelta(hours=i),
+                         chief_complaints='benchmark')
+            for i in range(-(-total // per_consultation))
+        ])
+        for offset in range(0, total, batch_size):
+            LabResult.objects.bulk_create([
+                LabResult(
+                    lab_test=tests[i % len(tests)],
+                    consultation=consultations[i // per_consultation],
+                    patient=patient,
+                    result_value=str(value),
+                    numeric_value=value,
+                    parsed=True,
+                    flag='H' if value > 10 else 'N',
+                    result_date=now - datetime.timedelta(hours=i // per_consultation, seconds=i % per_consultation),
+                )
+                for i in range(offset, min(offset + batch_size, total))
+                for value in [round(random.uniform(1, 12), 1)]
+            ])
+        return [c.id for c in consultations]
+
+    def _time(self, query, repeat):
+        samples = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            query()
+            samples.append((time.perf_counter() - started) * 1000)
+        return statistics.median(samples)
+
+    def _report(self, clinic, repeat):
+        filters = lab_results.parse_filters({})
+        ordered = LabResult.objects.select_related('consultation__patient', 'lab_test').order_by('-result_date', '-id')
+        summaries = (
+            LabResult.objects.filter(consultation__isnull=False)
+            .values('consultation_id', 'consultation__patient__name')
+            .annotate(total_tests=Count('id'), last_test=Max('result_date'))
+            .order_by('-last_test', '-consultation_id')
+        )
+        results_paginator = Paginator(ordered, lab_results.PAGE_SIZE)
+        summary_paginator = Paginator(summaries, lab_results.PAGE_SIZE)
+        deep_result = results_paginator.num_pages * 9 // 10 or 1
+        deep_summary = summary_paginator.num_pages * 9 // 10 or 1
+
+        # Cursors pointing at the same deep pages, found once outside the timings
+        row = ordered.values('result_date', 'id')[(deep_result - 1) * lab_results.PAGE_SIZE - 1] if deep_result > 1 else None
+        result_cursor = lab_results.encode_cursor(row['result_date'], row['id']) if row else None
+        row = summaries[(deep_summary - 1) * lab_results.PAGE_SIZE - 1] if deep_summary > 1 else None
+        summary_cursor = lab_results.encode_cursor(row['last_test'], row['consultation_id']) if row else None
+
+        def cold_summary():
+            lab_results.results_changed()
+            lab_results.summary_page(filters, clinic, after=summary_cursor)
+
+        timings = {
+            f'results OFFSET page {deep_result}': lambda: list(results_paginator.get_page(deep_result)),
+            f'results keyset page {deep_result}': lambda: lab_results.results_page(filters, clinic, after=result_cursor),
+            f'summaries OFFSET page {deep_summary}': lambda: list(summary_paginator.get_page(deep_summary)),
+            f'summaries keyset page {deep_summary} (cold)': cold_summary,
+            f'summaries keyset page {deep_summary} (cached)': lambda: lab_results.summary_page(filters, clinic, after=summary_cursor),
+            'active lab queue': lambda: lab_results.active_lab_queue(clinic),
+        }
+        lab_results.summary_page(filters, clinic, after=summary_cursor)  # warm the cache for the cached timing
+        for name, query in timings.items():
+            self.stdout.write(f'{name:<40} {self._time(query, repeat):8.2f}ms')
@@ -0,0 +1,19 @@
+# emr/management/commands/flag_lab_results.py
+from django.core.management.base import BaseCommand
+from emr.models import LabResult
+from emr.reference_ranges import refresh_flags
+
+
+class Command(BaseCommand):
+    help = "Recompute the stored abnormal/critical flags of lab results from the current reference ranges"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--test', type=int, action='append', help='Only results of this LabTest id (repeatable)')
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        results = LabResult.objects.all()
+        if options['test']:
+            results = results.filter(lab_test_id__in=options['test'])
+        changed = refresh_flags(results, batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Updated the flag of {changed} lab result(s)'))
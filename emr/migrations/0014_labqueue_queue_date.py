@@ -0,0 +1,51 @@
+# Generated by Django 5.1.1 on 2026-10-18 10:17
+
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import Max
+from django.db.models.functions import TruncDate
+
+
+def backfill_queue_dates(apps, schema_editor):
+    LabQueue = apps.get_model("emr", "LabQueue")
+    QueueCounter = apps.get_model("patient", "QueueCounter")
+
+    LabQueue.objects.update(queue_date=TruncDate("created_at"))
+
+    # Continue today's sequences where the old numbering left off
+    today = django.utils.timezone.localdate()
+    QueueCounter.objects.bulk_create([
+        QueueCounter(
+            clinic_id=row["clinic_id"], scope=f"lab:{row['lab_id'] or 0}",
+            day=row["queue_date"], value=row["last"],
+        )
+        for row in LabQueue.objects.filter(queue_date__gte=today)
+        .values("clinic_id", "lab_id", "queue_date")
+        .annotate(last=Max("queue_number"))
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clinicmanager', '0005_alter_clinicbankdetails_bank_name'),
+        ('emr', '0013_alter_labresult_result_value'),
+        ('patient', '0012_queue_queue_date_queuecounter'),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name='labqueue',
+            unique_together=set(),
+        ),
+        migrations.AddField(
+            model_name='labqueue',
+            name='queue_date',
+            field=models.DateField(default=django.utils.timezone.localdate, editable=False),
+        ),
+        migrations.RunPython(backfill_queue_dates, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='labqueue',
+            unique_together={('clinic', 'lab', 'queue_date', 'queue_number')},
+        ),
+    ]
@@ -0,0 +1,69 @@
+# Generated by Django 5.1.1 on 2026-10-18 10:18
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clinicmanager', '0005_alter_clinicbankdetails_bank_name'),
+        ('emr', '0014_labqueue_queue_date'),
+        ('patient', '0012_queue_queue_date_queuecounter'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LabQueueArchive',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('queue_number', models.PositiveIntegerField()),
+                ('queue_date', models.DateField()),
+                ('status', models.CharField(choices=[('waiting', 'Waiting'), ('in_progress', 'In Progress'), ('completed', 'Completed'), ('skipped', 'Skipped')], max_length=20)),
+                ('created_at', models.DateTimeField()),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('completed_at', models.DateTimeField(blank=True, null=True)),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['created_at'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='labqueue',
+            index=models.Index(condition=models.Q(('status__in', ['waiting', 'in_progress'])), fields=['lab', 'status', 'queue_date', 'queue_number'], name='labqueue_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='labqueue',
+            index=models.Index(condition=models.Q(('status__in', ['waiting', 'in_progress'])), fields=['patient', 'status'], name='labqueue_active_patient_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='labqueue',
+            index=models.Index(fields=['status', 'created_at'], name='labqueue_status_created_idx'),
+        ),
+        migrations.AddField(
+            model_name='labqueuearchive',
+            name='clinic',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='clinicmanager.clinic'),
+        ),
+        migrations.AddField(
+            model_name='labqueuearchive',
+            name='consultation',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='patient.consultation'),
+        ),
+        migrations.AddField(
+            model_name='labqueuearchive',
+            name='lab',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='emr.lab'),
+        ),
+        migrations.AddField(
+            model_name='labqueuearchive',
+            name='lab_test',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='emr.labtest'),
+        ),
+        migrations.AddField(
+            model_name='labqueuearchive',
+            name='patient',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_lab_queues', to='patient.patient'),
+        ),
+    ]
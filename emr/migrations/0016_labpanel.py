@@ -0,0 +1,29 @@
+# Generated by Django 5.1.1 on 2026-10-18 10:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('emr', '0015_labqueue_indexes_labqueuearchive'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LabPanel',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=200, unique=True)),
+                ('description', models.TextField(blank=True, null=True)),
+                ('is_active', models.BooleanField(default=True)),
+                ('price', models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=12)),
+                ('reference_ranges', models.JSONField(blank=True, default=list, editable=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('tests', models.ManyToManyField(related_name='panels', to='emr.labtest')),
+            ],
+            options={
+                'ordering': ['name'],
+            },
+        ),
+    ]
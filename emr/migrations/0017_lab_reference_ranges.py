@@ -0,0 +1,83 @@
+# Generated by Django 5.1.1 on 2026-10-18 10:30
+
+from decimal import Decimal, InvalidOperation
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def _parse_bound(text):
+    try:
+        value = Decimal((text or "").strip().replace(",", ""))
+    except InvalidOperation:
+        return None
+    return value if value.is_finite() and abs(value) < 10 ** 8 else None
+
+
+def copy_numeric_bounds(apps, schema_editor):
+    # The old CharField bounds stay for display; numeric ones seed the typed fields
+    LabTest = apps.get_model("emr", "LabTest")
+    for test in LabTest.objects.exclude(reference_min__isnull=True, reference_max__isnull=True):
+        test.normal_min = _parse_bound(test.reference_min)
+        test.normal_max = _parse_bound(test.reference_max)
+        if test.normal_min is not None or test.normal_max is not None:
+            test.save(update_fields=["normal_min", "normal_max"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('emr', '0016_labpanel'),
+        ('patient', '0013_queue_indexes_queuearchive'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LabReferenceRange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('gender', models.CharField(blank=True, choices=[('M', 'Male'), ('F', 'Female'), ('O', 'Other')], help_text='Blank for any gender', max_length=1)),
+                ('min_age_years', models.DecimalField(blank=True, decimal_places=2, max_digits=5, null=True)),
+                ('max_age_years', models.DecimalField(blank=True, decimal_places=2, max_digits=5, null=True)),
+                ('normal_min', models.DecimalField(blank=True, decimal_places=4, max_digits=12, null=True)),
+                ('normal_max', models.DecimalField(blank=True, decimal_places=4, max_digits=12, null=True)),
+                ('critical_min', models.DecimalField(blank=True, decimal_places=4, max_digits=12, null=True)),
+                ('critical_max', models.DecimalField(blank=True, decimal_places=4, max_digits=12, null=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='labresult',
+            name='flag',
+            field=models.CharField(blank=True, choices=[('', 'Not flagged'), ('N', 'Normal'), ('L', 'Low'), ('H', 'High'), ('LL', 'Critically low'), ('HH', 'Critically high')], default='', editable=False, max_length=2),
+        ),
+        migrations.AddField(
+            model_name='labtest',
+            name='critical_max',
+            field=models.DecimalField(blank=True, decimal_places=4, help_text='Above this a result is critical', max_digits=12, null=True),
+        ),
+        migrations.AddField(
+            model_name='labtest',
+            name='critical_min',
+            field=models.DecimalField(blank=True, decimal_places=4, help_text='Below this a result is critical', max_digits=12, null=True),
+        ),
+        migrations.AddField(
+            model_name='labtest',
+            name='normal_max',
+            field=models.DecimalField(blank=True, decimal_places=4, max_digits=12, null=True),
+        ),
+        migrations.AddField(
+            model_name='labtest',
+            name='normal_min',
+            field=models.DecimalField(blank=True, decimal_places=4, max_digits=12, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='labresult',
+            index=models.Index(condition=models.Q(('flag__in', ['L', 'H', 'LL', 'HH'])), fields=['result_date'], name='labresult_abnormal_idx'),
+        ),
+        migrations.AddField(
+            model_name='labreferencerange',
+            name='lab_test',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='age_gender_ranges', to='emr.labtest'),
+        ),
+        migrations.RunPython(copy_numeric_bounds, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.1.1 on 2026-10-18 10:31
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('emr', '0017_lab_reference_ranges'),
+        ('patient', '0013_queue_indexes_queuearchive'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='labresult',
+            name='numeric_value',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='labresult',
+            name='patient',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='lab_results', to='patient.patient'),
+        ),
+        migrations.AddField(
+            model_name='labresult',
+            name='unit',
+            field=models.CharField(blank=True, default='', editable=False, max_length=50),
+        ),
+        migrations.AddIndex(
+            model_name='labresult',
+            index=models.Index(fields=['patient', 'lab_test', 'result_date'], name='labresult_patient_series_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.1 on 2026-10-18 10:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('emr', '0018_labresult_structured_values'),
+        ('patient', '0013_queue_indexes_queuearchive'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='labresult',
+            index=models.Index(fields=['-result_date', '-id'], name='labresult_recent_idx'),
+        ),
+    ]
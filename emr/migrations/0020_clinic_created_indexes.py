@@ -0,0 +1,19 @@
+# Generated by Django 5.1.1 on 2026-10-18 10:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clinicmanager', '0005_alter_clinicbankdetails_bank_name'),
+        ('emr', '0019_labresult_recent_idx'),
+        ('patient', '0015_clinic_created_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='labqueue',
+            index=models.Index(fields=['clinic', 'created_at'], name='labqueue_clinic_created_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.1 on 2026-10-18 11:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('emr', '0020_clinic_created_indexes'),
+        ('patient', '0018_patient_open_bill_visit_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='labresult',
+            name='parsed',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='labresult',
+            index=models.Index(condition=models.Q(('parsed', False)), fields=['id'], name='labresult_unparsed_idx'),
+        ),
+    ]
@@ -1,8 +1,11 @@
-from django.db import models
+from decimal import Decimal
+
 from django.db import models
 from django.utils import timezone
 from patient.models import Consultation, Patient
+from patient.services import allocate_queue_numbers, lab_scope
 from clinicmanager.models import Clinic
+from clinicmanager.tenancy import ClinicManager
 
 
 
@@ -27,6 +30,11 @@ class Lab(models.Model):
         return self.name
 
 
+def _format_bound(value):
+    # 13.5000 -> "13.5", 10 -> "10"
+    return f"{Decimal(str(value)).normalize():f}"
+
+
 class LabTest(models.Model):
     class Category(models.TextChoices):
         TEST = "Test", "Lab Test"
@@ -43,6 +51,11 @@ class LabTest(models.Model):
     reference_min = models.CharField(max_length=100, null=True, blank=True, help_text="Lower limit of normal range")
     reference_max = models.CharField(max_length=100, null=True, blank=True, help_text="Upper limit of normal range")
     reference_text = models.CharField(max_length=255, null=True, blank=True, help_text="For textual or complex ranges (e.g., Negative, Non-reactive, Normal)")
+    # Typed bounds used for flagging (see emr.reference_ranges); LabReferenceRange rows override them per age/gender
+    normal_min = models.DecimalField(max_digits=12, decimal_places=4, null=True, blank=True)
+    normal_max = models.DecimalField(max_digits=12, decimal_places=4, null=True, blank=True)
+    critical_min = models.DecimalField(max_digits=12, decimal_places=4, null=True, blank=True, help_text="Below this a result is critical")
+    critical_max = models.DecimalField(max_digits=12, decimal_places=4, null=True, blank=True, help_text="Above this a result is critical")
     price = models.DecimalField(max_digits=12, decimal_places=2, default=0)
     description = models.TextField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
@@ -54,40 +67,159 @@ class LabTest(models.Model):
         """Helper method to show range properly."""
         if self.reference_text:
             return self.reference_text
+        if self.normal_min is not None and self.normal_max is not None:
+            return f"{_format_bound(self.normal_min)} - {_format_bound(self.normal_max)} {self.unit or ''}"
         if self.reference_min is not None and self.reference_max is not None:
             return f"{self.reference_min} - {self.reference_max} {self.unit or ''}"
         return "N/A"
 
 
+class LabReferenceRange(models.Model):
+    """
+    Age and/or gender specific bounds for a LabTest. The most specific range
+    matching the patient wins over the test's own bounds. Ages are in years,
+    `max_age_years` exclusive.
+    """
+    lab_test = models.ForeignKey(LabTest, on_delete=models.CASCADE, related_name="age_gender_ranges")
+    gender = models.CharField(max_length=1, choices=Patient.GENDER_CHOICES, blank=True, help_text="Blank for any gender")
+    min_age_years = models.DecimalField(max_digits=5, decimal_places=2, null=True, blank=True)
+    max_age_years = models.DecimalField(max_digits=5, decimal_places=2, null=True, blank=True)
+    normal_min = models.DecimalField(max_digits=12, decimal_places=4, null=True, blank=True)
+    normal_max = models.DecimalField(max_digits=12, decimal_places=4, null=True, blank=True)
+    critical_min = models.DecimalField(max_digits=12, decimal_places=4, null=True, blank=True)
+    critical_max = models.DecimalField(max_digits=12, decimal_places=4, null=True, blank=True)
+
+    def __str__(self):
+        who = self.get_gender_display() if self.gender else "Any"
+        return f"{self.lab_test} ({who}, {self.min_age_years or 0}-{self.max_age_years or '∞'}y)"
+
+
+def _as_float(value):
+    return None if value is None else float(value)
+
+
+class LabPanel(models.Model):
+    """
+    A named set of LabTests (e.g. Full Haemogram, LFTs) that is ordered and billed as one unit.
+    `price` and `reference_ranges` are cached from the tests and kept current by emr.signals.
+    """
+    name = models.CharField(max_length=200, unique=True)
+    tests = models.ManyToManyField(LabTest, related_name="panels")
+    description = models.TextField(null=True, blank=True)
+    is_active = models.BooleanField(default=True)
+    price = models.DecimalField(max_digits=12, decimal_places=2, default=0, editable=False)
+    reference_ranges = models.JSONField(default=list, blank=True, editable=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["name"]
+
+    def __str__(self):
+        return self.name
+
+    def refresh_cached_fields(self):
+        """Recomputes the cached price and reference-range bundle from the current tests."""
+        tests = list(self.tests.order_by("name"))
+        self.price = sum((test.price for test in tests), Decimal("0"))
+        self.reference_ranges = [
+            {
+                "lab_test": test.id,
+                "name": test.name,
+                "unit": test.unit,
+                "reference_min": test.reference_min,
+                "reference_max": test.reference_max,
+                "reference_text": test.reference_text,
+                "normal_min": _as_float(test.normal_min),
+                "normal_max": _as_float(test.normal_max),
+                "critical_min": _as_float(test.critical_min),
+                "critical_max": _as_float(test.critical_max),
+                "display": test.reference_range_display(),
+            }
+            for test in tests
+        ]
+        LabPanel.objects.filter(pk=self.pk).update(price=self.price, reference_ranges=self.reference_ranges)
+
+
+ABNORMAL_FLAGS = ["L", "H", "LL", "HH"]
+CRITICAL_FLAGS = ["LL", "HH"]
+
+
 class LabResult(models.Model):
+    FLAG_CHOICES = [
+        ("", "Not flagged"),
+        ("N", "Normal"),
+        ("L", "Low"),
+        ("H", "High"),
+        ("LL", "Critically low"),
+        ("HH", "Critically high"),
+    ]
+
     lab_test = models.ForeignKey(LabTest, on_delete=models.CASCADE, null=True, blank=True)
     consultation = models.ForeignKey(Consultation, on_delete=models.CASCADE, null=True, blank=True)
     result_name = models.CharField(max_length=100, null=True, blank=True)
     result_value = models.TextField(null=True, blank=True)
     result_date = models.DateTimeField(default=timezone.now)
+    # Structured copy of result_value, parsed on save (see manage.py backfill_lab_values for old rows)
+    patient = models.ForeignKey(Patient, on_delete=models.CASCADE, null=True, blank=True, editable=False, related_name="lab_results")
+    numeric_value = models.FloatField(null=True, blank=True, editable=False)
+    unit = models.CharField(max_length=50, blank=True, default="", editable=False)
+    # Whether the three fields above have been filled; false only for rows older than them
+    parsed = models.BooleanField(default=False, editable=False)
+    # Set on save from the ranges in force at the time; blank for non-numeric results
+    flag = models.CharField(max_length=2, choices=FLAG_CHOICES, blank=True, default="", editable=False)
+
+    # Through the consultation, as the dashboards show it; patient is only filled on save
+    clinic_lookup = "consultation__patient__clinic"
+    objects = ClinicManager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["patient", "lab_test", "result_date"], name="labresult_patient_series_idx"),
+            models.Index(fields=["-result_date", "-id"], name="labresult_recent_idx"),
+            models.Index(
+                fields=["result_date"], name="labresult_abnormal_idx",
+                condition=models.Q(flag__in=ABNORMAL_FLAGS),
+            ),
+            models.Index(fields=["id"], name="labresult_unparsed_idx", condition=models.Q(parsed=False)),
+        ]
 
     def __str__(self):
         return f"{self.consultation} - {self.lab_test}"
 
+    def save(self, *args, **kwargs):
+        from .reference_ranges import flag_result
+
+        self.fill_structured_fields()
+        self.flag = flag_result(self)
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None:
+            kwargs["update_fields"] = {*update_fields, "patient", "numeric_value", "unit", "parsed", "flag"}
+        super().save(*args, **kwargs)
+
+    def fill_structured_fields(self):
+        """Sets patient, numeric_value and unit from the consultation and result_value, and marks the row parsed."""
+        from .reference_ranges import parse_result
+
+        self.patient_id = self.consultation.patient_id if self.consultation_id else None
+        self.numeric_value, unit = parse_result(self.result_value)
+        if self.numeric_value is None:
+            self.unit = ""
+        else:
+            self.unit = unit or (self.lab_test.unit if self.lab_test_id else "") or ""
+        self.parsed = True
+
     def is_abnormal(self):
-        """
-        Checks whether the result is outside the defined normal range.
-        Works only for numeric results with reference_min and reference_max.
-        """
-        try:
-            val = float(self.result_value)
-        except ValueError:
-            return False  # Non-numeric results (e.g., 'Positive') are handled separately
-
-        if self.lab_test.reference_min is not None and val < self.lab_test.reference_min:
-            return True
-        if self.lab_test.reference_max is not None and val > self.lab_test.reference_max:
-            return True
-        return False
+        """Whether the result was outside its normal range when saved."""
+        return self.flag in ABNORMAL_FLAGS
+
+    def is_critical(self):
+        return self.flag in CRITICAL_FLAGS
 
 
 # emr/models.py (or a new file like lab_queue/models.py)
 
+ACTIVE_LAB_QUEUE_STATUSES = ["waiting", "in_progress"]
+
 
 class LabQueue(models.Model):
     STATUS_CHOICES = [
@@ -104,20 +236,36 @@ class LabQueue(models.Model):
     lab_test = models.ForeignKey(LabTest, on_delete=models.SET_NULL, null=True, blank=True, related_name="lab_queues")
 
     queue_number = models.PositiveIntegerField()
+    queue_date = models.DateField(default=timezone.localdate, editable=False)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="waiting")
 
     created_at = models.DateTimeField(auto_now_add=True)
     started_at = models.DateTimeField(null=True, blank=True)
     completed_at = models.DateTimeField(null=True, blank=True)
 
+    objects = ClinicManager()
+
     class Meta:
         ordering = ["created_at"]
-        unique_together = ("clinic", "lab", "queue_number")
+        unique_together = ("clinic", "lab", "queue_date", "queue_number")
+        indexes = [
+            models.Index(
+                fields=["lab", "status", "queue_date", "queue_number"], name="labqueue_active_idx",
+                condition=models.Q(status__in=ACTIVE_LAB_QUEUE_STATUSES),
+            ),
+            models.Index(
+                fields=["patient", "status"], name="labqueue_active_patient_idx",
+                condition=models.Q(status__in=ACTIVE_LAB_QUEUE_STATUSES),
+            ),
+            models.Index(fields=["status", "created_at"], name="labqueue_status_created_idx"),
+            models.Index(fields=["clinic", "created_at"], name="labqueue_clinic_created_idx"),
+        ]
 
     def save(self, *args, **kwargs):
         if not self.queue_number:
-            last = LabQueue.objects.filter(clinic=self.clinic, lab=self.lab).order_by("-queue_number").first()
-            self.queue_number = last.queue_number + 1 if last else 1
+            self.queue_number = allocate_queue_numbers(
+                clinic_id=self.clinic_id, scope=lab_scope(self.lab_id), day=self.queue_date
+            )[0]
         super().save(*args, **kwargs)
 
     def start(self):
@@ -132,3 +280,29 @@ class LabQueue(models.Model):
 
     def __str__(self):
         return f"{self.patient.name} - {self.lab_test.name if self.lab_test else 'N/A'} - #{self.queue_number}"
+
+
+class LabQueueArchive(models.Model):
+    """
+    Completed/skipped LabQueue rows moved out of the hot table by `manage.py archive_queues`.
+    Keeps the original primary key.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    clinic = models.ForeignKey(Clinic, on_delete=models.CASCADE, related_name="+")
+    lab = models.ForeignKey(Lab, on_delete=models.CASCADE, related_name="+", null=True, blank=True)
+    patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name="archived_lab_queues")
+    consultation = models.ForeignKey(Consultation, on_delete=models.SET_NULL, null=True, blank=True, related_name="+")
+    lab_test = models.ForeignKey(LabTest, on_delete=models.SET_NULL, null=True, blank=True, related_name="+")
+    queue_number = models.PositiveIntegerField()
+    queue_date = models.DateField()
+    status = models.CharField(max_length=20, choices=LabQueue.STATUS_CHOICES)
+    created_at = models.DateTimeField()
+    started_at = models.DateTimeField(null=True, blank=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["created_at"]
+
+    def __str__(self):
+        return f"#{self.queue_number} on {self.queue_date} ({self.status})"
@@ -0,0 +1,170 @@
+"""
+Numeric reference ranges and abnormal/critical flagging for lab results.
+
+Flags follow the usual lab convention: N, L, H, LL (critically low) and
+HH (critically high), blank when the value is not numeric or the test has
+no bounds. A result is judged against the most specific LabReferenceRange
+matching the patient's gender and age on the result date, falling back to
+the LabTest's own bounds.
+
+flag_results() works on a whole queryset in one pass: three queries load
+the rows and the ranges, and matching and comparison are done on NumPy
+arrays, with no Python work per row.
+"""
+import numpy as np
+
+from .models import LabReferenceRange, LabResult, LabTest
+
+BOUNDS = ("normal_min", "normal_max", "critical_min", "critical_max")
+CHUNK_SIZE = 5000  # rows matched against the range table at a time
+
+
+def parse_result(text):
+    """
+    Splits a numeric result such as "5.4", "1,200" or "12.0 mmol/L" into
+    (value, unit), unit being "" when not given. Returns (None, "") for
+    anything else ("Positive", "<0.1", "").
+    """
+    parts = str(text).strip().split(None, 1) if text is not None else []
+    if not parts:
+        return None, ""
+    try:
+        value = float(parts[0].replace(",", ""))
+    except ValueError:
+        return None, ""
+    if not np.isfinite(value):
+        return None, ""
+    return value, parts[1].strip()[:50] if len(parts) > 1 else ""
+
+
+def _range_table(test_ids):
+    """The candidate ranges for `test_ids` as parallel arrays, plus a specificity score."""
+    rows = [
+        (test_id, "", None, None, *bounds, 0)
+        for test_id, *bounds in LabTest.objects.filter(id__in=test_ids).values_list("id", *BOUNDS)
+    ]
+    for test_id, gender, min_age, max_age, *bounds in LabReferenceRange.objects.filter(
+        lab_test_id__in=test_ids
+    ).values_list("lab_test_id", "gender", "min_age_years", "max_age_years", *BOUNDS):
+        score = 1 + bool(gender) + (min_age is not None or max_age is not None)
+        rows.append((test_id, gender or "", min_age, max_age, *bounds, score))
+
+    def floats(column, missing=np.nan):
+        return np.array([missing if row[column] is None else float(row[column]) for row in rows], dtype=float)
+
+    return {
+        "test": np.array([row[0] for row in rows], dtype=np.int64),
+        "gender": np.array([row[1] for row in rows], dtype=object),
+        "age_lo": floats(2, -np.inf),
+        "age_hi": floats(3, np.inf),
+        "bounds": np.column_stack([floats(column) for column in range(4, 8)]) if rows else np.empty((0, 4)),
+        "score": np.array([row[8] for row in rows], dtype=np.int64),
+    }
+
+
+def _select_bounds(table, test_ids, genders, ages):
+    """Per row [normal_min, normal_max, critical_min, critical_max], NaN where unset."""
+    bounds = np.full((len(test_ids), 4), np.nan)
+    if not len(table["test"]):
+        return bounds
+    ageless = np.isneginf(table["age_lo"]) & np.isposinf(table["age_hi"])
+    for start in range(0, len(test_ids), CHUNK_SIZE):
+        rows = slice(start, start + CHUNK_SIZE)
+        age = ages[rows, None]
+        match = (
+            (test_ids[rows, None] == table["test"])
+            & ((table["gender"] == "") | (genders[rows, None] == table["gender"]))
+            & (ageless | ((age >= table["age_lo"]) & (age < table["age_hi"])))
+        )
+        score = np.where(match, table["score"], -1)
+        best = score.argmax(axis=1)
+        found = score[np.arange(len(best)), best] >= 0
+        chunk = table["bounds"][best]
+        chunk[~found] = np.nan
+        bounds[rows] = chunk
+    return bounds
+
+
+def flag_values(values, test_ids, genders, ages):
+    """
+    Flags parallel arrays of numeric values (NaN if not numeric), LabTest ids,
+    patient genders ("" if unknown) and ages in years (NaN if unknown).
+    Returns an array of flag codes.
+    """
+    values = np.asarray(values, dtype=float)
+    test_ids = np.asarray(test_ids, dtype=np.int64)
+    genders = np.asarray(genders, dtype=object)
+    ages = np.asarray(ages, dtype=float)
+
+    table = _range_table(np.unique(test_ids).tolist())
+    normal_min, normal_max, critical_min, critical_max = _select_bounds(table, test_ids, genders, ages).T
+    unjudged = np.isnan(values) | (
+        np.isnan(normal_min) & np.isnan(normal_max) & np.isnan(critical_min) & np.isnan(critical_max)
+    )
+    # NaN bounds compare False, so an unset bound never fires
+    return np.select(
+        [unjudged, values < critical_min, values > critical_max, values < normal_min, values > normal_max],
+        ["", "LL", "HH", "L", "H"],
+        default="N",
+    )
+
+
+def _age_years(dates_of_birth, on_dates):
+    born = np.array([np.datetime64(d, "D") if d else np.datetime64("NaT") for d in dates_of_birth])
+    on = np.array([np.datetime64(d, "D") for d in on_dates])
+    days = (on - born).astype("timedelta64[D]")
+    return np.where(np.isnat(days), np.nan, days.astype(float) / 365.25)
+
+
+def flag_results(results):
+    """Returns {LabResult id: flag} for a LabResult queryset, from the stored numeric_value."""
+    rows = list(
+        results.order_by().values_list(
+            "id", "numeric_value", "lab_test_id",
+            "consultation__patient__gender", "consultation__patient__date_of_birth", "result_date",
+        )
+    )
+    if not rows:
+        return {}
+    ids, values, test_ids, genders, births, dates = zip(*rows)
+    flags = flag_values(
+        [np.nan if value is None else value for value in values],
+        [test_id or 0 for test_id in test_ids],
+        [gender or "" for gender in genders],
+        _age_years(births, [date.date() for date in dates]),
+    )
+    return dict(zip(ids, flags.tolist()))
+
+
+def flag_result(result):
+    """Flag for one (possibly unsaved) LabResult whose numeric_value is filled in."""
+    value = result.numeric_value
+    if value is None or not result.lab_test_id:
+        return ""
+    patient = result.consultation.patient if result.consultation_id else None
+    age = np.nan
+    if patient and patient.date_of_birth:
+        age = _age_years([patient.date_of_birth], [result.result_date.date()])[0]
+    return flag_values([value], [result.lab_test_id], [patient.gender if patient else ""], [age])[0].item()
+
+
+def refresh_flags(results, batch_size=2000):
+    """
+    Recomputes and stores the flags of a LabResult queryset in id order,
+    one UPDATE per flag value per batch. Returns the number of rows changed.
+    """
+    changed = 0
+    last_id = 0
+    results = results.order_by("id")
+    while True:
+        batch = results.filter(id__gt=last_id)[:batch_size]
+        ids = list(batch.values_list("id", flat=True))
+        if not ids:
+            return changed
+        flags = flag_results(LabResult.objects.filter(id__in=ids))
+        by_flag = {}
+        for result_id, flag in flags.items():
+            by_flag.setdefault(flag, []).append(result_id)
+        for flag, flag_ids in by_flag.items():
+            changed += LabResult.objects.filter(id__in=flag_ids).exclude(flag=flag).update(flag=flag)
+        last_id = ids[-1]
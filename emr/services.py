@@ -0,0 +1,114 @@
+from django.db import transaction
+from django.utils import timezone
+
+from billing import services as billing
+from billing.models import BillItem
+from notification.outbox import queue_push
+from patient import live_queue
+from patient.services import allocate_queue_numbers, lab_scope
+from .models import LabPanel, LabQueue, LabTest
+
+
+def _unique_ids(ids):
+    return list(dict.fromkeys(int(i) for i in ids))
+
+
+def order_lab_tests(*, consultation, lab_test_ids=(), panel_ids=(), status="in_progress"):
+    """
+    Sends the consultation's patient to the lab for every test in `lab_test_ids`
+    and every test of the LabPanels in `panel_ids`.
+
+    Runs in one transaction: the tests and panels are loaded with a query each,
+    the patient's open bill gets one BillItem per single test and per panel
+    (with the panel's tests as sub-lines) and a single total update, the
+    LabQueue rows are inserted in one statement with numbers reserved per lab
+    up front, and the lab is notified once for the order.
+    Raises LabTest.DoesNotExist / LabPanel.DoesNotExist if any id is unknown.
+    Returns the rows.
+    """
+    lab_test_ids = _unique_ids(lab_test_ids)
+    panel_ids = _unique_ids(panel_ids)
+    if not lab_test_ids and not panel_ids:
+        return []
+    patient = consultation.patient
+    clinic_id = patient.clinic_id
+
+    with transaction.atomic():
+        panels = list(LabPanel.objects.filter(id__in=panel_ids).prefetch_related("tests"))
+        missing = set(panel_ids) - {panel.id for panel in panels}
+        if missing:
+            raise LabPanel.DoesNotExist(f"Unknown lab panel(s): {sorted(missing)}")
+        # A test picked on its own and through a panel is ordered (and billed) once, with the panel
+        queued = {test.id: test for panel in panels for test in panel.tests.all()}
+
+        tests = LabTest.objects.in_bulk([i for i in lab_test_ids if i not in queued])
+        missing = set(lab_test_ids) - set(tests) - set(queued)
+        if missing:
+            raise LabTest.DoesNotExist(f"Unknown lab test(s): {sorted(missing)}")
+        tests = [tests[i] for i in lab_test_ids if i in tests]
+        queued.update((test.id, test) for test in tests)
+        queued = list(queued.values())
+        if not queued:
+            return []
+
+        _bill_lab_order(consultation, tests, panels)
+
+        today = timezone.localdate()
+        numbers = {}
+        for lab_id in {test.lab_id for test in queued}:
+            count = sum(1 for test in queued if test.lab_id == lab_id)
+            numbers[lab_id] = iter(allocate_queue_numbers(
+                clinic_id=clinic_id, scope=lab_scope(lab_id), count=count, day=today
+            ))
+        rows = LabQueue.objects.bulk_create([
+            LabQueue(
+                clinic_id=clinic_id,
+                lab_id=test.lab_id,
+                patient=patient,
+                consultation=consultation,
+                lab_test=test,
+                queue_number=next(numbers[test.lab_id]),
+                queue_date=today,
+                status=status,
+            )
+            for test in queued
+        ])
+
+        # bulk_create skips post_save, so count and announce the order here
+        live_queue.rows_changed(LabQueue, [(None, live_queue.row_state(row)) for row in rows])
+        _announce_order(patient, rows)
+    return rows
+
+
+def _bill_lab_order(consultation, tests, panels):
+    bill = billing.open_bill(consultation.patient, consultation=consultation)
+    items = [BillItem(description=test.name, quantity=1, unit_price=test.price) for test in tests]
+    items += [
+        BillItem(
+            description=f"{panel.name} (panel)",
+            quantity=1,
+            unit_price=panel.price,
+            components=[
+                {"lab_test": test.id, "name": test.name, "price": str(test.price)}
+                for test in panel.tests.all()
+            ],
+        )
+        for panel in panels
+    ]
+    billing.add_items(bill, items)
+    return bill
+
+
+def _announce_order(patient, rows):
+    numbers = ", ".join(f"#{row.queue_number}" for row in rows)
+    tests = "1 test" if len(rows) == 1 else f"{len(rows)} tests"
+    clinic_id = rows[0].clinic_id
+    scopes = [f"clinic:{clinic_id}"] + sorted(
+        {live_queue.owner_scope(LabQueue, clinic_id, row.lab_id) for row in rows if row.lab_id}
+    )
+    event = {
+        "type": "send_lab_notification",
+        "message": f"New patient {patient.name} added to queue for {tests} ({numbers})",
+    }
+    transaction.on_commit(lambda: live_queue.send_to_groups(LabQueue, scopes, event))
+    queue_push("Patient Sent To Lab", f"{patient.name} added to the lab queue for {tests}.", "/emr/")
@@ -1,39 +1,80 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_init, post_delete, m2m_changed
 from django.dispatch import receiver
-from .models import LabQueue
-from channels.layers import get_channel_layer
-from asgiref.sync import async_to_sync
-from webpush import send_user_notification
-from authentication.models import User  
-from notification.models import Notification
+from .models import LabQueue, LabPanel, LabTest, LabResult
+from . import lab_results
+from patient import autocomplete, live_queue
+from notification.outbox import queue_push
 
 @receiver(post_save, sender=LabQueue)
 def notify_lab_queue(sender, instance, created, **kwargs):
     if created:
-        channel_layer = get_channel_layer()
         print("New LabQueue entry created, sending notification...")
-        async_to_sync(channel_layer.group_send)(
-            "lab_notifications",
+        scopes = [f"clinic:{instance.clinic_id}"]
+        if instance.lab_id:
+            scopes.append(live_queue.owner_scope(LabQueue, instance.clinic_id, instance.lab_id))
+        live_queue.send_to_groups(
+            LabQueue,
+            scopes,
             {
                 "type": "send_lab_notification",
                 "message": f"New patient {instance.patient.name} added to queue #{instance.queue_number}"
             }
         )
 
-        payload = {
-            "head": "Patient Sent To Lab",
-            "body": f"{instance.patient.name} added to the queue.",
-            # "icon": "/static/icons/alert.png",
-            "url": "/emr/"
-        }
-
-        user = User.objects.get(username='baharimedicalclinic')
-        # payload = {"head": "Patient Arrival!", "body": "A new patient has arrived!"}
-        send_user_notification(user=user, payload=payload, ttl=1000)
-        # Also create a Notification entry in the database
-        Notification.objects.create(
-            user=user,
-            title="Patient Sent To Lab",
-            body=f"{instance.patient.name} added to the lab queue.",
-            url="/emr/"
-        )
\ No newline at end of file
+        # Delivered by the push dispatcher once this transaction commits
+        queue_push(
+            "Patient Sent To Lab",
+            f"{instance.patient.name} added to the lab queue.",
+            "/emr/",
+        )
+
+
+@receiver(post_init, sender=LabQueue)
+def remember_lab_queue_state(sender, instance, **kwargs):
+    instance._live_state = live_queue.row_state(instance)
+
+
+@receiver(post_save, sender=LabQueue)
+def track_lab_queue_counts(sender, instance, created, **kwargs):
+    live_queue.row_saved(instance, created)
+
+
+@receiver(post_delete, sender=LabQueue)
+def untrack_lab_queue_counts(sender, instance, **kwargs):
+    live_queue.row_deleted(instance)
+
+
+@receiver(m2m_changed, sender=LabPanel.tests.through)
+def refresh_panel_on_tests_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse and action == "pre_clear":
+        # A LabTest leaving all its panels: remember them, post_clear has no pk_set
+        instance._cleared_panels = list(instance.panels.all())
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    if not reverse:
+        panels = [instance]
+    elif action == "post_clear":
+        panels = getattr(instance, "_cleared_panels", [])
+    else:
+        panels = LabPanel.objects.filter(pk__in=pk_set)
+    for panel in panels:
+        panel.refresh_cached_fields()
+
+
+@receiver(post_save, sender=LabTest)
+def refresh_panels_on_test_saved(sender, instance, created, **kwargs):
+    if not created:
+        for panel in instance.panels.all():
+            panel.refresh_cached_fields()
+
+
+@receiver(post_save, sender=LabResult)
+@receiver(post_delete, sender=LabResult)
+def expire_lab_result_summaries(sender, **kwargs):
+    lab_results.results_changed()
+
+
+@receiver(post_save, sender=LabTest)
+@receiver(post_delete, sender=LabTest)
+def reload_lab_test_catalog(sender, **kwargs):
+    autocomplete.LAB_TESTS.changed()
@@ -1,3 +1,172 @@
+import datetime
+import random
+from io import StringIO
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db.models import Count, Max
 from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from patient import live_queue
+from patient.models import Consultation
+from patient.tests import make_clinic, make_patient
+from . import lab_results
+from .consumers import LabQueueConsumer
+from .models import Lab, LabQueue, LabResult, LabTest
+
+
+def subscribe(user, query_string):
+    consumer = LabQueueConsumer()
+    consumer.scope = {"user": user, "query_string": query_string.encode()}
+    return async_to_sync(consumer.get_subscription)()
+
+
+class LabQueueSubscriptionTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.clinic, self.other_clinic = make_clinic("Clinic"), make_clinic("Other")
+        self.user = self.clinic.created_by
+        self.clinic.staff.add(self.user)
+        self.lab = Lab.objects.create(name="Shared lab")
+        for clinic in (self.clinic, self.other_clinic):
+            LabQueue.objects.create(clinic=clinic, lab=self.lab, patient=make_patient(clinic))
+        LabQueue.objects.create(clinic=self.other_clinic, lab=self.lab, patient=make_patient(self.other_clinic, "B"))
+
+    def test_lab_group_only_carries_the_users_clinic(self):
+        group, snapshot = subscribe(self.user, f"lab={self.lab.id}")
+        scope = live_queue.owner_scope(LabQueue, self.clinic.id, self.lab.id)
+        self.assertEqual(group, f"lab_notifications.clinic.{self.clinic.id}.lab.{self.lab.id}")
+        self.assertEqual(snapshot["counts"][scope]["waiting"], 1)
+
+    def test_unknown_lab_falls_back_to_the_clinic_group(self):
+        group, _ = subscribe(self.user, "lab=999999")
+        self.assertEqual(group, f"lab_notifications.clinic.{self.clinic.id}")
+
+    def test_user_without_a_clinic_is_refused(self):
+        outsider = make_clinic("Outsider").created_by
+        self.assertIsNone(subscribe(outsider, f"lab={self.lab.id}"))
+
+
+class BackfillLabValuesTests(TestCase):
+    def setUp(self):
+        clinic = make_clinic()
+        self.patient = make_patient(clinic)
+        consultation = Consultation.objects.create(patient=self.patient)
+        test = LabTest.objects.create(name="Glucose", unit="mmol/L")
+        self.with_consultation = LabResult.objects.create(lab_test=test, consultation=consultation, result_value="5.4")
+        self.orphan = LabResult.objects.create(lab_test=test, result_value="Positive")
+        # As rows from before the structured fields existed
+        LabResult.objects.update(patient=None, numeric_value=None, unit="", parsed=False)
+
+    def backfill(self):
+        out = StringIO()
+        call_command("backfill_lab_values", stdout=out)
+        return out.getvalue()
+
+    def test_parses_each_old_row_once(self):
+        self.assertIn("Parsed 2 lab result(s), 1 numeric", self.backfill())
+        self.with_consultation.refresh_from_db()
+        self.assertEqual(
+            (self.with_consultation.patient, self.with_consultation.numeric_value, self.with_consultation.unit),
+            (self.patient, 5.4, "mmol/L"),
+        )
+        # The result without a consultation never gets a patient, but is not picked up again
+        self.assertIn("Parsed 0 lab result(s)", self.backfill())
+
+    def test_saved_rows_are_already_parsed(self):
+        result = LabResult.objects.create(result_value="7")
+        self.assertTrue(LabResult.objects.get(pk=result.pk).parsed)
+
+
+class LabSeriesApiTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        clinic = make_clinic()
+        clinic.staff.add(clinic.created_by)
+        self.client.force_login(clinic.created_by)
+        self.patient = make_patient(clinic)
+        self.test = LabTest.objects.create(name="Glucose")
+        consultation = Consultation.objects.create(patient=self.patient)
+        self.day = timezone.localdate()
+        for days_ago, value in ((2, "4.8"), (1, "5.1"), (0, "5.4")):
+            result_date = timezone.now() - datetime.timedelta(days=days_ago)
+            LabResult.objects.create(lab_test=self.test, consultation=consultation, result_value=value, result_date=result_date)
+
+    def series(self, **params):
+        response = self.client.get(reverse("lab_series_api", args=[self.patient.id, self.test.id]), params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()["values"]
+
+    def test_date_bounds_take_whole_days(self):
+        yesterday = (self.day - datetime.timedelta(days=1)).isoformat()
+        self.assertEqual(self.series(), [4.8, 5.1, 5.4])
+        self.assertEqual(self.series(to=yesterday), [4.8, 5.1])
+        self.assertEqual(self.series(**{"from": yesterday}), [5.1, 5.4])
+
+    def test_impossible_date_is_ignored(self):
+        self.assertEqual(self.series(**{"from": "2024-13-45", "to": "2024-02-30"}), [4.8, 5.1, 5.4])
+
+
+class LabResultPagingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.clinic = make_clinic()
+        test = LabTest.objects.create(name="Glucose")
+        rng = random.Random(7)
+        now = timezone.now()
+        for i in range(23):
+            consultation = Consultation.objects.create(patient=make_patient(self.clinic, f"P{i}"))
+            for _ in range(rng.randint(1, 4)):
+                LabResult.objects.create(
+                    lab_test=test, consultation=consultation, result_value="5",
+                    # Whole minutes, so some results share a timestamp
+                    result_date=now - datetime.timedelta(minutes=rng.randint(0, 40)),
+                )
+        self.filters = lab_results.parse_filters({})
+
+    def walk(self, fetch):
+        """Every page forward from the first, then back again from the last."""
+        pages = [fetch()]
+        while pages[-1].has_next:
+            pages.append(fetch(after=pages[-1].next_cursor))
+        forward = [[self.key(row) for row in page] for page in pages]
+        pages = pages[-1:]
+        while pages[0].has_previous:
+            pages.insert(0, fetch(before=pages[0].previous_cursor))
+        backward = [[self.key(row) for row in page] for page in pages]
+        return forward, backward
+
+    def test_results_cursor_round_trip(self):
+        self.key = lambda row: row.id
+        forward, backward = self.walk(
+            lambda **cursor: lab_results.results_page(self.filters, self.clinic, size=7, **cursor)
+        )
+        expected = list(LabResult.objects.order_by("-result_date", "-id").values_list("id", flat=True))
+        self.assertEqual(sum(forward, []), expected)
+        self.assertEqual(backward, forward)
+
+    def test_impossible_dates_are_no_filter(self):
+        for name in ("result_date", "result_date_from", "result_date_to"):
+            filters = lab_results.parse_filters({name: "2024-13-45"})
+            self.assertEqual(filters, self.filters, name)
+            self.assertEqual(lab_results.filter_results(filters, self.clinic).count(), LabResult.objects.count())
 
-# Create your tests here.
+    def test_summary_cursor_round_trip(self):
+        self.key = lambda row: (row["consultation_id"], row["total_tests"], row["last_test"])
+        summaries = {
+            consultation.id: (consultation.id, consultation.tests, consultation.last)
+            for consultation in Consultation.objects.annotate(
+                tests=Count("labresult"), last=Max("labresult__result_date")
+            )
+        }
+        expected = sorted(summaries.values(), key=lambda row: (row[2], row[0]), reverse=True)
+        with mock.patch.object(lab_results, "SCAN_CHUNK", 5):
+            forward, backward = self.walk(
+                lambda **cursor: lab_results.summary_page(self.filters, self.clinic, size=4, **cursor)
+            )
+        self.assertEqual(sum(forward, []), expected)
+        self.assertEqual(backward, forward)
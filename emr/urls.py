@@ -10,6 +10,7 @@ urlpatterns = [
     path('edit/<int:consultation_id>/', views.edit_lab_results, name='edit_lab_results'),
     path('view/<int:consultation_id>/', views.view_lab_results, name='view_lab_results'),
     path('print/<int:consultation_id>/', views.print_lab_results, name='print_lab_results'),
+    path('print/export/', views.lab_results_pdf_export, name='lab_results_pdf_export'),
     path("lab/<int:lab_id>/queue/", views.lab_queue_view, name="lab_queue"),
     path("lab/queue/<int:queue_id>/start/", views.start_lab_test, name="start_lab_test"),
     path("lab/queue/<int:queue_id>/complete/", views.complete_lab_test, name="complete_lab_test"),
@@ -17,6 +18,7 @@ urlpatterns = [
     path('ajax/consultation-search/', views.ajax_consultation_search, name='ajax_consultation_search'),
     path('ajax/labtest-search/', views.ajax_labtest_search, name='ajax_labtest_search'),
     path('api/lab-queue-count/', views.lab_queue_count_api, name='lab_queue_count_api'),
+    path('api/patients/<int:patient_id>/lab-series/<int:lab_test_id>/', views.lab_series_api, name='lab_series_api'),
     path("consultations/search/", views.consultation_search, name="consultation_search"),
 
 ]
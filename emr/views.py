@@ -1,18 +1,24 @@
 # Create your views here.
+from datetime import datetime, time, timedelta
+from itertools import groupby
+from operator import attrgetter
 from django.shortcuts import render, redirect, get_object_or_404
 from django.forms import modelformset_factory, inlineformset_factory
-from .models import LabResult, LabQueue, Lab, LabTest
+from .models import LabResult, LabQueue, Lab, LabTest, LabPanel
 from .forms import LabResultForm
-from django.http import HttpResponse, JsonResponse
-from django.template.loader import render_to_string
+from .services import order_lab_tests
+from . import lab_results
+from django.http import Http404, HttpResponse, JsonResponse
+from urllib.parse import urlencode
 from django.utils import timezone
-from weasyprint import HTML
 from django import forms    
 
 from django.contrib import messages
-from django.db.models import Count, Max
+from django.db import transaction
 from patient.models import Patient, Consultation, Queue
-from django.core.paginator import Paginator
+from patient import live_queue
+from patient import autocomplete, documents
+from patient.models import consultation_notes
 from django.db.models import Q
 from django.contrib.auth.decorators import login_required
 from billing.models import Bill, Payment
@@ -22,32 +28,26 @@ from django.utils.dateparse import parse_date
 from django.views.decorators.http import require_GET
 
 
+@login_required
 @require_GET
 def ajax_consultation_search(request):
-    q = request.GET.get('q', '').strip()
-    results = []
-    if q:
-        qs = Consultation.objects.filter(
-            Q(patient__name__icontains=q) | Q(id__icontains=q)  # tweak fields to search
-        )[:20]
-    else:
-        qs = Consultation.objects.none()
-
-    for obj in qs:
-        results.append({'id': obj.pk, 'text': str(obj)})
+    rows = autocomplete.search_consultations(
+        request.GET.get('q', ''),
+        clinic=request.clinic,
+        keystroke=autocomplete.Keystroke.from_request(request, 'consultation'),
+    )
+    if rows is None:
+        return HttpResponse(status=204)  # overtaken by a newer keystroke
+    results = [
+        {'id': row['id'], 'text': f"Consultation for {row['patient_name']} on {row['date']:%Y-%m-%d}"}
+        for row in rows
+    ]
     return JsonResponse(results, safe=False)
 
 
 @require_GET
 def ajax_labtest_search(request):
-    q = request.GET.get('q', '').strip()
-    results = []
-    if q:
-        qs = LabTest.objects.filter(name__icontains=q)[:20]
-    else:
-        qs = LabTest.objects.none()
-    for obj in qs:
-        results.append({'id': obj.pk, 'text': str(obj)})
+    results = [{'id': row['id'], 'text': row['text']} for row in autocomplete.LAB_TESTS.search(request.GET.get('q', ''))]
     return JsonResponse(results, safe=False)
 
 
@@ -86,22 +86,22 @@ def add_lab_result(request, consultation_id):
 
 
 
+@login_required
 def consultation_search(request):
-    q = request.GET.get("q", "")
-
-    consultations = (
-        Consultation.objects
-        .select_related("patient")
-        .filter(patient__name__icontains=q)
-        .only("id", "date", "patient__name")[:20]
+    rows = autocomplete.search_consultations(
+        request.GET.get("q", ""),
+        clinic=request.clinic,
+        keystroke=autocomplete.Keystroke.from_request(request, "consultation"),
     )
+    if rows is None:
+        return HttpResponse(status=204)  # overtaken by a newer keystroke
 
     data = [
         {
-            "id": c.id,
-            "label": f"{c.patient.name} ({c.date})"
+            "id": row["id"],
+            "label": f"{row['patient_name']} ({row['date']})"
         }
-        for c in consultations
+        for row in rows
     ]
 
     return JsonResponse(data, safe=False)
@@ -160,246 +160,81 @@ def edit_lab_results(request, consultation_id):
     )
 
 
-def print_lab_results(request, consultation_id):
-    results = LabResult.objects.filter(consultation_id=consultation_id).select_related('consultation', 'lab_test')
-    consultation = results.first().consultation if results.exists() else None
-    html_string = render_to_string('emr/results_pdf.html', {'results': results, 'consultation': consultation})
+def _lab_report_results():
+    return LabResult.objects.select_related('consultation__patient', 'lab_test').defer(
+        *consultation_notes('consultation__')
+    )
+
 
-    pdf = HTML(string=html_string).write_pdf()
+def print_lab_results(request, consultation_id):
+    results = list(_lab_report_results().filter(consultation_id=consultation_id))
+    consultation = results[0].consultation if results else None
+    pdf = documents.render(documents.lab_results_html(consultation, results))
     response = HttpResponse(pdf, content_type='application/pdf')
-    response['Content-Disposition'] = f'filename="lab_results_{consultation_id}.pdf"'
+    response['Content-Disposition'] = f'filename="{documents.lab_results_filename(consultation_id)}"'
     return response
 
 
 @login_required
-def lab_dashboard(request):
-    search_query = request.GET.get("search", "")
-    lab_queue = lab_queue = (
-        LabQueue.objects
-        .filter(status__in=["waiting", "in_progress"])
-        .order_by("patient_id", "-consultation__date")  # latest consultation first
-        .distinct("patient_id")  # one row per patient
-    )
-
-
-    # Existing results logic...
-    results_qs = (
-        LabResult.objects.values("consultation__patient__name", "consultation_id")
-        .annotate(total_tests=Count("id"), last_test=Max("result_date"))
+def lab_results_pdf_export(request):
+    """
+    A ZIP of lab report PDFs, one per consultation, streamed as they are
+    rendered: consultations in ?ids=1,2,3, or else every report of the
+    clinic with results on ?date= (today).
+    """
+    results, label = documents.export_selection(
+        _lab_report_results().for_clinic(request.clinic).order_by('consultation_id', 'id'),
+        request.GET, id_field='consultation_id', date_field='result_date',
     )
+    reports = []
+    for consultation_id, group in groupby(results, key=attrgetter('consultation_id')):
+        group = list(group)
+        reports.append((
+            documents.lab_results_filename(consultation_id), documents.lab_results_html(group[0].consultation, group), None,
+        ))
+    return documents.zip_response(documents.render_many(reports), f'lab_results_{label}.zip')
+
+
+def _filter_querystring(filters):
+    """The active filters as a query string, for the pagination links."""
+    return urlencode({
+        name: value.isoformat() if hasattr(value, "isoformat") else ("1" if value is True else value)
+        for name, value in filters.items() if value
+    })
 
-    if search_query:
-        results_qs = results_qs.filter(consultation__patient__name__icontains=search_query)
-
-
-
-    historical_results_qs = LabResult.objects.all()
-
-    patient_query = request.GET.get('patient', '')
-    lab_test_query = request.GET.get('lab_test', '')
-    result_date_from_raw = request.GET.get("result_date_from", "").strip()
-    result_date_to_raw   = request.GET.get("result_date_to", "").strip()
-    result_date_raw      = request.GET.get("result_date", "").strip()  # optional exact
-
-    result_date_from = parse_date(result_date_from_raw) if result_date_from_raw else None
-    result_date_to   = parse_date(result_date_to_raw) if result_date_to_raw else None
-    result_date      = parse_date(result_date_raw) if result_date_raw else None
-
-    filters = Q()
-
-    if patient_query:
-        filters &= Q(consultation__patient__name__icontains=patient_query)
-
-    if lab_test_query:
-        filters &= Q(lab_test__name__icontains=lab_test_query)
-
-
-    if patient_query and lab_test_query:
-        filters &= Q(
-            consultation__patient__name__icontains=patient_query,
-            lab_test__name__icontains=lab_test_query
-        )
-    if result_date:
-        filters &= Q(result_date=result_date)
-    else:
-        if result_date_from:
-            filters &= Q(result_date__gte=result_date_from)
-        if result_date_to:
-            filters &= Q(result_date__lte=result_date_to)
-
-    
-    if filters:
-        historical_results_qs = historical_results_qs.filter(filters)
-
-    historical_results_qs = historical_results_qs.order_by("-result_date", "-id").distinct()
-
-    paginator = Paginator(results_qs, 10)
-    page_obj = paginator.get_page(request.GET.get("page"))
-    historical_paginator = Paginator(historical_results_qs, 10)
-    historical_page_obj = historical_paginator.get_page(request.GET.get("historical_page"))
 
+@login_required
+def lab_dashboard(request):
     return render(request, "emr/dashboard.html", {
-        "page_obj": page_obj,
-        "historical_page_obj": historical_page_obj,
-        "search_query": search_query,
-        "patient": patient_query,
-        "lab_test": lab_test_query,
-        "lab_queue": lab_queue,
+        "lab_queue": lab_results.active_lab_queue(request.clinic),
     })
 
 @login_required
 def lab_results_dashboard(request):
-    search_query = request.GET.get("search", "")
-    lab_queue = lab_queue = (
-        LabQueue.objects
-        .all()
-        .order_by("-consultation__date")  # latest consultation first
-        .distinct("patient_id")  # one row per patient
-    )
-
-
-    # Existing results logic...
-    results_qs = (
-        LabResult.objects.values("consultation__patient__name", "consultation_id")
-        .annotate(total_tests=Count("id"), last_test=Max("consultation__date"))
-        .order_by("-consultation__date")
+    filters = lab_results.parse_filters(request.GET)
+    page_obj = lab_results.summary_page(
+        filters, request.clinic, after=request.GET.get("after"), before=request.GET.get("before")
     )
-
-    if search_query:
-        results_qs = results_qs.filter(consultation__patient__name__icontains=search_query)
-
-
-
-    historical_results_qs = LabResult.objects.all()
-
-    patient_query = request.GET.get('patient', '')
-    lab_test_query = request.GET.get('lab_test', '')
-    result_date_from_raw = request.GET.get("result_date_from", "").strip()
-    result_date_to_raw   = request.GET.get("result_date_to", "").strip()
-    result_date_raw      = request.GET.get("result_date", "").strip()  # optional exact
-
-    result_date_from = parse_date(result_date_from_raw) if result_date_from_raw else None
-    result_date_to   = parse_date(result_date_to_raw) if result_date_to_raw else None
-    result_date      = parse_date(result_date_raw) if result_date_raw else None
-
-    filters = Q()
-
-    if patient_query:
-        filters &= Q(consultation__patient__name__icontains=patient_query)
-
-    if lab_test_query:
-        filters &= Q(lab_test__name__icontains=lab_test_query)
-
-
-    if patient_query and lab_test_query:
-        filters &= Q(
-            consultation__patient__name__icontains=patient_query,
-            lab_test__name__icontains=lab_test_query
-        )
-    if result_date:
-        filters &= Q(result_date=result_date)
-    else:
-        if result_date_from:
-            filters &= Q(result_date__gte=result_date_from)
-        if result_date_to:
-            filters &= Q(result_date__lte=result_date_to)
-
-    
-    if filters:
-        historical_results_qs = historical_results_qs.filter(filters)
-
-    historical_results_qs = historical_results_qs.order_by("-consultation__date").distinct()
-
-    paginator = Paginator(results_qs, 10)
-    page_obj = paginator.get_page(request.GET.get("page"))
-    historical_paginator = Paginator(historical_results_qs, 10)
-    historical_page_obj = historical_paginator.get_page(request.GET.get("historical_page"))
-
     return render(request, "emr/lab_results_dashboard.html", {
         "page_obj": page_obj,
-        "historical_page_obj": historical_page_obj,
-        "search_query": search_query,
-        "patient": patient_query,
-        "lab_test": lab_test_query,
-        "lab_queue": lab_queue,
+        "search_query": filters["search"],
+        "filter_querystring": _filter_querystring(filters),
     })
 
 
 
 @login_required
 def lab_search_dashboard(request):
-    search_query = request.GET.get("search", "")
-    lab_queue = lab_queue = (
-        LabQueue.objects
-        .filter(status__in=["waiting", "in_progress"])
-        .order_by("patient_id", "-consultation__date")  # latest consultation first
-        .distinct("patient_id")  # one row per patient
-    )
-
-
-    # Existing results logic...
-    results_qs = (
-        LabResult.objects.values("consultation__patient__name", "consultation_id")
-        .annotate(total_tests=Count("id"), last_test=Max("result_date"))
+    filters = lab_results.parse_filters(request.GET)
+    historical_page_obj = lab_results.results_page(
+        filters, request.clinic, after=request.GET.get("after"), before=request.GET.get("before")
     )
-
-    if search_query:
-        results_qs = results_qs.filter(consultation__patient__name__icontains=search_query)
-
-
-
-    historical_results_qs = LabResult.objects.all()
-
-    patient_query = request.GET.get('patient', '')
-    lab_test_query = request.GET.get('lab_test', '')
-    result_date_from_raw = request.GET.get("result_date_from", "").strip()
-    result_date_to_raw   = request.GET.get("result_date_to", "").strip()
-    result_date_raw      = request.GET.get("result_date", "").strip()  # optional exact
-
-    result_date_from = parse_date(result_date_from_raw) if result_date_from_raw else None
-    result_date_to   = parse_date(result_date_to_raw) if result_date_to_raw else None
-    result_date      = parse_date(result_date_raw) if result_date_raw else None
-
-    filters = Q()
-
-    if patient_query:
-        filters &= Q(consultation__patient__name__icontains=patient_query)
-
-    if lab_test_query:
-        filters &= Q(lab_test__name__icontains=lab_test_query)
-
-
-    if patient_query and lab_test_query:
-        filters &= Q(
-            consultation__patient__name__icontains=patient_query,
-            lab_test__name__icontains=lab_test_query
-        )
-    if result_date:
-        filters &= Q(result_date=result_date)
-    else:
-        if result_date_from:
-            filters &= Q(result_date__gte=result_date_from)
-        if result_date_to:
-            filters &= Q(result_date__lte=result_date_to)
-
-    
-    if filters:
-        historical_results_qs = historical_results_qs.filter(filters)
-
-    historical_results_qs = historical_results_qs.order_by("-result_date", "-id").distinct()
-
-    paginator = Paginator(results_qs, 10)
-    page_obj = paginator.get_page(request.GET.get("page"))
-    historical_paginator = Paginator(historical_results_qs, 10)
-    historical_page_obj = historical_paginator.get_page(request.GET.get("historical_page"))
-
     return render(request, "emr/lab_search_dashboard.html", {
-        "page_obj": page_obj,
         "historical_page_obj": historical_page_obj,
-        "search_query": search_query,
-        "patient": patient_query,
-        "lab_test": lab_test_query,
-        "lab_queue": lab_queue,
+        "patient": filters["patient"],
+        "lab_test": filters["lab_test"],
+        "abnormal": filters["abnormal"],
+        "filter_querystring": _filter_querystring(filters),
     })
 
 def view_lab_results(request, consultation_id):
@@ -417,7 +252,7 @@ def view_lab_results(request, consultation_id):
 
 def lab_queue_view(request, lab_id):
     lab = get_object_or_404(Lab, id=lab_id)
-    queue = LabQueue.objects.filter(lab=lab, status__in=["waiting", "in_progress","inlab"]).order_by("queue_number")
+    queue = LabQueue.objects.filter(lab=lab, status__in=["waiting", "in_progress","inlab"]).order_by("queue_date", "queue_number")
 
     return render(request, "emr/dashboard.html", {
         "lab": lab,
@@ -475,52 +310,45 @@ def send_to_lab(request, consultation_id, patient_id):
 
     if request.method == "POST":
         selected_lab_tests = request.POST.getlist("lab_tests")  # get selected tests from <select multiple>
+        selected_panels = request.POST.getlist("lab_panels")
 
-        if not selected_lab_tests:
+        if not selected_lab_tests and not selected_panels:
             messages.warning(request, "Please select at least one lab test.")
             return redirect('doctor_detail', pk=consultation.doctor.id)
 
-        # ✅ Check if there is any in-progress test for this patient
-        has_in_progress = LabQueue.objects.filter(
-            patient=patient,
-            status="in_progress"  # assuming your LabQueue has a status field
-        ).exists()
-
-        if has_in_progress:
-            messages.warning(
-                request,
-                f"{patient.name} already has a test in progress. Wait for it to complete before adding new ones."
-            )
-            return redirect('doctor_detail', pk=consultation.doctor.id)
+        with transaction.atomic():
+            # ✅ Check if there is any in-progress test for this patient
+            has_in_progress = LabQueue.objects.filter(
+                patient=patient,
+                status="in_progress"  # assuming your LabQueue has a status field
+            ).exists()
 
-        # Create one LabQueue per selected test
-        for lab_test_id in selected_lab_tests:
-            lab_test = get_object_or_404(LabTest, id=lab_test_id)
-            
+            if has_in_progress:
+                messages.warning(
+                    request,
+                    f"{patient.name} already has a test in progress. Wait for it to complete before adding new ones."
+                )
+                return redirect('doctor_detail', pk=consultation.doctor.id)
+
+            # One LabQueue row per selected test (panels expanded), one bill line per test or panel
             try:
-                bill = Bill.objects.filter(patient=patient,is_paid=False).latest('created_at')
-                bill.total_amount += lab_test.price
-                bill.is_paid = False
-                bill.save()
-                
-            except Exception as e:
-                messages.error(request, f"Error creating bill for {lab_test.name}: {str(e)}")
-                
-            LabQueue.objects.create(
+                order_lab_tests(
+                    consultation=consultation,
+                    lab_test_ids=selected_lab_tests,
+                    panel_ids=selected_panels,
+                )
+            except (LabTest.DoesNotExist, LabPanel.DoesNotExist, ValueError):
+                raise Http404("Unknown lab test or panel")
+
+            # Update Doctor Queue status (saved row by row so the live counts follow)
+            for queue_item in Queue.objects.filter(
                 clinic=clinic,
+                doctor=consultation.doctor,
                 patient=patient,
-                consultation=consultation,
-                lab_test=lab_test,
-                status="in_progress",
-            )
-
-        # Update Doctor Queue status
-        Queue.objects.filter(
-            clinic=clinic,
-            doctor=consultation.doctor,
-            patient=patient,
-            status__in=["waiting", "in_progress"]
-        ).update(status="inlab")
+                status__in=["waiting", "in_progress"]
+            ):
+                queue_item.status = "inlab"
+                queue_item.save(update_fields=["status"])
 
         messages.success(request, f"✅ {patient.name} has been sent to the lab for selected tests successfully, with billing generated.")
         return redirect('doctor_detail', pk=consultation.doctor.id)
@@ -531,7 +359,46 @@ def send_to_lab(request, consultation_id, patient_id):
 
 
 
+@login_required
+@require_GET
+def lab_series_api(request, patient_id, lab_test_id):
+    """
+    A patient's numeric results for one LabTest, oldest first, as parallel arrays:
+    {"timestamps": [epoch ms, ...], "values": [...], "flags": [...]}.
+    Optional ?from=YYYY-MM-DD&to=YYYY-MM-DD bound the result dates.
+    """
+    patient = get_object_or_404(Patient, id=patient_id, clinic=request.clinic)
+    lab_test = get_object_or_404(LabTest, id=lab_test_id)
+
+    rows = LabResult.objects.filter(patient=patient, lab_test=lab_test, numeric_value__isnull=False)
+    bounds = []
+    for name in ("from", "to"):
+        try:
+            bounds.append(parse_date(request.GET.get(name, "").strip()))
+        except ValueError:  # well formed but impossible, e.g. 2024-13-45
+            bounds.append(None)
+    date_from, date_to = bounds
+    # Day bounds as datetimes rather than __date, so the (patient, lab_test, result_date) index covers the range
+    if date_from:
+        rows = rows.filter(result_date__gte=timezone.make_aware(datetime.combine(date_from, time.min)))
+    if date_to:
+        rows = rows.filter(result_date__lt=timezone.make_aware(datetime.combine(date_to + timedelta(days=1), time.min)))
+    rows = list(rows.order_by("result_date").values_list("result_date", "numeric_value", "flag"))
+
+    timestamps, values, flags = zip(*rows) if rows else ((), (), ())
+    return JsonResponse({
+        "patient": patient.id,
+        "lab_test": lab_test.id,
+        "name": lab_test.name,
+        "unit": lab_test.unit or "",
+        "reference_range": lab_test.reference_range_display(),
+        "timestamps": [int(ts.timestamp() * 1000) for ts in timestamps],
+        "values": list(values),
+        "flags": list(flags),
+    })
+
+
 def lab_queue_count_api(request):
-    count = LabQueue.objects.filter(status='in_progress').count()
+    count = live_queue.get_counts(LabQueue, live_queue.clinic_scope(request.clinic))['in_progress']
     print(f"Lab queue count requested, current count: {count}")
     return JsonResponse({'count': count})
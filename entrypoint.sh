@@ -26,6 +26,15 @@ celery -A setup worker --loglevel=info &
 # # start celery beat
 celery -A setup beat --loglevel=info &
 
+# start the web push dispatcher
+python3 manage.py dispatch_push_outbox &
+
+# mirror Paystack transactions and settle the payments they paid, every 5 minutes
+python3 manage.py sync_paystack &
+
+# apply the Paystack webhook events the webhook view stores in the inbox
+python3 manage.py process_paystack_events &
+
 sleep 5
 
 # Start Gunicorn WSGI
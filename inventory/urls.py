@@ -8,7 +8,10 @@ router = DefaultRouter()
 router.register(r'items', views.ItemViewSet, basename='items')
 router.register(r'stock', views.StockViewSet, basename='stock')
 router.register(r'consumptions', views.ConsumptionViewSet, basename='consumptions')
-urlpatterns = router.urls
+# Ahead of the router, whose items/<pk>/ route would otherwise match items/search/
+urlpatterns = [
+    path('items/search/', views.item_search, name='item_search'),
+] + router.urls
 
 urlpatterns += [
     path('', views.dashboard, name='inventory_dashboard'),
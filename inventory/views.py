@@ -5,6 +5,8 @@ from .models import Item, Stock, StockMovement, PurchaseOrder, PurchaseOrderLine
 from .forms import PurchaseOrderForm, PurchaseOrderLineFormset, StockMovementForm, ConsumptionForm
 from django.contrib.auth.decorators import login_required
 from django.db.models import Q
+from django.http import JsonResponse
+from patient import autocomplete
 from django.core.paginator import Paginator
 from django.db import transaction
 from django.db.models import Sum
@@ -67,6 +69,11 @@ def item_list(request):
         qs = qs.filter(name__icontains=q) | qs.filter(sku__icontains=q)
     return render(request, 'inventory/item_list.html', {'items': qs})
 
+@login_required
+def item_search(request):
+    # Typeahead / barcode scan lookup, served from the in-memory item catalog
+    return JsonResponse({'results': autocomplete.ITEMS.search(request.GET.get('q', ''))})
+
 @login_required
 def item_detail(request, pk):
     item = get_object_or_404(Item, pk=pk)
@@ -1,5 +1,12 @@
 from django.contrib import admin
-from .models import Notification
+from .models import Notification, PushOutbox
 
 # Register your models here.
 admin.site.register(Notification)
+
+
+@admin.register(PushOutbox)
+class PushOutboxAdmin(admin.ModelAdmin):
+    list_display = ("title", "recipient", "status", "attempts", "next_attempt_at", "created_at")
+    list_filter = ("status",)
+    search_fields = ("recipient", "title")
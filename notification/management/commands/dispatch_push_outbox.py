@@ -0,0 +1,38 @@
+# notification/management/commands/dispatch_push_outbox.py
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from notification.outbox import dispatch_once
+
+
+class Command(BaseCommand):
+    help = "Deliver queued web pushes from the outbox, retrying failures with backoff"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--workers', type=int, default=8, help='Concurrent push requests')
+        parser.add_argument('--idle-sleep', type=float, default=1.0,
+                            help='Seconds to wait when nothing is due')
+        parser.add_argument('--once', action='store_true', help='Drain what is due now, then exit')
+
+    def handle(self, *args, **options):
+        workers = options['workers']
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='webpush') as pool:
+            while True:
+                close_old_connections()
+                handled = dispatch_once(session, pool, options['batch_size'])
+                if handled:
+                    self.stdout.write(f'Dispatched {handled} push(es)')
+                elif options['once']:
+                    return
+                else:
+                    time.sleep(options['idle_sleep'])
@@ -49,3 +49,51 @@ class Notification(models.Model):
         if self.user:
             return f"Notification → {self.user.username}: {self.title}"
         return f"Broadcast Notification: {self.title}"
+
+
+class PushOutbox(models.Model):
+    """
+    A web push waiting to be delivered by the dispatcher
+    (manage.py dispatch_push_outbox). Rows are written in the same
+    transaction as the event that caused them, so a rolled back enqueue
+    never pushes and requests never wait on the push service.
+    """
+    STATUS_CHOICES = [
+        ("pending", "Pending"),
+        ("sent", "Sent"),
+        ("failed", "Failed"),
+    ]
+
+    # Username of the recipient; resolved by the dispatcher, not the request
+    recipient = models.CharField(max_length=150)
+    title = models.CharField(max_length=255)
+    body = models.TextField()
+    url = models.CharField(max_length=255, blank=True)
+    ttl = models.PositiveIntegerField(default=1000)
+
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default="pending")
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+
+    # In-app copy, created on the first attempt so retries don't duplicate it
+    notification = models.ForeignKey(
+        Notification, on_delete=models.SET_NULL, null=True, blank=True, related_name="+"
+    )
+    # Subscription ids already pushed to; a retry only goes to the rest
+    delivered_to = models.JSONField(default=list, blank=True)
+
+    created_at = models.DateTimeField(default=timezone.now)
+    sent_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["next_attempt_at"],
+                name="pushoutbox_due_idx",
+                condition=models.Q(status="pending"),
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.get_status_display()} push → {self.recipient}: {self.title}"
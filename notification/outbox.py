@@ -0,0 +1,170 @@
+"""
+Web push outbox.
+
+Signals and views call queue_push(), which only inserts a PushOutbox row in
+the caller's transaction. The dispatcher (manage.py dispatch_push_outbox)
+claims due rows in batches, records the in-app Notification, pushes to every
+subscription of the recipient concurrently and reschedules failures with
+exponential backoff.
+"""
+import json
+import random
+from datetime import timedelta
+
+import requests
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.utils import timezone
+from pywebpush import WebPushException, webpush
+from webpush.models import PushInformation, SubscriptionInfo
+
+from .models import Notification, PushOutbox
+
+MAX_ATTEMPTS = 8
+BACKOFF_BASE = 15  # seconds; doubles per attempt
+BACKOFF_MAX = 60 * 60
+# A claimed row is invisible to other dispatchers for this long; if its
+# dispatcher dies mid-batch the row simply becomes due again
+CLAIM_LEASE = timedelta(minutes=5)
+PUSH_TIMEOUT = 10
+
+DELIVERED, GONE, RETRY, REJECTED = "delivered", "gone", "retry", "rejected"
+
+
+def queue_push(title, body, url="", *, recipient=None, ttl=1000):
+    """
+    Queues a web push (and its in-app Notification) for `recipient`, a username.
+    """
+    return PushOutbox.objects.create(
+        recipient=recipient or settings.PUSH_NOTIFICATION_RECIPIENT,
+        title=title,
+        body=body,
+        url=url,
+        ttl=ttl,
+    )
+
+
+def backoff(attempts):
+    delay = min(BACKOFF_BASE * 2 ** (attempts - 1), BACKOFF_MAX)
+    return timedelta(seconds=delay + random.uniform(0, delay / 5))
+
+
+def claim_batch(batch_size):
+    """Leases up to `batch_size` due rows to this dispatcher and returns them."""
+    now = timezone.now()
+    with transaction.atomic():
+        rows = list(
+            PushOutbox.objects.select_for_update(skip_locked=True)
+            .filter(status="pending", next_attempt_at__lte=now)
+            .order_by("next_attempt_at")[:batch_size]
+        )
+        for row in rows:
+            row.attempts += 1
+            row.next_attempt_at = now + CLAIM_LEASE
+        PushOutbox.objects.bulk_update(rows, ["attempts", "next_attempt_at"])
+    return rows
+
+
+def _vapid_kwargs():
+    webpush_settings = getattr(settings, "WEBPUSH_SETTINGS", {})
+    if not webpush_settings.get("VAPID_PRIVATE_KEY"):
+        return {}
+    return {
+        "vapid_private_key": webpush_settings["VAPID_PRIVATE_KEY"],
+        "vapid_claims": {"sub": f"mailto:{webpush_settings.get('VAPID_ADMIN_EMAIL')}"},
+    }
+
+
+def _push(session, subscription, data, ttl):
+    try:
+        webpush(
+            subscription_info={
+                "endpoint": subscription.endpoint,
+                "keys": {"p256dh": subscription.p256dh, "auth": subscription.auth},
+            },
+            data=data,
+            ttl=ttl,
+            timeout=PUSH_TIMEOUT,
+            requests_session=session,
+            **_vapid_kwargs(),
+        )
+        return DELIVERED, ""
+    except WebPushException as e:
+        status = e.response.status_code if e.response is not None else None
+        if status in (404, 410):
+            return GONE, ""
+        if status is None or status == 429 or status >= 500:
+            return RETRY, str(e)
+        return REJECTED, str(e)
+    except requests.RequestException as e:
+        return RETRY, str(e)
+
+
+def _record_notifications(rows, users):
+    new = [row for row in rows if row.notification_id is None and row.recipient in users]
+    notifications = Notification.objects.bulk_create([
+        Notification(user=users[row.recipient], title=row.title, body=row.body, url=row.url)
+        for row in new
+    ])
+    for row, notification in zip(new, notifications):
+        row.notification = notification
+
+
+def deliver(rows, session, pool):
+    """Sends a claimed batch and records each row's outcome."""
+    users = {u.username: u for u in get_user_model().objects.filter(username__in={r.recipient for r in rows})}
+    _record_notifications(rows, users)
+
+    subscriptions = {}
+    for info in PushInformation.objects.filter(user__in=users.values()).select_related("subscription"):
+        subscriptions.setdefault(info.user_id, {})[info.subscription_id] = info.subscription
+
+    jobs = []
+    for row in rows:
+        user = users.get(row.recipient)
+        targets = subscriptions.get(user.id, {}) if user else {}
+        data = json.dumps({"head": row.title, "body": row.body, "url": row.url})
+        for sub_id, subscription in targets.items():
+            if sub_id not in row.delivered_to:
+                jobs.append((row, sub_id, pool.submit(_push, session, subscription, data, row.ttl)))
+
+    results = {}
+    gone = set()
+    for row, sub_id, future in jobs:
+        outcome, error = future.result()
+        results.setdefault(row.id, []).append((outcome, error))
+        if outcome == DELIVERED:
+            row.delivered_to.append(sub_id)
+        elif outcome == GONE:
+            gone.add(sub_id)
+    if gone:
+        SubscriptionInfo.objects.filter(id__in=gone).delete()
+
+    now = timezone.now()
+    for row in rows:
+        outcomes = results.get(row.id, [])
+        errors = [error for outcome, error in outcomes if error]
+        row.last_error = errors[-1] if errors else ""
+        if row.recipient not in users:
+            row.status, row.last_error = "failed", f"Unknown recipient {row.recipient!r}"
+        elif any(outcome == RETRY for outcome, _ in outcomes):
+            if row.attempts >= MAX_ATTEMPTS:
+                row.status = "failed"
+            else:
+                row.status, row.next_attempt_at = "pending", now + backoff(row.attempts)
+        else:
+            row.status, row.sent_at = "sent", now
+    PushOutbox.objects.bulk_update(
+        rows, ["status", "next_attempt_at", "last_error", "notification", "delivered_to", "sent_at"]
+    )
+    return results
+
+
+def dispatch_once(session, pool, batch_size=100):
+    """Claims and delivers one batch. Returns the number of rows handled."""
+    rows = claim_batch(batch_size)
+    if rows:
+        deliver(rows, session, pool)
+    return len(rows)
+
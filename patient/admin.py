@@ -13,4 +13,7 @@ admin.site.register(Patient)
 class ConsultationAdmin(admin.ModelAdmin):
     list_display = ("id", "patient__name", "doctor__name", "chief_complaints","lab_findings", )
     list_filter = ("date",)
-    search_fields = ("patient__name",)
\ No newline at end of file
+    search_fields = ("patient__name",)
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).with_notes("chief_complaints", "lab_findings")
\ No newline at end of file
@@ -0,0 +1,248 @@
+"""
+Typeahead (autocomplete) lookups for consultations, lab tests and
+inventory items.
+
+Consultation matches come from patient.search and are cached twice:
+  - in a small per-process LRU
+  - in the shared cache for CONSULTATION_TTL seconds
+Both are keyed by (clinic, typed prefix). A Consultation or Patient write
+bumps a generation number (see patient.signals), which retires every
+cached page at once. A query that is all digits is also tried as a
+consultation id, with a single primary key lookup.
+
+The lab test and item catalogs are small. Each process loads a catalog
+once and searches it in memory. A write to the catalog's model bumps its
+generation, and every process reloads its copy within CHECK_INTERVAL
+seconds.
+
+Clients send an increasing `seq` with each keystroke on a channel, such as
+one search box. A request that a newer keystroke has overtaken is dropped
+before it reaches the database (see Keystroke).
+"""
+import hashlib
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from django.apps import apps
+from django.core.cache import cache
+
+from .models import Consultation
+from .search import patient_q
+
+LIMIT = 20
+CONSULTATION_TTL = 30
+LRU_SIZE = 512
+CHECK_INTERVAL = 1.0  # seconds between catalog generation checks
+KEYSTROKE_TTL = 60
+
+
+def _generation(name):
+    key = f"autocomplete:{name}:generation"
+    cache.add(key, time.time_ns(), None)
+    return cache.get(key)
+
+
+def _bump(name):
+    try:
+        cache.incr(f"autocomplete:{name}:generation")
+    except ValueError:
+        _generation(name)
+
+
+def normalize(query):
+    return re.sub(r"\s+", " ", (query or "").strip()).lower()
+
+
+class LRU:
+    """A thread-safe, size-bounded mapping that evicts the least recently used key."""
+
+    def __init__(self, size=LRU_SIZE):
+        self.size = size
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._data:
+                return None
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.size:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class Keystroke:
+    """
+    Tracks the newest `seq` seen on a typeahead channel, such as one user's
+    consultation search box. A request is stale once a later keystroke on
+    the same channel has arrived. Requests without a seq are never stale.
+    """
+
+    def __init__(self, channel, seq):
+        self.key = f"autocomplete:seq:{channel}"
+        self.seq = seq
+        if seq is not None and not self.stale():
+            cache.set(self.key, seq, KEYSTROKE_TTL)
+
+    @classmethod
+    def from_request(cls, request, channel):
+        try:
+            seq = int(request.GET["seq"])
+        except (KeyError, ValueError):
+            seq = None
+        if request.user.is_authenticated:
+            owner = request.user.pk
+        else:
+            owner = request.session.session_key or request.META.get("REMOTE_ADDR")
+        return cls(f"{owner}:{channel}", seq)
+
+    def stale(self):
+        if self.seq is None:
+            return False
+        latest = cache.get(self.key)
+        return latest is not None and latest > self.seq
+
+
+# --- consultations ---------------------------------------------------------
+
+_consultations = LRU()
+
+
+def consultations_changed():
+    """Retires every cached consultation lookup. Called on Consultation/Patient writes."""
+    _bump("consultations")
+
+
+def search_consultations(query, *, clinic=None, limit=LIMIT, keystroke=None):
+    """
+    `clinic`'s consultations for `query`, as [{"id", "date", "patient_name"}],
+    exact id first and then the newest. Returns None if `keystroke` went
+    stale before the database was queried.
+    """
+    query = normalize(query)
+    clinic_id = getattr(clinic, "pk", clinic)
+    # Like for_clinic(), no clinic matches nothing
+    if not query or clinic_id is None:
+        return []
+    key = (clinic_id, _generation("consultations"), query, limit)
+    rows = _consultations.get(key)
+    if rows is not None:
+        return rows
+
+    cache_key = f"autocomplete:consultations:{key[1]}:{clinic_id}:{limit}:{hashlib.md5(query.encode()).hexdigest()}"
+    rows = cache.get(cache_key)
+    if rows is None:
+        if keystroke is not None and keystroke.stale():
+            return None
+        rows = _query_consultations(query, clinic_id, limit)
+        cache.set(cache_key, rows, CONSULTATION_TTL)
+    _consultations.put(key, rows)
+    return rows
+
+
+def _query_consultations(query, clinic_id, limit):
+    consultations = Consultation.objects.for_clinic(clinic_id)
+    fields = ("id", "date", "patient__name")
+
+    rows = []
+    if query.isdigit() and len(query) < 19:
+        rows = list(consultations.filter(id=int(query)).values(*fields))
+    rows += consultations.filter(patient_q(query, "patient__")).exclude(
+        id__in=[row["id"] for row in rows]
+    ).order_by("-date").values(*fields)[:limit - len(rows)]
+    return [{"id": row["id"], "date": row["date"], "patient_name": row["patient__name"]} for row in rows]
+
+
+# --- in-memory catalogs ----------------------------------------------------
+
+class CatalogIndex:
+    """
+    An in-memory copy of a small table for typeahead. `fields` are
+    returned with each match. `searched` are matched by word prefix and
+    then by substring. `exact` (for example a barcode or SKU) are matched
+    whole and ranked first.
+    """
+
+    def __init__(self, name, model, *, fields, searched, exact=(), text=None):
+        self.name = name
+        self.model = model
+        self.fields = tuple(fields)
+        self.searched = tuple(searched)
+        self.exact = tuple(exact)
+        self.text = text or (lambda row: row[self.searched[0]])
+        self._entries = []
+        self._by_exact = {}
+        self._loaded_generation = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def changed(self):
+        """Marks every process's copy out of date. Called on writes to the model."""
+        _bump(self.name)
+        self._checked_at = 0.0
+
+    def _load(self, generation):
+        entries, by_exact = [], {}
+        for row in apps.get_model(self.model).objects.order_by(self.searched[0], "id").values("id", *self.fields):
+            row = dict(row, text=self.text(row))
+            haystack = " ".join(str(row[field] or "") for field in self.searched).lower()
+            entries.append((haystack, tuple(haystack.split()), row))
+            for field in self.exact:
+                if row[field]:
+                    by_exact.setdefault(str(row[field]).lower(), row)
+        self._entries, self._by_exact = entries, by_exact
+        self._loaded_generation = generation
+
+    def _current(self):
+        now = time.monotonic()
+        if now - self._checked_at >= CHECK_INTERVAL:
+            with self._lock:
+                if now - self._checked_at >= CHECK_INTERVAL:
+                    generation = _generation(self.name)
+                    if generation != self._loaded_generation:
+                        self._load(generation)
+                    self._checked_at = now
+        return self._entries, self._by_exact
+
+    def search(self, query, limit=LIMIT):
+        """Rows (the catalog's fields plus "id" and "text") matching `query`, best first."""
+        query = normalize(query)
+        if not query:
+            return []
+        entries, by_exact = self._current()
+        results = [by_exact[query]] if query in by_exact else []
+        if query.isdigit():
+            results += [row for _, _, row in entries if row["id"] == int(query) and row not in results]
+        prefix, substring = [], []
+        for haystack, words, row in entries:
+            if any(word.startswith(query) for word in words) or haystack.startswith(query):
+                prefix.append(row)
+            elif query in haystack:
+                substring.append(row)
+        for row in prefix + substring:
+            if len(results) >= limit:
+                break
+            if row not in results:
+                results.append(row)
+        return results[:limit]
+
+
+LAB_TESTS = CatalogIndex("lab-tests", "emr.LabTest", fields=("name", "price"), searched=("name",))
+ITEMS = CatalogIndex(
+    "items", "inventory.Item",
+    fields=("name", "sku", "barcode", "unit", "price"),
+    searched=("name", "sku"),
+    exact=("barcode", "sku"),
+    text=lambda row: f"{row['name']} ({row['sku'] or 'no-sku'})",
+)
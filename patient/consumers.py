@@ -1,18 +1,75 @@
 from channels.generic.websocket import AsyncWebsocketConsumer
+from channels.db import database_sync_to_async
+from urllib.parse import parse_qs
 import json
 
+from clinicmanager import tenancy
+from . import live_queue
+
 
 class QueueConsumer(AsyncWebsocketConsumer):
     async def connect(self):
-        self.group_name = "patients"
+        subscription = await self.get_subscription()
+        if subscription is None:
+            await self.close()
+            return
+        self.group_name, snapshot = subscription
         await self.channel_layer.group_add(self.group_name, self.channel_name)
         print("WebSocket connection established.")
         await self.accept()
+        # Current counts up front; deltas follow as queue_state events
+        await self.send(text_data=json.dumps(snapshot))
 
     async def disconnect(self, close_code):
-        await self.channel_layer.group_discard(self.group_name, self.channel_name)
+        if getattr(self, "group_name", None):
+            await self.channel_layer.group_discard(self.group_name, self.channel_name)
 
     async def patient_alert(self, event):
         message = event['message']
         print(f"Sending patient alert: {message}")
-        await self.send(text_data=json.dumps({'message': message}))
\ No newline at end of file
+        await self.send(text_data=json.dumps({'message': message}))
+
+    async def queue_state(self, event):
+        await self.send(text_data=json.dumps(event))
+
+    @database_sync_to_async
+    def get_subscription(self):
+        """
+        Clinic-wide group by default, or one doctor's group with ?doctor=<id>.
+        Both receive every event for that doctor.
+        """
+        from .models import Doctor, Queue
+        user = self.scope.get("user")
+        clinic = tenancy.user_clinic(user) if user else None
+        if clinic is None:
+            return None
+        scopes = [f"clinic:{clinic.id}"]
+        doctor_id = parse_qs(self.scope["query_string"].decode()).get("doctor", [""])[0]
+        if doctor_id.isdigit() and Doctor.objects.filter(id=doctor_id, clinic=clinic).exists():
+            scopes.append(live_queue.owner_scope(Queue, clinic.id, int(doctor_id)))
+        snapshot = {"type": "queue_state", "table": "patient.queue", **live_queue.snapshot(Queue, scopes)}
+        return live_queue.group_name(Queue, scopes[-1]), snapshot
+
+
+class SpeechJobConsumer(AsyncWebsocketConsumer):
+    """Streams a dictation job's status until it is done or failed."""
+
+    async def connect(self):
+        from . import dictation
+        self.job_id = self.scope["url_route"]["kwargs"]["job_id"]
+        job = await dictation.aget_job(self.job_id)
+        user = self.scope.get("user")
+        if job is None or user is None or not user.is_authenticated or job["user_id"] != user.pk:
+            await self.close()
+            return
+        self.group_name = dictation.group_name(self.job_id)
+        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        await self.accept()
+        await self.send(text_data=json.dumps(dictation.public(job)))
+
+    async def disconnect(self, close_code):
+        if getattr(self, "group_name", None):
+            await self.channel_layer.group_discard(self.group_name, self.channel_name)
+
+    async def speech_job(self, event):
+        await self.send(text_data=json.dumps(event["job"]))
@@ -0,0 +1,408 @@
+"""
+Dictated consultations: a speech transcript is turned into a Consultation
+by an LLM, off the request path.
+
+submit() records a job (a SpeechJob row) and returns at once. The
+extraction runs on a per-process event loop thread, at most
+SPEECH_CONCURRENCY jobs at a time, so doctors dictating together never tie
+up request workers. Clients follow a job by polling its status
+(views.speech_job_status) or over the ws/speech-jobs/<id>/ socket
+(consumers.SpeechJobConsumer); only the user who submitted it may.
+
+The extraction backend is pluggable: settings.SPEECH_BACKEND is the
+dotted path of a class with an async extract(transcript) method that
+returns data shaped like consultation_schema.json. A backend that also
+has an async stream(transcript) generator of JSON text chunks is streamed:
+each top-level section (clinical_details, vitals, ...) is published on the
+job as soon as it is complete, so the page fills in progressively.
+StubBackend is a deterministic offline backend for tests and benchmarks.
+
+Extractions are cached in the database (TranscriptExtraction), keyed by
+a hash of the whitespace- and case-normalized transcript and the schema
+version, for EXTRACTION_TTL. A resent transcript is answered from
+there, and one already being extracted in this process is awaited, not
+sent again.
+
+Jobs are stored in the database, so any process can report on them, but
+they run in the process that accepted them. If that process exits, its
+unfinished jobs stay "queued" or "running" until purge_jobs() removes
+them after JOB_TTL.
+"""
+import asyncio
+import datetime
+import hashlib
+import json
+import re
+import threading
+import uuid
+
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db.models import F, Q
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+JOB_TTL = 60 * 60
+EXTRACTION_TTL = getattr(settings, "EXTRACTION_CACHE_TTL", 60 * 60 * 24 * 7)
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+with open(settings.BASE_DIR / "consultation_schema.json") as f:
+    SCHEMA = json.load(f)
+SCHEMA_VERSION = hashlib.sha256(json.dumps(SCHEMA, sort_keys=True).encode()).hexdigest()[:16]
+
+SYSTEM_PROMPT = (
+    "Extract consultation data from speech transcript into JSON schema. "
+    f"Only return valid JSON matching this exact schema:{json.dumps(SCHEMA)}. "
+    "Focus on medical details from speech."
+)
+
+# Consultation fields the schema may fill, by section
+SECTIONS = {
+    section: tuple(spec.get("properties", {}))
+    for section, spec in SCHEMA["properties"].items()
+}
+
+
+class OpenAIBackend:
+    """Extraction with the OpenAI chat completions API in JSON mode."""
+
+    model = "gpt-4o-mini"
+
+    def __init__(self):
+        from openai import AsyncOpenAI
+
+        self.client = AsyncOpenAI()
+
+    async def extract(self, transcript):
+        response = await self.client.chat.completions.create(
+            model=self.model,
+            messages=[
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": f"Extract from: {transcript}"},
+            ],
+            temperature=0.1,
+            response_format={"type": "json_object"},
+        )
+        return json.loads(response.choices[0].message.content)
+
+    async def stream(self, transcript):
+        response = await self.client.chat.completions.create(
+            model=self.model,
+            messages=[
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": f"Extract from: {transcript}"},
+            ],
+            temperature=0.1,
+            response_format={"type": "json_object"},
+            stream=True,
+        )
+        async for chunk in response:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+
+class StubBackend:
+    """
+    Offline backend: the transcript becomes the chief complaint and the
+    other sections come back empty, after `delay` seconds of simulated
+    round-trip time (spread over the chunks when streamed).
+    """
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+
+    def result(self, transcript):
+        data = {section: {} for section in SECTIONS}
+        data["clinical_details"] = {"chief_complaints": transcript}
+        return data
+
+    async def extract(self, transcript):
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        return self.result(transcript)
+
+    async def stream(self, transcript):
+        text = json.dumps(self.result(transcript))
+        chunks = [text[i:i + 16] for i in range(0, len(text), 16)]
+        for chunk in chunks:
+            if self.delay:
+                await asyncio.sleep(self.delay / len(chunks))
+            yield chunk
+
+
+class SectionParser:
+    """
+    Incremental reader of a streamed JSON object. feed() takes the next
+    chunk of text and returns the top-level (key, value) pairs completed
+    by it; result() parses the whole object once the stream has ended.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self._scanned = 0
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._member_start = None
+
+    def feed(self, chunk):
+        self.text += chunk
+        completed = []
+        for pos in range(self._scanned, len(self.text)):
+            char = self.text[pos]
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char in "{[":
+                self._depth += 1
+                if self._depth == 1:
+                    self._member_start = pos + 1
+            elif self._depth == 1 and char in ",}":
+                completed += self._member(self.text[self._member_start:pos])
+                self._member_start = pos + 1
+                if char == "}":
+                    self._depth = 0
+            elif char in "}]":
+                self._depth -= 1
+        self._scanned = len(self.text)
+        return completed
+
+    @staticmethod
+    def _member(text):
+        if not text.strip():
+            return []
+        return list(json.loads("{" + text + "}").items())
+
+    def result(self):
+        return json.loads(self.text)
+
+
+_backend = None
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        _backend = import_string(getattr(settings, "SPEECH_BACKEND", "patient.dictation.OpenAIBackend"))()
+    return _backend
+
+
+def set_backend(backend):
+    """Replaces this process's backend, e.g. with a StubBackend in tests."""
+    global _backend
+    _backend = backend
+
+
+class JobRunner:
+    """An event loop on a daemon thread that runs at most `concurrency` jobs at once."""
+
+    def __init__(self, concurrency):
+        self.concurrency = concurrency
+        self._loop = None
+        self._semaphore = None
+        self._lock = threading.Lock()
+
+    def _ensure_started(self):
+        # Started on first use rather than at import, so it survives forking servers
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="speech-jobs", daemon=True).start()
+                self._semaphore = asyncio.Semaphore(self.concurrency)
+                self._loop = loop
+        return self._loop
+
+    def submit(self, coroutine):
+        """Schedules `coroutine` on the runner's loop; returns a concurrent.futures.Future."""
+        return asyncio.run_coroutine_threadsafe(self._bounded(coroutine), self._ensure_started())
+
+    async def _bounded(self, coroutine):
+        async with self._semaphore:
+            return await coroutine
+
+
+runner = JobRunner(getattr(settings, "SPEECH_CONCURRENCY", 4))
+
+
+def group_name(job_id):
+    return f"speech-job-{job_id}"
+
+
+# A job as a dict, the shape run() and public() work with
+JOB_FIELDS = ("id", "status", "patient_id", "doctor_id", "user_id", "consultation_id", "error", "sections", "cached")
+
+
+def get_job(job_id):
+    """The job with `job_id` as a dict, or None if there is none (or it is older than JOB_TTL)."""
+    from .models import SpeechJob
+
+    fresh = timezone.now() - datetime.timedelta(seconds=JOB_TTL)
+    return SpeechJob.objects.filter(pk=job_id, updated_at__gt=fresh).values(*JOB_FIELDS).first()
+
+
+aget_job = database_sync_to_async(get_job)
+
+
+def purge_jobs():
+    """Deletes jobs untouched for JOB_TTL, including any orphaned by an exited process. Returns the count."""
+    from .models import SpeechJob
+
+    return SpeechJob.objects.filter(updated_at__lte=timezone.now() - datetime.timedelta(seconds=JOB_TTL)).delete()[0]
+
+
+def transcript_key(transcript):
+    """The cache address of `transcript`'s extraction under the current schema."""
+    normalized = re.sub(r"\s+", " ", transcript).strip().lower()
+    return hashlib.sha256(f"{SCHEMA_VERSION}\n{normalized}".encode()).hexdigest()
+
+
+@database_sync_to_async
+def _cached_extraction(key):
+    from .models import TranscriptExtraction
+
+    extractions = TranscriptExtraction.objects.filter(key=key, expires_at__gt=timezone.now())
+    result = extractions.values_list("result", flat=True).first()
+    if result is not None:
+        extractions.update(hits=F("hits") + 1)
+    return result
+
+
+@database_sync_to_async
+def _remember_extraction(key, result):
+    from .models import TranscriptExtraction
+
+    TranscriptExtraction.objects.update_or_create(key=key, defaults={
+        "schema_version": SCHEMA_VERSION,
+        "result": result,
+        "expires_at": timezone.now() + datetime.timedelta(seconds=EXTRACTION_TTL),
+    })
+
+
+def purge_extractions():
+    """Deletes expired cached extractions and those made for another schema. Returns the count."""
+    from .models import TranscriptExtraction
+
+    stale = TranscriptExtraction.objects.filter(
+        Q(expires_at__lte=timezone.now()) | ~Q(schema_version=SCHEMA_VERSION)
+    )
+    return stale.delete()[0]
+
+
+def submit(transcript, *, patient, user):
+    """Queues the extraction of `transcript` into a new consultation for `patient`, for `user`. Returns the job."""
+    from .models import SpeechJob
+
+    row = SpeechJob.objects.create(id=uuid.uuid4().hex, patient=patient, doctor_id=patient.doctor_id, user=user)
+    job = {name: getattr(row, name) for name in JOB_FIELDS}
+    job["future"] = runner.submit(run(dict(job), transcript))
+    return job
+
+
+# Extractions running in this process, by transcript_key(); only touched on the runner's loop
+_in_flight = {}
+
+
+async def run(job, transcript):
+    key = transcript_key(transcript)
+    try:
+        await _update(job, status=RUNNING)
+        data = await _cached_extraction(key)
+        if data is not None:
+            await _update(job, sections=data, cached=True)
+        else:
+            data = await _extract_once(job, key, transcript)
+        consultation_id = await _create_consultation(job, data)
+        if not job["cached"]:
+            # Only once it has produced a consultation, so a bad result is not replayed
+            await _remember_extraction(key, data)
+    except Exception as e:
+        print(f"Speech job {job['id']} failed:", e)
+        await _update(job, status=FAILED, error=str(e))
+    else:
+        await _update(job, status=DONE, consultation_id=consultation_id)
+    return job
+
+
+async def _extract_once(job, key, transcript):
+    """Extracts `transcript`, or waits for the same extraction if it is already running."""
+    task = _in_flight.get(key)
+    if task is not None:
+        data = await asyncio.shield(task)
+        await _update(job, sections=data)
+        return data
+    task = asyncio.ensure_future(_extract(job, transcript))
+    _in_flight[key] = task
+    try:
+        return await asyncio.shield(task)
+    finally:
+        _in_flight.pop(key, None)
+
+
+async def _extract(job, transcript):
+    backend = get_backend()
+    if not hasattr(backend, "stream"):
+        data = await backend.extract(transcript)
+        await _update(job, sections=data)
+        return data
+    parser = SectionParser()
+    async for chunk in backend.stream(transcript):
+        completed = parser.feed(chunk)
+        if completed:
+            await _update(job, sections={**job["sections"], **dict(completed)})
+    return parser.result()
+
+
+@database_sync_to_async
+def _save_job(job_id, changes):
+    from .models import SpeechJob
+
+    SpeechJob.objects.filter(pk=job_id).update(**changes, updated_at=timezone.now())
+
+
+async def _update(job, **changes):
+    job.update(changes)
+    await _save_job(job["id"], changes)
+    channel_layer = get_channel_layer()
+    if channel_layer is not None:
+        await channel_layer.group_send(group_name(job["id"]), {"type": "speech_job", "job": public(job)})
+
+
+def consultation_fields(data):
+    """Consultation field values from extracted data, keeping only schema fields that were filled in."""
+    fields = {}
+    for section, names in SECTIONS.items():
+        values = data.get(section) or {}
+        if not isinstance(values, dict):
+            continue
+        fields.update({name: values[name] for name in names if values.get(name) not in (None, "")})
+    return fields
+
+
+@database_sync_to_async
+def _create_consultation(job, data):
+    from .models import Consultation
+
+    consultation = Consultation.objects.create(
+        **consultation_fields(data), patient_id=job["patient_id"], doctor_id=job["doctor_id"]
+    )
+    return consultation.id
+
+
+def public(job):
+    """The job as returned to clients."""
+    data = {key: job[key] for key in ("id", "status", "patient_id", "consultation_id", "sections", "cached")}
+    data["error"] = job["error"] or None
+    data["edit_url"] = (
+        reverse("edit_consultation", args=[job["patient_id"], job["consultation_id"]])
+        if job["consultation_id"] else None
+    )
+    return data
@@ -0,0 +1,253 @@
+"""
+PDF documents: consultation notes and lab reports.
+
+WeasyPrint runs in a pool of PDF_WORKERS worker processes, so rendering
+uses every core and never holds a request worker's GIL. Each worker builds
+its font configuration once. It also keeps in memory every stylesheet or
+image it fetches by URL (the templates link Bootstrap from a CDN), so
+PDF_PRELOAD_URLS are fetched once when the worker starts rather than on
+every render.
+
+Finished PDFs are stored under PDF_CACHE_DIR, named by a hash of the
+rendered HTML. A document whose content has not changed is read back
+from disk instead of being rendered again. `manage.py purge_pdf_cache`
+removes old files.
+
+render() returns one PDF. render_many() yields PDFs as they finish, and
+zip_response() streams them to the client as a ZIP archive.
+"""
+import hashlib
+import io
+import multiprocessing
+import os
+import threading
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from django.template.loader import render_to_string
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+RENDERER_VERSION = "1"  # bump to retire every cached PDF after a rendering change
+PRELOAD_URLS = (
+    "https://cdn.jsdelivr.net/npm/bootstrap@5.3.3/dist/css/bootstrap.min.css",
+    "https://cdn.jsdelivr.net/npm/bootstrap@5.3.2/dist/css/bootstrap.min.css",
+)
+
+
+# --- worker processes ------------------------------------------------------
+
+_font_config = None
+_fetched = {}
+
+
+def _init_worker(preload_urls):
+    global _font_config
+    from weasyprint.text.fonts import FontConfiguration
+
+    _font_config = FontConfiguration()
+    for url in preload_urls:
+        try:
+            _fetch(url)
+        except Exception as e:
+            print(f"PDF worker could not preload {url}:", e)
+
+
+def _fetch(url, *args, **kwargs):
+    """WeasyPrint url_fetcher that keeps remote resources for the life of the worker."""
+    from weasyprint import default_url_fetcher
+
+    if not url.startswith(("http://", "https://")):
+        return default_url_fetcher(url, *args, **kwargs)
+    if url not in _fetched:
+        resource = default_url_fetcher(url, *args, **kwargs)
+        if "file_obj" in resource:
+            resource["string"] = resource.pop("file_obj").read()
+        _fetched[url] = resource
+    return dict(_fetched[url])
+
+
+def _render(html, base_url):
+    from weasyprint import HTML
+
+    return HTML(string=html, base_url=base_url, url_fetcher=_fetch).write_pdf(font_config=_font_config)
+
+
+# --- pool and disk cache ---------------------------------------------------
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn, not fork: request workers are threaded and forking them is unsafe
+            _pool = ProcessPoolExecutor(
+                max_workers=getattr(settings, "PDF_WORKERS", 2),
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(tuple(getattr(settings, "PDF_PRELOAD_URLS", PRELOAD_URLS)),),
+            )
+        return _pool
+
+
+def _discard_pool(pool):
+    """Drops a pool that lost a worker (e.g. killed for memory) so the next render starts a new one."""
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _cache_dir():
+    return str(getattr(settings, "PDF_CACHE_DIR", settings.BASE_DIR / "pdf_cache"))
+
+
+def _cache_path(html, base_url):
+    digest = hashlib.sha256(f"{RENDERER_VERSION}\n{base_url or ''}\n{html}".encode()).hexdigest()
+    return os.path.join(_cache_dir(), digest[:2], f"{digest}.pdf")
+
+
+def _read(path):
+    try:
+        with open(path, "rb") as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+def _write(path, pdf):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temporary, "wb") as f:
+        f.write(pdf)
+    os.replace(temporary, path)
+
+
+def render(html, base_url=None):
+    """The PDF for `html`, from the disk cache or the worker pool."""
+    return next(render_many([(None, html, base_url)]))[1]
+
+
+def render_many(documents):
+    """
+    (name, pdf) for each (name, html, base_url) in `documents`. Cached
+    PDFs come first, then the rest in the order the workers finish them.
+    """
+    cached, pending = [], {}
+    pool = None
+    for name, html, base_url in documents:
+        path = _cache_path(html, base_url)
+        pdf = _read(path)
+        if pdf is not None:
+            cached.append((name, pdf))
+        else:
+            pool = pool or _get_pool()
+            pending[pool.submit(_render, html, base_url)] = (name, path)
+    yield from cached
+    for future in as_completed(pending):
+        name, path = pending[future]
+        try:
+            pdf = future.result()
+        except BrokenProcessPool:
+            _discard_pool(pool)
+            raise
+        _write(path, pdf)
+        yield name, pdf
+
+
+def purge_cache(older_than):
+    """Deletes cached PDFs written more than `older_than` seconds ago. Returns the count."""
+    cutoff = time.time() - older_than
+    deleted = 0
+    for directory, _, files in os.walk(_cache_dir()):
+        for filename in files:
+            path = os.path.join(directory, filename)
+            if os.stat(path).st_mtime < cutoff:
+                os.remove(path)
+                deleted += 1
+    return deleted
+
+
+# --- ZIP streaming ---------------------------------------------------------
+
+class _Sink(io.RawIOBase):
+    """A write-only stream whose contents are handed on (drained) as they are written."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def zip_stream(named_pdfs):
+    """The bytes of a ZIP archive of (name, pdf) pairs, produced as each PDF arrives."""
+    sink = _Sink()
+    # PDFs are already compressed; storing them keeps the archive cheap to build
+    with zipfile.ZipFile(sink, "w", zipfile.ZIP_STORED) as archive:
+        for name, pdf in named_pdfs:
+            archive.writestr(name, pdf)
+            yield sink.drain()
+    yield sink.drain()
+
+
+def zip_response(named_pdfs, filename):
+    response = StreamingHttpResponse(zip_stream(named_pdfs), content_type="application/zip")
+    response["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return response
+
+
+# --- documents -------------------------------------------------------------
+
+def export_selection(queryset, params, *, id_field, date_field):
+    """
+    (queryset, label) for a bulk export: the rows whose `id_field` is in
+    ?ids=1,2,3, or else every row on ?date= (today by default, or if it is
+    not a date).
+    """
+    ids = [int(part) for part in params.get("ids", "").split(",") if part.strip().isdigit()]
+    if ids:
+        return queryset.filter(**{f"{id_field}__in": ids}), "selected"
+    try:
+        day = parse_date(params.get("date") or "")
+    except ValueError:  # well formed but impossible, e.g. 2024-13-45
+        day = None
+    day = day or timezone.localdate()
+    return queryset.filter(**{f"{date_field}__date": day}), day.isoformat()
+
+
+def consultation_html(consultation):
+    return render_to_string("patient/consultation_pdf.html", {"consultation": consultation})
+
+
+def consultation_filename(consultation):
+    return f"consultation_{consultation.patient.name.replace(' ', '_')}_{consultation.id}.pdf"
+
+
+def lab_results_html(consultation, results):
+    return render_to_string("emr/results_pdf.html", {
+        "results": results,
+        "consultation": consultation,
+        "reported_at": max((result.result_date for result in results), default=None),
+    })
+
+
+def lab_results_filename(consultation_id):
+    return f"lab_results_{consultation_id}.pdf"
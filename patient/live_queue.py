@@ -0,0 +1,187 @@
+"""
+Live queue counts for Queue and LabQueue.
+
+Per-status counts are kept in the cache and adjusted as rows are saved or
+deleted, then pushed to the dashboards through the queue consumers. The
+count endpoints read the same cache, so no request runs COUNT(*) unless
+the counters have expired and need reseeding. Rows moved to the archive
+tables by `manage.py archive_queues` are still counted, so archiving never
+changes a dashboard's completed/skipped totals.
+
+Dashboards listen on a per-clinic group ("patients.clinic.3") or, for a
+single doctor or lab, on that owner's group within the clinic
+("patients.clinic.3.doctor.5"); every event is sent to both. Labs are
+shared between clinics, so an owner's group only ever carries one
+clinic's rows.
+"""
+from collections import Counter
+
+from asgiref.sync import async_to_sync
+from django.apps import apps
+from channels.layers import get_channel_layer
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count
+
+# Counters are reseeded from the database when they expire, so any drift heals itself
+COUNTS_TIMEOUT = 60 * 60
+
+# model label -> (field the per-owner counts are kept for, channel group prefix)
+TRACKED = {
+    "patient.queue": ("doctor", "patients"),
+    "emr.labqueue": ("lab", "lab_notifications"),
+}
+# model label -> where archive_closed_queue_rows moves its closed rows
+ARCHIVES = {
+    "patient.queue": "patient.QueueArchive",
+    "emr.labqueue": "emr.LabQueueArchive",
+}
+
+
+def _statuses(model):
+    return [value for value, _ in model.STATUS_CHOICES]
+
+
+def _key(model, scope, status):
+    return f"queue-counts:{model._meta.label_lower}:{scope}:{status}"
+
+
+def _scope_filter(scope):
+    if scope == "all":
+        return {}
+    filters = {}
+    parts = scope.split(":")
+    for field, value in zip(parts[::2], parts[1::2]):
+        filters.update({f"{field}__isnull": True} if value == "0" else {f"{field}_id": int(value)})
+    return filters
+
+
+def _seed(model, scope):
+    counts = Counter(dict.fromkeys(_statuses(model), 0))
+    for source in (model, apps.get_model(ARCHIVES[model._meta.label_lower])):
+        counts.update(dict(
+            source.objects.filter(**_scope_filter(scope)).order_by()
+            .values_list("status").annotate(n=Count("id"))
+        ))
+    cache.set_many({_key(model, scope, status): n for status, n in counts.items()}, COUNTS_TIMEOUT)
+    return dict(counts)
+
+
+def clinic_scope(clinic):
+    """The counts scope for `clinic`; a scope with no rows when there is none."""
+    return f"clinic:{clinic.pk if clinic else 0}"
+
+
+def owner_scope(model, clinic_id, owner_id):
+    """The counts scope for one doctor's or lab's rows in a clinic, e.g. "clinic:3:lab:2"."""
+    owner_field, _ = TRACKED[model._meta.label_lower]
+    return f"clinic:{clinic_id}:{owner_field}:{owner_id or 0}"
+
+
+def get_counts(model, scope="all"):
+    """
+    Returns {status: count} for `scope` ("all", "clinic:<id>" or an owner_scope()).
+    """
+    keys = {_key(model, scope, status): status for status in _statuses(model)}
+    cached = cache.get_many(keys)
+    if len(cached) < len(keys):
+        return _seed(model, scope)
+    return {keys[key]: n for key, n in cached.items()}
+
+
+def row_state(instance):
+    """(clinic_id, owner_id, status) as loaded, or None if a column was deferred."""
+    owner_field, _ = TRACKED[instance._meta.label_lower]
+    values = instance.__dict__
+    if "status" not in values or "clinic_id" not in values or f"{owner_field}_id" not in values:
+        return None
+    return values["clinic_id"], values[f"{owner_field}_id"], values["status"]
+
+
+def _scopes(model, state):
+    clinic_id, owner_id, _ = state
+    return ["all", f"clinic:{clinic_id}", owner_scope(model, clinic_id, owner_id)]
+
+
+def rows_changed(model, changes):
+    """
+    Records (before, after) row states, where either side may be None for an
+    insert or delete. Counters are adjusted and the clinics' dashboards
+    notified once the surrounding transaction commits.
+    """
+    deltas = Counter()
+    routes = {}  # clinic_id -> scopes its dashboards should hear about
+    for before, after in changes:
+        for state, sign in ((before, -1), (after, 1)):
+            if state:
+                scopes = _scopes(model, state)
+                # Rows without an owner ("lab:0") are only announced clinic-wide
+                routes.setdefault(state[0], set()).update(s for s in scopes[1:] if not s.endswith(":0"))
+                for scope in scopes:
+                    deltas[(scope, state[2])] += sign
+    deltas = {change: n for change, n in deltas.items() if n}
+    if deltas:
+        transaction.on_commit(lambda: _apply(model, deltas, routes))
+
+
+def row_saved(instance, created):
+    model = type(instance)
+    before = None if created else getattr(instance, "_live_state", None)
+    after = row_state(instance)
+    instance._live_state = after
+    if after is None or (before is None and not created):
+        # Partially loaded row: we can't tell what changed, so recount on next read
+        scopes = _scopes(model, after) if after else ["all"]
+        cache.delete_many([_key(model, scope, status) for scope in scopes for status in _statuses(model)])
+        return
+    rows_changed(model, [(before, after)])
+
+
+def row_deleted(instance):
+    before = getattr(instance, "_live_state", None)
+    if before:
+        rows_changed(type(instance), [(before, None)])
+
+
+def _apply(model, deltas, routes):
+    stale = set()
+    for (scope, status), n in deltas.items():
+        if scope in stale:
+            continue
+        try:
+            cache.incr(_key(model, scope, status), n)
+        except ValueError:
+            # Counter expired: the committed rows already include this change
+            stale.add(scope)
+    for scope in stale:
+        _seed(model, scope)
+
+    for clinic_id, scopes in routes.items():
+        changed = [(scope, status, n) for (scope, status), n in deltas.items() if scope in scopes]
+        if not changed:
+            continue
+        touched = sorted({scope for scope, _, _ in changed})
+        event = {
+            "type": "queue_state",
+            "table": model._meta.label_lower,
+            "kind": "delta",
+            "deltas": [{"scope": scope, "status": status, "change": n} for scope, status, n in changed],
+            "counts": {scope: get_counts(model, scope) for scope in touched},
+        }
+        send_to_groups(model, touched, event)
+
+
+def snapshot(model, scopes):
+    return {"kind": "snapshot", "counts": {scope: get_counts(model, scope) for scope in scopes}}
+
+
+def group_name(model, scope):
+    """Channel group for one scope, e.g. "patients.clinic.3" or "lab_notifications.clinic.3.lab.2"."""
+    _, base = TRACKED[model._meta.label_lower]
+    return f"{base}.{scope.replace(':', '.')}"
+
+
+def send_to_groups(model, scopes, event):
+    channel_layer = get_channel_layer()
+    for scope in scopes:
+        async_to_sync(channel_layer.group_send)(group_name(model, scope), event)
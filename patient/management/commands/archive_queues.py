@@ -0,0 +1,24 @@
+# patient/management/commands/archive_queues.py
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from emr.models import LabQueue, LabQueueArchive
+from patient.models import Queue, QueueArchive
+from patient.services import archive_closed_queue_rows
+
+
+class Command(BaseCommand):
+    help = "Move completed/skipped doctor and lab queue rows older than N days into the archive tables"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=30)
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        for model, archive_model in [(Queue, QueueArchive), (LabQueue, LabQueueArchive)]:
+            moved = archive_closed_queue_rows(
+                model, archive_model, older_than=cutoff, batch_size=options['batch_size']
+            )
+            self.stdout.write(self.style.SUCCESS(f'Archived {moved} {model.__name__} rows.'))
@@ -0,0 +1,108 @@
+# patient/management/commands/bench_channel_fanout.py
+import asyncio
+import multiprocessing
+import socket
+import statistics
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+def _dashboard_worker(redis_url, group, dashboards, messages, ready, results):
+    """One worker process holding `dashboards` websocket-like channels in `group`."""
+    from channels_redis.core import RedisChannelLayer
+
+    async def run():
+        layer = RedisChannelLayer(hosts=[redis_url])
+        channels = [await layer.new_channel() for _ in range(dashboards)]
+        for channel in channels:
+            await layer.group_add(group, channel)
+        ready.put(True)
+
+        async def listen(channel):
+            latencies = []
+            for _ in range(messages):
+                event = await layer.receive(channel)
+                latencies.append(time.time() - event["sent"])
+            return latencies
+
+        received = await asyncio.gather(*(listen(channel) for channel in channels))
+        results.put([latency for latencies in received for latency in latencies])
+        await layer.flush()
+
+    asyncio.run(run())
+
+
+class Command(BaseCommand):
+    help = "Measure group_send fan-out latency to many dashboards spread over several worker processes"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--redis-url', default=settings.REDIS_URL or None)
+        parser.add_argument('--fake', action='store_true',
+                            help='Run against an in-process fakeredis TCP server instead of a real Redis')
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument('--dashboards', type=int, default=500, help='Total connected dashboards')
+        parser.add_argument('--messages', type=int, default=50, help='Queue events to broadcast')
+        parser.add_argument('--interval', type=float, default=0.05, help='Seconds between events')
+
+    def handle(self, *args, **options):
+        redis_url = options['redis_url']
+        if options['fake']:
+            redis_url = self._start_fake_redis()
+        if not redis_url:
+            raise CommandError('Pass --redis-url (or set REDIS_URL), or use --fake.')
+
+        from channels_redis.core import RedisChannelLayer
+
+        workers, messages = options['workers'], options['messages']
+        shares = [options['dashboards'] // workers + (1 if i < options['dashboards'] % workers else 0)
+                  for i in range(workers)]
+        group = f"bench.fanout.{uuid.uuid4().hex[:12]}"
+        ready, results = multiprocessing.Queue(), multiprocessing.Queue()
+        processes = [
+            multiprocessing.Process(
+                target=_dashboard_worker, args=(redis_url, group, share, messages, ready, results)
+            )
+            for share in shares
+        ]
+        for process in processes:
+            process.start()
+        for _ in processes:
+            ready.get(timeout=120)
+
+        async def publish():
+            layer = RedisChannelLayer(hosts=[redis_url])
+            for _ in range(messages):
+                await layer.group_send(group, {"type": "queue_state", "sent": time.time()})
+                await asyncio.sleep(options['interval'])
+            await layer.flush()
+
+        asyncio.run(publish())
+        latencies = sorted(l for _ in processes for l in results.get(timeout=300))
+        for process in processes:
+            process.join()
+
+        expected = sum(shares) * messages
+        self.stdout.write(f'{len(latencies)}/{expected} deliveries to {sum(shares)} dashboards '
+                          f'over {workers} worker processes')
+        self.stdout.write('fan-out latency p50={:.1f}ms p95={:.1f}ms p99={:.1f}ms max={:.1f}ms'.format(
+            statistics.median(latencies) * 1000,
+            latencies[int(len(latencies) * 0.95) - 1] * 1000,
+            latencies[int(len(latencies) * 0.99) - 1] * 1000,
+            latencies[-1] * 1000,
+        ))
+
+    def _start_fake_redis(self):
+        try:
+            from fakeredis import TcpFakeServer
+        except ImportError:
+            raise CommandError('--fake needs fakeredis[lua] (pip install "fakeredis[lua]").')
+        with socket.socket() as probe:
+            probe.bind(('127.0.0.1', 0))
+            port = probe.getsockname()[1]
+        server = TcpFakeServer(('127.0.0.1', port), server_type='redis')
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return f'redis://127.0.0.1:{port}'
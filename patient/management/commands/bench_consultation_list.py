@@ -0,0 +1,96 @@
+# patient/management/commands/bench_consultation_list.py
+import datetime
+import json
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+from clinicmanager.models import Clinic
+from patient.models import CONSULTATION_NOTES_FIELDS, Consultation, Patient
+
+WORDS = ('patient reports intermittent pain fever cough history of hypertension diabetes no known allergies '
+         'examination unremarkable tenderness noted advised review counselled medication adherence').split()
+
+
+class Command(BaseCommand):
+    help = "Seed consultations with narrative notes and compare list queries reading full rows vs the slim default"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clinic', type=int, help='Clinic id (defaults to the first clinic)')
+        parser.add_argument('--consultations', type=int, default=200000)
+        parser.add_argument('--note-words', type=int, default=120, help='Average words per narrative field')
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        clinic = Clinic.objects.filter(id=options['clinic']).first() if options['clinic'] else Clinic.objects.first()
+        if clinic is None:
+            raise CommandError('No clinic to run against.')
+        patient = Patient.objects.create(
+            clinic=clinic, name='Benchmark Consultation Patient', date_of_birth=datetime.date(1990, 1, 1), phone_number='0'
+        )
+        try:
+            started = time.perf_counter()
+            self._seed(patient, options['consultations'], options['note_words'])
+            self.stdout.write(f'Seeded {options["consultations"]} consultations in {time.perf_counter() - started:.1f}s')
+            if connection.vendor == 'postgresql':
+                with connection.cursor() as cursor:
+                    cursor.execute(f'ANALYZE {connection.ops.quote_name(Consultation._meta.db_table)}')
+            self._report(clinic, options['repeat'])
+        finally:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f'DELETE FROM {connection.ops.quote_name(Consultation._meta.db_table)} WHERE patient_id = %s',
+                    [patient.id],
+                )
+            patient.delete()
+
+    def _seed(self, patient, total, note_words, batch_size=2000):
+        now = timezone.now()
+
+        def note():
+            return ' '.join(random.choices(WORDS, k=random.randint(note_words // 2, note_words * 3 // 2)))
+
+        for offset in range(0, total, batch_size):
+            Consultation.objects.bulk_create([
+                Consultation(
+                    patient=patient, date=now - datetime.timedelta(minutes=i),
+                    **{field: note() for field in CONSULTATION_NOTES_FIELDS},
+                )
+                for i in range(offset, min(offset + batch_size, total))
+            ])
+
+    def _time(self, queryset, repeat):
+        samples = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            list(queryset.all())  # a fresh clone, not the cached results
+            samples.append((time.perf_counter() - started) * 1000)
+        return statistics.median(samples)
+
+    def _buffers(self, queryset):
+        """(shared hit, shared read) blocks from EXPLAIN (ANALYZE, BUFFERS); Postgres only."""
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {sql}', params)
+            plan = cursor.fetchone()[0]
+        plan = (json.loads(plan) if isinstance(plan, str) else plan)[0]['Plan']
+        return plan.get('Shared Hit Blocks', 0), plan.get('Shared Read Blocks', 0)
+
+    def _report(self, clinic, repeat):
+        base = Consultation.objects.for_clinic(clinic).select_related('patient', 'doctor').order_by('-date')
+        cases = {
+            'list page 1 (10 rows)': lambda qs: qs[:10],
+            'deep list page (10 rows)': lambda qs: qs[5000:5010],
+            'export scan (5000 rows)': lambda qs: qs[:5000],
+        }
+        for name, page in cases.items():
+            full = page(base.with_notes())
+            slim = page(base)
+            line = (f'{name:<28} full {self._time(full, repeat):8.2f}ms   '
+                    f'slim {self._time(slim, repeat):8.2f}ms')
+            if connection.vendor == 'postgresql':
+                line += '   buffers hit/read full {}/{} slim {}/{}'.format(*self._buffers(full), *self._buffers(slim))
+            self.stdout.write(line)
@@ -0,0 +1,88 @@
+# patient/management/commands/bench_patient_search.py
+import datetime
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from clinicmanager.models import Clinic
+from patient.models import Patient
+from patient.search import search_patients
+
+FIRST_NAMES = ['Amina', 'Baraka', 'Chebet', 'Daudi', 'Esther', 'Faith', 'Grace', 'Hassan', 'Imani', 'Juma',
+               'Kamau', 'Lydia', 'Mwangi', 'Njeri', 'Otieno', 'Purity', 'Rehema', 'Salim', 'Wanjiru', 'Zawadi']
+LAST_NAMES = ['Achieng', 'Barasa', 'Chege', 'Kariuki', 'Kiprono', 'Mutua', 'Njoroge', 'Odhiambo', 'Omondi',
+              'Onyango', 'Wafula', 'Wambui', 'Kilonzo', 'Mohamed', 'Ndungu', 'Ruto', 'Kimani', 'Atieno']
+MARKER = 'bench_patient_search'
+
+
+class Command(BaseCommand):
+    help = "Seed patients and time the typeahead patient search (name, misspelt name, phone, date of birth)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clinic', type=int, help='Clinic id (defaults to the first clinic)')
+        parser.add_argument('--patients', type=int, default=1000000)
+        parser.add_argument('--repeat', type=int, default=50)
+
+    def handle(self, *args, **options):
+        clinic = Clinic.objects.filter(id=options['clinic']).first() if options['clinic'] else Clinic.objects.first()
+        if clinic is None:
+            raise CommandError('No clinic to run against.')
+        try:
+            started = time.perf_counter()
+            names = self._seed(clinic, options['patients'])
+            self.stdout.write(f'Seeded {options["patients"]} patients in {time.perf_counter() - started:.1f}s')
+            if connection.vendor == 'postgresql':
+                with connection.cursor() as cursor:
+                    cursor.execute(f'ANALYZE {connection.ops.quote_name(Patient._meta.db_table)}')
+            self._report(clinic, names, options['repeat'])
+        finally:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f'DELETE FROM {connection.ops.quote_name(Patient._meta.db_table)} WHERE address = %s', [MARKER]
+                )
+
+    def _seed(self, clinic, total, batch_size=10000):
+        names = []
+        born = datetime.date(1940, 1, 1)
+        for offset in range(0, total, batch_size):
+            batch = []
+            for i in range(offset, min(offset + batch_size, total)):
+                name = f'{random.choice(FIRST_NAMES)} {random.choice(LAST_NAMES)} {random.choice(LAST_NAMES)}{i % 997}'
+                names.append(name)
+                batch.append(Patient(
+                    clinic=clinic, name=name, address=MARKER,
+                    date_of_birth=born + datetime.timedelta(days=random.randrange(30000)),
+                    phone_number=f'07{random.randrange(10 ** 8):08d}',
+                ))
+            Patient.objects.bulk_create(batch)
+        return names
+
+    def _time(self, clinic, queries):
+        samples = []
+        for query in queries:
+            started = time.perf_counter()
+            list(search_patients(query, clinic=clinic))
+            samples.append((time.perf_counter() - started) * 1000)
+        samples.sort()
+        return statistics.median(samples), samples[int(len(samples) * 0.95) - 1]
+
+    def _report(self, clinic, names, repeat):
+        picks = random.sample(names, min(repeat, len(names)))
+
+        def misspell(name):
+            i = random.randrange(1, len(name) - 1)
+            return name[:i] + name[i + 1:]
+
+        cases = {
+            'name prefix (4 chars)': [name[:4] for name in picks],
+            'full name': picks,
+            'surname': [name.split()[1] for name in picks],
+            'misspelt name': [misspell(name) for name in picks],
+            'phone prefix': [f'07{random.randrange(10 ** 4):04d}' for _ in picks],
+            'date of birth': [f'{random.randrange(1940, 2020)}-{random.randrange(1, 13):02d}' for _ in picks],
+        }
+        for name, queries in cases.items():
+            p50, p95 = self._time(clinic, queries)
+            self.stdout.write(f'{name:<25} p50 {p50:8.2f}ms   p95 {p95:8.2f}ms')
@@ -0,0 +1,80 @@
+# patient/management/commands/bench_queue_dashboard.py
+import datetime
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from clinicmanager.models import Clinic
+from patient.models import Doctor, Patient, Queue
+
+
+class Command(BaseCommand):
+    help = "Time the active-queue dashboard queries while historical queue rows pile up"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clinic', type=int, help='Clinic id (defaults to the first clinic)')
+        parser.add_argument('--steps', default='0,10000,100000,1000000',
+                            help='Comma separated historical row counts to measure at')
+        parser.add_argument('--active', type=int, default=25, help='Rows waiting in the queue')
+        parser.add_argument('--repeat', type=int, default=50)
+
+    def handle(self, *args, **options):
+        clinic = Clinic.objects.filter(id=options['clinic']).first() if options['clinic'] else Clinic.objects.first()
+        if clinic is None:
+            raise CommandError('No clinic to run against.')
+        steps = sorted(int(s) for s in options['steps'].split(','))
+
+        doctor = Doctor.objects.create(clinic=clinic, name='Benchmark')
+        patient = Patient.objects.create(
+            clinic=clinic, name='Benchmark Patient', date_of_birth=datetime.date(1990, 1, 1), phone_number='0'
+        )
+        try:
+            today = timezone.localdate()
+            Queue.objects.bulk_create([
+                Queue(clinic=clinic, doctor=doctor, patient=patient, queue_number=n, queue_date=today)
+                for n in range(1, options['active'] + 1)
+            ])
+
+            seeded = 0
+            for step in steps:
+                self._seed_history(clinic, doctor, patient, seeded, step)
+                seeded = step
+                timings = self._time_dashboard(doctor, options['repeat'])
+                self.stdout.write(f'{step:>9} historical rows: ' + '  '.join(
+                    f'{name} {ms:.2f}ms' for name, ms in timings.items()
+                ))
+        finally:
+            Queue.objects.filter(doctor=doctor).delete()
+            doctor.delete()
+            patient.delete()
+
+    def _seed_history(self, clinic, doctor, patient, start, stop, batch_size=10000):
+        # 500 completed visits a day, going back in time
+        first_day = timezone.localdate() - datetime.timedelta(days=1)
+        for offset in range(start, stop, batch_size):
+            Queue.objects.bulk_create([
+                Queue(
+                    clinic=clinic, doctor=doctor, patient=patient, status='completed',
+                    queue_date=first_day - datetime.timedelta(days=i // 500), queue_number=i % 500 + 1,
+                )
+                for i in range(offset, min(offset + batch_size, stop))
+            ])
+
+    def _time_dashboard(self, doctor, repeat):
+        queries = {
+            'doctor_detail': lambda: list(
+                Queue.objects.filter(doctor=doctor, status__in=["waiting", "in_progress", "fromLab"])
+                .order_by("queue_date", "queue_number")
+            ),
+            'queue_count': lambda: Queue.objects.filter(status__in=['in_progress', 'waiting']).count(),
+        }
+        timings = {}
+        for name, query in queries.items():
+            samples = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                query()
+                samples.append((time.perf_counter() - started) * 1000)
+            timings[name] = statistics.median(samples)
+        return timings
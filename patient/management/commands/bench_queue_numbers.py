@@ -0,0 +1,61 @@
+# patient/management/commands/bench_queue_numbers.py
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from clinicmanager.models import Clinic
+from patient.models import QueueCounter
+from patient.services import allocate_queue_numbers
+
+
+class Command(BaseCommand):
+    help = "Fire parallel enqueues at the queue number allocator and check for gaps/duplicates"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clinic', type=int, help='Clinic id (defaults to the first clinic)')
+        parser.add_argument('--workers', type=int, default=16)
+        parser.add_argument('--enqueues', type=int, default=500, help='Total allocations to fire')
+
+    def handle(self, *args, **options):
+        clinic = Clinic.objects.filter(id=options['clinic']).first() if options['clinic'] else Clinic.objects.first()
+        if clinic is None:
+            raise CommandError('No clinic to run against.')
+
+        scope = f"bench:{uuid.uuid4().hex[:12]}"
+        total = options['enqueues']
+        workers = options['workers']
+
+        def desk(share):
+            # One reception desk: its own connection, enqueueing back to back
+            results = []
+            try:
+                for _ in range(share):
+                    started = time.perf_counter()
+                    with transaction.atomic():
+                        number = allocate_queue_numbers(clinic_id=clinic.id, scope=scope)[0]
+                    results.append((number, time.perf_counter() - started))
+            finally:
+                connection.close()
+            return results
+
+        shares = [total // workers + (1 if i < total % workers else 0) for i in range(workers)]
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            results = [r for desk_results in pool.map(desk, shares) for r in desk_results]
+        elapsed = time.perf_counter() - started
+
+        QueueCounter.objects.filter(clinic=clinic, scope=scope).delete()
+
+        numbers = sorted(n for n, _ in results)
+        latencies = sorted(t for _, t in results)
+        if numbers != list(range(1, total + 1)):
+            duplicates = total - len(set(numbers))
+            raise CommandError(f'Sequence broken: {duplicates} duplicates, max={numbers[-1]} for {total} enqueues.')
+
+        self.stdout.write(f'{total} enqueues over {workers} workers in {elapsed:.2f}s '
+                          f'({total / elapsed:.0f}/s)')
+        self.stdout.write(f'latency p50={latencies[total // 2] * 1000:.1f}ms '
+                          f'p95={latencies[int(total * 0.95) - 1] * 1000:.1f}ms')
+        self.stdout.write(self.style.SUCCESS('No gaps or duplicates.'))
@@ -0,0 +1,86 @@
+# patient/management/commands/bench_speech_jobs.py
+import concurrent.futures
+import datetime
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from clinicmanager.models import Clinic
+from patient import dictation
+from patient.models import Consultation, Patient, SpeechJob, TranscriptExtraction
+
+
+class CountingBackend(dictation.StubBackend):
+    """StubBackend that records how many extractions were in flight at once."""
+
+    def __init__(self, delay):
+        super().__init__(delay)
+        self.in_flight = 0
+        self.peak = 0
+        self.calls = 0
+
+    async def stream(self, transcript):
+        self.in_flight += 1
+        self.calls += 1
+        self.peak = max(self.peak, self.in_flight)
+        try:
+            async for chunk in super().stream(transcript):
+                yield chunk
+        finally:
+            self.in_flight -= 1
+
+
+class Command(BaseCommand):
+    help = ("Submit dictation jobs against the stub LLM backend, then resubmit the same transcripts, "
+            "and time submission and completion")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clinic', type=int, help='Clinic id (defaults to the first clinic)')
+        parser.add_argument('--jobs', type=int, default=40)
+        parser.add_argument('--latency', type=float, default=0.5, help='Simulated LLM round-trip in seconds')
+        parser.add_argument('--concurrency', type=int, default=4)
+
+    def handle(self, *args, **options):
+        clinic = Clinic.objects.filter(id=options['clinic']).first() if options['clinic'] else Clinic.objects.first()
+        if clinic is None:
+            raise CommandError('No clinic to run against.')
+        patient = Patient.objects.create(
+            clinic=clinic, name='Benchmark Dictation Patient', date_of_birth=datetime.date(1990, 1, 1), phone_number='0'
+        )
+        backend = CountingBackend(options['latency'])
+        dictation.set_backend(backend)
+        dictation.runner = dictation.JobRunner(options['concurrency'])
+        transcripts = [f'benchmark dictation {i}: fever and cough for three days' for i in range(options['jobs'])]
+        try:
+            self._round('first submission', transcripts, patient, backend, options)
+            # Resent with different spacing and case: served from the extraction cache
+            self._round('resubmission', [f'  {t.upper()} ' for t in transcripts], patient, backend, options)
+        finally:
+            dictation.set_backend(None)
+            TranscriptExtraction.objects.filter(key__in=[dictation.transcript_key(t) for t in transcripts]).delete()
+            SpeechJob.objects.filter(patient=patient).delete()
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f'DELETE FROM {connection.ops.quote_name(Consultation._meta.db_table)} WHERE patient_id = %s',
+                    [patient.id],
+                )
+            patient.delete()
+
+    def _round(self, name, transcripts, patient, backend, options):
+        calls = backend.calls
+        submit_ms, futures = [], []
+        started = time.perf_counter()
+        for transcript in transcripts:
+            submitted = time.perf_counter()
+            futures.append(dictation.submit(transcript, patient=patient, user=patient.clinic.created_by)['future'])
+            submit_ms.append((time.perf_counter() - submitted) * 1000)
+        jobs = [future.result() for future in concurrent.futures.as_completed(futures)]
+        elapsed = time.perf_counter() - started
+
+        done = sum(job['status'] == dictation.DONE for job in jobs)
+        self.stdout.write(f'{name}: {done}/{len(jobs)} jobs done in {elapsed:.2f}s '
+                          f'(serial extraction would take {len(jobs) * options["latency"]:.2f}s), '
+                          f'{backend.calls - calls} LLM calls, {sum(job["cached"] for job in jobs)} cache hits')
+        self.stdout.write(f'  submit latency median {statistics.median(submit_ms):.2f}ms, max {max(submit_ms):.2f}ms')
+        self.stdout.write(f'  peak extractions in flight {backend.peak} (limit {options["concurrency"]})')
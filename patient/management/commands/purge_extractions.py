@@ -0,0 +1,13 @@
+# patient/management/commands/purge_extractions.py
+from django.core.management.base import BaseCommand
+from patient.dictation import purge_extractions, purge_jobs
+
+
+class Command(BaseCommand):
+    help = ("Delete cached transcript extractions that have expired or were made for an older consultation schema, "
+            "and speech jobs older than an hour")
+
+    def handle(self, *args, **options):
+        deleted = purge_extractions()
+        jobs = purge_jobs()
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} cached extractions and {jobs} speech jobs.'))
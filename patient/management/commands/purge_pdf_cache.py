@@ -0,0 +1,14 @@
+# patient/management/commands/purge_pdf_cache.py
+from django.core.management.base import BaseCommand
+from patient.documents import purge_cache
+
+
+class Command(BaseCommand):
+    help = "Delete cached consultation and lab report PDFs rendered more than N days ago"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=30)
+
+    def handle(self, *args, **options):
+        deleted = purge_cache(options['days'] * 24 * 60 * 60)
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} cached PDFs.'))
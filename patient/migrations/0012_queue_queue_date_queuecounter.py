@@ -0,0 +1,75 @@
+# Generated by Django 5.1.1 on 2026-10-18 10:17
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import Count, Max
+from django.db.models.functions import TruncDate
+
+
+def backfill_queue_numbers(apps, schema_editor):
+    Queue = apps.get_model("patient", "Queue")
+    QueueCounter = apps.get_model("patient", "QueueCounter")
+
+    Queue.objects.update(queue_date=TruncDate("created_at"))
+
+    # Old count()+1 numbering produced duplicates; renumber those days in arrival order
+    groups = (
+        Queue.objects.values("clinic_id", "doctor_id", "queue_date")
+        .annotate(rows=Count("id"), numbers=Count("queue_number", distinct=True))
+    )
+    for group in groups:
+        if group["rows"] == group["numbers"]:
+            continue
+        rows = Queue.objects.filter(
+            clinic_id=group["clinic_id"], doctor_id=group["doctor_id"], queue_date=group["queue_date"]
+        ).order_by("created_at", "id")
+        for number, row in enumerate(rows, start=1):
+            if row.queue_number != number:
+                Queue.objects.filter(pk=row.pk).update(queue_number=number)
+
+    # Continue today's sequences where the old numbering left off
+    today = django.utils.timezone.localdate()
+    QueueCounter.objects.bulk_create([
+        QueueCounter(
+            clinic_id=row["clinic_id"], scope=f"doctor:{row['doctor_id']}",
+            day=row["queue_date"], value=row["last"],
+        )
+        for row in Queue.objects.filter(queue_date__gte=today)
+        .values("clinic_id", "doctor_id", "queue_date")
+        .annotate(last=Max("queue_number"))
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clinicmanager', '0005_alter_clinicbankdetails_bank_name'),
+        ('patient', '0011_alter_queue_unique_together'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='queue',
+            name='queue_date',
+            field=models.DateField(default=django.utils.timezone.localdate, editable=False),
+        ),
+        migrations.CreateModel(
+            name='QueueCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('scope', models.CharField(max_length=50)),
+                ('day', models.DateField()),
+                ('value', models.PositiveIntegerField(default=0)),
+                ('clinic', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='queue_counters', to='clinicmanager.clinic')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('clinic', 'scope', 'day'), name='uniq_queue_counter_scope_day')],
+            },
+        ),
+        migrations.RunPython(backfill_queue_numbers, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='queue',
+            unique_together={('clinic', 'doctor', 'queue_date', 'queue_number')},
+        ),
+    ]
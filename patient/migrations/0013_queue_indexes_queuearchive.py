@@ -0,0 +1,54 @@
+# Generated by Django 5.1.1 on 2026-10-18 10:18
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clinicmanager', '0005_alter_clinicbankdetails_bank_name'),
+        ('patient', '0012_queue_queue_date_queuecounter'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QueueArchive',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('queue_number', models.PositiveIntegerField()),
+                ('queue_date', models.DateField()),
+                ('status', models.CharField(choices=[('waiting', 'Waiting'), ('in_progress', 'In Progress'), ('completed', 'Completed'), ('skipped', 'Skipped'), ('inlab', 'In Lab'), ('fromLab', 'From Lab')], max_length=20)),
+                ('created_at', models.DateTimeField()),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('completed_at', models.DateTimeField(blank=True, null=True)),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['created_at'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='queue',
+            index=models.Index(condition=models.Q(('status__in', ['waiting', 'in_progress', 'inlab', 'fromLab'])), fields=['doctor', 'status', 'queue_date', 'queue_number'], name='queue_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='queue',
+            index=models.Index(fields=['status', 'created_at'], name='queue_status_created_idx'),
+        ),
+        migrations.AddField(
+            model_name='queuearchive',
+            name='clinic',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='clinicmanager.clinic'),
+        ),
+        migrations.AddField(
+            model_name='queuearchive',
+            name='doctor',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='patient.doctor'),
+        ),
+        migrations.AddField(
+            model_name='queuearchive',
+            name='patient',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_queues', to='patient.patient'),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.1.1 on 2026-10-18 10:37
+
+import django.contrib.postgres.indexes
+import django.db.models.functions.text
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations, models
+
+PATIENT_SEARCH_INDEXES = [
+    django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass('name', name='gin_trgm_ops'), name='patient_name_trgm_idx'),
+    django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('name'), name='gin_trgm_ops'), name='patient_name_upper_trgm_idx'),
+    models.Index(django.contrib.postgres.indexes.OpClass('phone_number', name='varchar_pattern_ops'), name='patient_phone_prefix_idx'),
+]
+
+
+# GIN / operator-class indexes only exist on Postgres. They are kept out of
+# the migration state, so later migrations that rebuild the table on sqlite
+# never try to recreate them there.
+def add_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    Patient = apps.get_model('patient', 'Patient')
+    for index in PATIENT_SEARCH_INDEXES:
+        schema_editor.add_index(Patient, index)
+
+
+def remove_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    Patient = apps.get_model('patient', 'Patient')
+    for index in PATIENT_SEARCH_INDEXES:
+        schema_editor.remove_index(Patient, index)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clinicmanager', '0005_alter_clinicbankdetails_bank_name'),
+        ('patient', '0013_queue_indexes_queuearchive'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.RunPython(add_search_indexes, remove_search_indexes),
+        migrations.AddIndex(
+            model_name='patient',
+            index=models.Index(fields=['date_of_birth'], name='patient_dob_idx'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.1.1 on 2026-10-18 10:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clinicmanager', '0005_alter_clinicbankdetails_bank_name'),
+        ('patient', '0014_patient_search_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='patient',
+            index=models.Index(fields=['clinic', 'date_registered'], name='patient_clinic_registered_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='queue',
+            index=models.Index(fields=['clinic', 'created_at'], name='queue_clinic_created_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.1.1 on 2026-10-18 10:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patient', '0015_clinic_created_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='consultation',
+            index=models.Index(fields=['-date', 'id'], name='consultation_recent_idx'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.1.1 on 2026-10-18 10:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patient', '0016_consultation_recent_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TranscriptExtraction',
+            fields=[
+                ('key', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('schema_version', models.CharField(max_length=16)),
+                ('result', models.JSONField()),
+                ('hits', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('expires_at', models.DateTimeField(db_index=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.1.1 on 2026-10-18 10:58
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_open_bills(apps, schema_editor):
+    """Points every patient at their newest unpaid bill and counts their bills, in two UPDATEs."""
+    Patient = apps.get_model("patient", "Patient")
+    Bill = apps.get_model("billing", "Bill")
+    bills = Bill.objects.filter(patient=OuterRef("pk")).order_by()
+    Patient.objects.update(
+        open_bill=Subquery(bills.filter(is_paid=False).order_by("-created_at").values("id")[:1]),
+    )
+    Patient.objects.update(
+        visit_count=Coalesce(Subquery(bills.values("patient").annotate(n=Count("id")).values("n")), Value(0)),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing', '0008_bill_open_patient_idx'),
+        ('patient', '0017_transcriptextraction'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='patient',
+            name='open_bill',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='billing.bill'),
+        ),
+        migrations.AddField(
+            model_name='patient',
+            name='visit_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_open_bills, migrations.RunPython.noop),
+    ]
@@ -1,10 +1,28 @@
 from django.db import models
 from authentication.models import User
 from clinicmanager.models import Clinic
+from clinicmanager.tenancy import ClinicManager, ClinicQuerySet
 from django.utils import timezone
 
 # starting
 
+# Queue rows in these states are still on someone's dashboard; the rest are history
+ACTIVE_QUEUE_STATUSES = ["waiting", "in_progress", "inlab", "fromLab"]
+CLOSED_QUEUE_STATUSES = ["completed", "skipped"]
+
+# Consultation's free-text narrative, deferred by Consultation.objects so that
+# lists and joins read only the short columns (id, date, patient, doctor, vitals)
+CONSULTATION_NOTES_FIELDS = (
+    "chief_complaints", "history_of_presenting_illness", "past_medical_history", "past_surgical_history",
+    "drug_allergies", "current_medication", "comorbid_factors", "general_examination", "image_findings",
+    "lab_findings", "diagnosis", "medication", "sexual_history", "family_planning_history", "vaccination_history",
+)
+
+
+def consultation_notes(prefix):
+    """The narrative fields as lookups from another model, e.g. defer(*consultation_notes("consultation__"))."""
+    return [prefix + field for field in CONSULTATION_NOTES_FIELDS]
+
 
 class Doctor(models.Model):
     clinic = models.ForeignKey(Clinic, on_delete=models.CASCADE, related_name="doctors", null=True, blank=True)
@@ -13,6 +31,8 @@ class Doctor(models.Model):
     phone_number = models.CharField(max_length=20, blank=True, null=True)
     email = models.EmailField(blank=True, null=True)
 
+    objects = ClinicManager()
+
     def __str__(self):
         return f"Dr. {self.name}"
 
@@ -34,12 +54,45 @@ class Patient(models.Model):
         Doctor, on_delete=models.SET_NULL, null=True, blank=True, related_name="patients"
     )
     date_registered = models.DateTimeField(auto_now_add=True)
+    # Kept by billing.services: the current visit's unpaid bill (cleared once
+    # paid) and how many bills the patient has had, for the return-visit fee
+    open_bill = models.ForeignKey(
+        "billing.Bill", on_delete=models.SET_NULL, null=True, blank=True, editable=False, related_name="+"
+    )
+    visit_count = models.PositiveIntegerField(default=0, editable=False)
+
+    objects = ClinicManager()
+
+    class Meta:
+        # patient.search is also served by trigram indexes for name similarity
+        # (name %> q) and substring (UPPER(name) LIKE, i.e. icontains) lookups,
+        # and a pattern index for phone number prefixes. They are Postgres
+        # only, so migration 0014 creates them there and they are left out of
+        # the model state: sqlite rebuilds tables from that state.
+        indexes = [
+            models.Index(fields=["date_of_birth"], name="patient_dob_idx"),
+            models.Index(fields=["clinic", "date_registered"], name="patient_clinic_registered_idx"),
+        ]
 
     def __str__(self):
         return f"{self.name}"
 
 
 
+class ConsultationQuerySet(ClinicQuerySet):
+    def with_notes(self, *fields):
+        """Loads the narrative fields the default manager defers: all of them, or just `fields`."""
+        queryset = self.defer(None)
+        if fields:
+            queryset = queryset.defer(*(f for f in CONSULTATION_NOTES_FIELDS if f not in fields))
+        return queryset
+
+
+class ConsultationManager(models.Manager.from_queryset(ConsultationQuerySet)):
+    def get_queryset(self):
+        return super().get_queryset().defer(*CONSULTATION_NOTES_FIELDS)
+
+
 class Consultation(models.Model):
     MANAGEMENT_CHOICES = [
         ("supportive", "Supportive"),
@@ -120,9 +173,24 @@ class Consultation(models.Model):
     vaccination_history = models.TextField(blank=True, null=True)
     labor_charges = models.DecimalField(max_digits=10, decimal_places=2, default=0)
 
+    clinic_lookup = "patient__clinic"
+    objects = ConsultationManager()
+
+    class Meta:
+        indexes = [
+            # Lists are newest first; walking this index avoids sorting the table
+            models.Index(fields=["-date", "id"], name="consultation_recent_idx"),
+        ]
+
     def __str__(self):
         return f"Consultation for {self.patient.name} on {self.date.strftime('%Y-%m-%d')}"
 
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        # Reading one deferred note loads all of them, in one query rather than one each
+        if fields and set(fields) & set(CONSULTATION_NOTES_FIELDS):
+            fields = set(fields) | (self.get_deferred_fields() & set(CONSULTATION_NOTES_FIELDS))
+        super().refresh_from_db(using=using, fields=fields, from_queryset=from_queryset)
+
 
 
 
@@ -140,19 +208,32 @@ class Queue(models.Model):
     doctor = models.ForeignKey(Doctor, on_delete=models.CASCADE, related_name="queues")
     patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name="queues")
     queue_number = models.PositiveIntegerField()
+    queue_date = models.DateField(default=timezone.localdate, editable=False)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="waiting")
     created_at = models.DateTimeField(auto_now_add=True)
     started_at = models.DateTimeField(null=True, blank=True)
     completed_at = models.DateTimeField(null=True, blank=True)
 
+    objects = ClinicManager()
+
     class Meta:
         ordering = ["created_at"]  # oldest first
-        # unique_together = ("clinic", "doctor", "queue_number")  # avoid duplicate queue numbers
+        unique_together = ("clinic", "doctor", "queue_date", "queue_number")  # numbers restart daily
+        indexes = [
+            models.Index(
+                fields=["doctor", "status", "queue_date", "queue_number"], name="queue_active_idx",
+                condition=models.Q(status__in=ACTIVE_QUEUE_STATUSES),
+            ),
+            models.Index(fields=["status", "created_at"], name="queue_status_created_idx"),
+            models.Index(fields=["clinic", "created_at"], name="queue_clinic_created_idx"),
+        ]
 
     def save(self, *args, **kwargs):
         if not self.queue_number:
-            last = Queue.objects.filter(doctor=self.doctor, clinic=self.clinic).order_by("-queue_number").first()
-            self.queue_number = last.queue_number + 1 if last else 1
+            from .services import allocate_queue_numbers, doctor_scope
+            self.queue_number = allocate_queue_numbers(
+                clinic_id=self.clinic_id, scope=doctor_scope(self.doctor_id), day=self.queue_date
+            )[0]
         super().save(*args, **kwargs)
 
 
@@ -170,3 +251,94 @@ class Queue(models.Model):
         self.status = "completed"
         self.completed_at = timezone.now()
         self.save()
+
+
+class QueueArchive(models.Model):
+    """
+    Completed/skipped Queue rows moved out of the hot table by `manage.py archive_queues`.
+    Keeps the original primary key.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    clinic = models.ForeignKey(Clinic, on_delete=models.CASCADE, related_name="+")
+    doctor = models.ForeignKey(Doctor, on_delete=models.CASCADE, related_name="+")
+    patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name="archived_queues")
+    queue_number = models.PositiveIntegerField()
+    queue_date = models.DateField()
+    status = models.CharField(max_length=20, choices=Queue.STATUS_CHOICES)
+    created_at = models.DateTimeField()
+    started_at = models.DateTimeField(null=True, blank=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["created_at"]
+
+    def __str__(self):
+        return f"#{self.queue_number} on {self.queue_date} ({self.status})"
+
+
+class QueueCounter(models.Model):
+    """
+    Per-(clinic, doctor/lab, day) queue number sequence.
+    Bumped with a single upsert in patient.services.allocate_queue_numbers,
+    so concurrent desks never scan Queue/LabQueue to find the next number.
+    """
+    clinic = models.ForeignKey(Clinic, on_delete=models.CASCADE, related_name="queue_counters")
+    scope = models.CharField(max_length=50)  # e.g. "doctor:12", "lab:3"
+    day = models.DateField()
+    value = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["clinic", "scope", "day"], name="uniq_queue_counter_scope_day"),
+        ]
+
+    def __str__(self):
+        return f"{self.clinic_id}/{self.scope}/{self.day} = {self.value}"
+
+
+class TranscriptExtraction(models.Model):
+    """
+    A cached LLM extraction, addressed by a hash of the normalized
+    transcript and the consultation schema version (see patient.dictation).
+    A resent transcript reuses the result instead of paying for another
+    LLM call. Expired rows are removed by `manage.py purge_extractions`.
+    """
+    key = models.CharField(max_length=64, primary_key=True)
+    schema_version = models.CharField(max_length=16)
+    result = models.JSONField()
+    hits = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"{self.key[:12]} (schema {self.schema_version})"
+
+
+class SpeechJob(models.Model):
+    """
+    A dictated consultation being extracted (see patient.dictation). Kept in
+    the database rather than the cache, so any worker process can report on
+    a job whichever one is running it. Old jobs are removed by
+    `manage.py purge_extractions`.
+    """
+    STATUS_CHOICES = [
+        ("queued", "Queued"),
+        ("running", "Running"),
+        ("done", "Done"),
+        ("failed", "Failed"),
+    ]
+    id = models.CharField(max_length=32, primary_key=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default="queued")
+    patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name="+")
+    doctor = models.ForeignKey(Doctor, on_delete=models.SET_NULL, null=True, blank=True, related_name="+")
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="+")
+    consultation = models.ForeignKey(Consultation, on_delete=models.SET_NULL, null=True, blank=True, related_name="+")
+    error = models.TextField(blank=True)
+    sections = models.JSONField(default=dict)
+    cached = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    def __str__(self):
+        return f"{self.id} ({self.status})"
@@ -3,4 +3,5 @@ from . import consumers
 
 websocket_urlpatterns = [
     re_path(r'ws/patients/$', consumers.QueueConsumer.as_asgi()),
+    re_path(r'ws/speech-jobs/(?P<job_id>[0-9a-f]+)/$', consumers.SpeechJobConsumer.as_asgi()),
 ]
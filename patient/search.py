@@ -0,0 +1,112 @@
+"""
+Patient search shared by every patient lookup (lists, typeaheads, Select2
+widgets and lab filters).
+
+A query is read as one of:
+  - a phone number ("0712 345", "+254712..."): prefix match on phone_number
+  - a date of birth ("1990", "1990-05", "1990-05-17", "17/05/1990"): match on date_of_birth
+  - anything else: a name, matched by substring and, on Postgres, by
+    trigram word similarity so typos still find the patient
+
+On Postgres the name lookups are served by the pg_trgm GIN indexes on
+Patient.name and phone prefixes by a varchar_pattern_ops index (created
+by migration 0014); other databases fall back to plain LIKE scans.
+"""
+import calendar
+import datetime
+import re
+
+from django.db import connection
+from django.db.models import Case, FloatField, Q, Value, When
+
+from .models import Patient
+
+# Local numbers are entered as 07.. or +2547..; search for both forms
+COUNTRY_CODE = "+254"
+
+_PHONE = re.compile(r"^\+?[\d\s-]{3,}$")
+_ISO_DATE = re.compile(r"^((?:19|20)\d{2})(?:-(\d{1,2})(?:-(\d{1,2}))?)?$")
+_DMY_DATE = re.compile(r"^(\d{1,2})[/.](\d{1,2})[/.]((?:19|20)\d{2})$")
+
+
+def _trigram_enabled():
+    return connection.vendor == "postgresql"
+
+
+def _dob_range(query):
+    """(first, last) date of birth covered by a year / month / day query, or None."""
+    match = _ISO_DATE.match(query)
+    try:
+        if match:
+            year, month, day = (int(part) if part else None for part in match.groups())
+            if day:
+                first = last = datetime.date(year, month, day)
+            elif month:
+                first = datetime.date(year, month, 1)
+                last = datetime.date(year, month, calendar.monthrange(year, month)[1])
+            else:
+                first, last = datetime.date(year, 1, 1), datetime.date(year, 12, 31)
+            return first, last
+        match = _DMY_DATE.match(query)
+        if match:
+            day, month, year = (int(part) for part in match.groups())
+            first = datetime.date(year, month, day)
+            return first, first
+    except ValueError:
+        return None
+    return None
+
+
+def patient_q(query, prefix=""):
+    """
+    Q matching patients for `query`. `prefix` points at the patient from
+    another model, e.g. patient_q(q, "patient__") on Consultation or
+    patient_q(q, "consultation__patient__") on LabResult.
+    """
+    query = (query or "").strip()
+    if not query:
+        return Q()
+
+    dob = _dob_range(query)
+    if dob:
+        return Q(**{f"{prefix}date_of_birth__range": dob})
+
+    if _PHONE.match(query):
+        digits = re.sub(r"[\s-]", "", query)
+        q = Q(**{f"{prefix}phone_number__startswith": digits})
+        if digits.startswith("0"):
+            q |= Q(**{f"{prefix}phone_number__startswith": COUNTRY_CODE + digits[1:]})
+        elif digits.startswith(COUNTRY_CODE):
+            q |= Q(**{f"{prefix}phone_number__startswith": "0" + digits[len(COUNTRY_CODE):]})
+        return q
+
+    q = Q(**{f"{prefix}name__icontains": query})
+    if _trigram_enabled() and len(query) >= 3:
+        q |= Q(**{f"{prefix}name__trigram_word_similar": query})
+    return q
+
+
+def search_patients(query, *, clinic=None, limit=20):
+    """
+    Patients of `clinic` matching `query`, best match first: exact name,
+    then name prefix, then by trigram word similarity (Postgres) or name.
+    Like for_clinic(), no clinic matches no patients.
+    """
+    patients = Patient.objects.for_clinic(clinic).filter(patient_q(query))
+    query = (query or "").strip()
+    if not query:
+        return patients.none()
+
+    prefix_rank = Case(
+        When(name__iexact=query, then=Value(2.0)),
+        When(name__istartswith=query, then=Value(1.0)),
+        default=Value(0.0),
+        output_field=FloatField(),
+    )
+    if _trigram_enabled():
+        from django.contrib.postgres.search import TrigramWordSimilarity
+
+        patients = patients.annotate(rank=prefix_rank + TrigramWordSimilarity(query, "name"))
+    else:
+        patients = patients.annotate(rank=prefix_rank)
+    return patients.order_by("-rank", "name", "id")[:limit]
@@ -0,0 +1,60 @@
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import QueueCounter, CLOSED_QUEUE_STATUSES
+
+
+def doctor_scope(doctor_id):
+    return f"doctor:{doctor_id}"
+
+
+def lab_scope(lab_id):
+    # Lab queue rows are often created before a lab is assigned
+    return f"lab:{lab_id or 0}"
+
+
+def allocate_queue_numbers(*, clinic_id, scope, count=1, day=None):
+    """
+    Reserves `count` consecutive queue numbers for (clinic, scope, day) and returns them.
+
+    A single INSERT ... ON CONFLICT DO UPDATE ... RETURNING bumps the counter row,
+    so callers never scan the queue tables and concurrent callers cannot get
+    the same number. The bump is part of the caller's transaction: a rollback
+    gives the numbers back, so the sequence stays gap-free.
+    """
+    day = day or timezone.localdate()
+    table = connection.ops.quote_name(QueueCounter._meta.db_table)
+    sql = (
+        f"INSERT INTO {table} (clinic_id, scope, day, value) VALUES (%s, %s, %s, %s) "
+        f"ON CONFLICT (clinic_id, scope, day) DO UPDATE SET value = {table}.value + EXCLUDED.value "
+        f"RETURNING value"
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [clinic_id, scope, day, count])
+        last = cursor.fetchone()[0]
+    return list(range(last - count + 1, last + 1))
+
+
+def archive_closed_queue_rows(model, archive_model, *, older_than, batch_size=5000):
+    """
+    Moves completed/skipped rows created before `older_than` from `model`
+    into `archive_model`, one transaction per batch. Returns the number moved.
+    The live queue counts include archived rows, so they are left as they are.
+    """
+    columns = [f.attname for f in archive_model._meta.concrete_fields if f.attname != "archived_at"]
+    closed = model.objects.filter(status__in=CLOSED_QUEUE_STATUSES, created_at__lt=older_than).order_by()
+    table = connection.ops.quote_name(model._meta.db_table)
+    moved = 0
+    while True:
+        with transaction.atomic():
+            rows = list(closed.select_for_update(skip_locked=True).values(*columns)[:batch_size])
+            if not rows:
+                return moved
+            archive_model.objects.bulk_create([archive_model(**row) for row in rows], ignore_conflicts=True)
+            # Plain DELETE: delete signals would take the rows out of the live counts
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"DELETE FROM {table} WHERE id IN ({', '.join(['%s'] * len(rows))})",
+                    [row["id"] for row in rows],
+                )
+        moved += len(rows)
@@ -1,64 +1,94 @@
-from django.db.models.signals import post_save, pre_save
+from django.db.models.signals import post_save, pre_save, post_init, post_delete
 from django.dispatch import receiver
-from .models import Queue
+from .models import Consultation, Patient, Queue
+from . import autocomplete, live_queue, timeline
+from billing.models import Bill
 from chat.models import ChatMessage
-from webpush import send_user_notification
-from authentication.models import User  
-from channels.layers import get_channel_layer
-from asgiref.sync import async_to_sync
-from notification.models import Notification
+from notification.outbox import queue_push
 
 @receiver(post_save, sender=Queue)
-def notify_lab_queue(sender, instance, created, **kwargs):
+def notify_new_patient(sender, instance, created, **kwargs):
     if created:
-        channel_layer = get_channel_layer()
-        async_to_sync(channel_layer.group_send)(
-            "patients",  # channel group
+        live_queue.send_to_groups(
+            Queue,
+            [f"clinic:{instance.clinic_id}", live_queue.owner_scope(Queue, instance.clinic_id, instance.doctor_id)],
             {
                 "type": "patient_alert",
                 "message": f"New patient: {instance.patient.name}"
             }
         )
-        payload = {
-            "head": "New Patient Added",
-            "body": f"{instance.patient.name} added to the queue.",
-            # "icon": "/static/icons/alert.png",
-            "url": "/patients/doctors/"
-        }
-
-        user = User.objects.get(username='baharimedicalclinic')
-        # payload = {"head": "Patient Arrival!", "body": "A new patient has arrived!"}
-        send_user_notification(user=user, payload=payload, ttl=1000)
-
-        # Also create a Notification entry in the database
-        Notification.objects.create(
-            user=user,
-            title="New Patient Added",
-            body=f"{instance.patient.name} added to the queue.",
-            url="/patients/doctors/"
+        # Delivered by the push dispatcher once this transaction commits
+        queue_push(
+            "New Patient Added",
+            f"{instance.patient.name} added to the queue.",
+            "/patients/doctors/",
         )
 
 
 
+@receiver(post_init, sender=Queue)
+def remember_queue_state(sender, instance, **kwargs):
+    instance._live_state = live_queue.row_state(instance)
+
+
+@receiver(post_save, sender=Queue)
+def track_queue_counts(sender, instance, created, **kwargs):
+    live_queue.row_saved(instance, created)
+
+
+@receiver(post_delete, sender=Queue)
+def untrack_queue_counts(sender, instance, **kwargs):
+    live_queue.row_deleted(instance)
+
+
 @receiver(post_save, sender=ChatMessage)
-def notify_lab_queue(sender, instance, created, **kwargs):
+def notify_chat_message(sender, instance, created, **kwargs):
     if created:
-        
-        payload = {
-            "head": "New Message Arrived",
-            "body": f"A message has arrived for chat room {instance.room.name}",
-            # "icon": "/static/icons/alert.png",
-            "url": "/chat/"
-        }
-
-        user = User.objects.get(username='baharimedicalclinic')
-        # payload = {"head": "Patient Arrival!", "body": "A new patient has arrived!"}
-        send_user_notification(user=user, payload=payload, ttl=1000)
-
-        # Also create a Notification entry in the database
-        Notification.objects.create(
-            user=user,
-            title="New Message Arrived",
-            body=f"A message has arrived for chat room {instance.room.name}",
-            url="/chat/"
-        )
\ No newline at end of file
+        queue_push(
+            "New Message Arrived",
+            f"A message has arrived for chat room {instance.room.name}",
+            "/chat/",
+        )
+
+
+@receiver(post_save, sender=Consultation)
+@receiver(post_delete, sender=Consultation)
+@receiver(post_save, sender=Patient)
+@receiver(post_delete, sender=Patient)
+def expire_consultation_lookups(sender, **kwargs):
+    autocomplete.consultations_changed()
+
+
+@receiver(post_save, sender="inventory.Item")
+@receiver(post_delete, sender="inventory.Item")
+def reload_item_catalog(sender, **kwargs):
+    autocomplete.ITEMS.changed()
+
+
+@receiver(post_save, sender=Consultation)
+@receiver(post_delete, sender=Consultation)
+@receiver(post_save, sender="specialists.NursingNote")
+@receiver(post_delete, sender="specialists.NursingNote")
+@receiver(post_save, sender="specialists.SonographyStudy")
+@receiver(post_delete, sender="specialists.SonographyStudy")
+@receiver(post_save, sender="specialists.HomeVisit")
+@receiver(post_delete, sender="specialists.HomeVisit")
+def expire_patient_timeline(sender, instance, **kwargs):
+    timeline.patient_changed(instance.patient_id)
+
+
+@receiver(post_save, sender="prescription.Prescription")
+@receiver(post_delete, sender="prescription.Prescription")
+@receiver(post_save, sender="emr.LabResult")
+@receiver(post_delete, sender="emr.LabResult")
+def expire_consultation_timeline(sender, instance, **kwargs):
+    patient_id = getattr(instance, "patient_id", None)
+    if patient_id is None and instance.consultation_id:
+        patient_id = Consultation.objects.filter(pk=instance.consultation_id).values_list("patient_id", flat=True).first()
+    timeline.patient_changed(patient_id)
+
+
+@receiver(post_save, sender="billing.Payment")
+@receiver(post_delete, sender="billing.Payment")
+def expire_payment_timeline(sender, instance, **kwargs):
+    timeline.patient_changed(Bill.objects.filter(pk=instance.bill_id).values_list("patient_id", flat=True).first())
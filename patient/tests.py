@@ -1,3 +1,225 @@
+import datetime
+import json
+from unittest import mock
+
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
 from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from authentication.models import User
+from clinicmanager.models import Clinic
+from . import autocomplete, dictation, documents, live_queue, timeline
+from .models import Consultation, Doctor, Patient, Queue, QueueArchive, QueueCounter, SpeechJob
+from .search import search_patients
+from .services import allocate_queue_numbers, archive_closed_queue_rows, doctor_scope
+
+
+def make_clinic(name="Clinic"):
+    owner = User.objects.create_user(username=f"{name.lower()}-owner", password="x")
+    return Clinic.objects.create(name=name, created_by=owner)
+
+
+def make_patient(clinic, name="Jane Doe", **fields):
+    fields.setdefault("date_of_birth", datetime.date(1990, 5, 17))
+    fields.setdefault("phone_number", "0712345678")
+    return Patient.objects.create(clinic=clinic, name=name, **fields)
+
+
+class QueueNumberTests(TestCase):
+    def setUp(self):
+        self.clinic = make_clinic()
+        self.doctor = Doctor.objects.create(clinic=self.clinic, name="Who")
+        self.day = datetime.date(2026, 1, 5)
+
+    def test_numbers_are_consecutive_per_clinic_scope_and_day(self):
+        scope = doctor_scope(self.doctor.id)
+        self.assertEqual(allocate_queue_numbers(clinic_id=self.clinic.id, scope=scope, day=self.day), [1])
+        self.assertEqual(
+            allocate_queue_numbers(clinic_id=self.clinic.id, scope=scope, count=3, day=self.day), [2, 3, 4]
+        )
+        self.assertEqual(allocate_queue_numbers(clinic_id=self.clinic.id, scope=scope, day=self.day), [5])
+        self.assertEqual(QueueCounter.objects.get(clinic=self.clinic, scope=scope, day=self.day).value, 5)
+
+    def test_each_clinic_scope_and_day_has_its_own_sequence(self):
+        other_clinic = make_clinic("Other")
+        scope = doctor_scope(self.doctor.id)
+        allocate_queue_numbers(clinic_id=self.clinic.id, scope=scope, count=2, day=self.day)
+
+        self.assertEqual(allocate_queue_numbers(clinic_id=other_clinic.id, scope=scope, day=self.day), [1])
+        self.assertEqual(allocate_queue_numbers(clinic_id=self.clinic.id, scope="lab:0", day=self.day), [1])
+        next_day = self.day + datetime.timedelta(days=1)
+        self.assertEqual(allocate_queue_numbers(clinic_id=self.clinic.id, scope=scope, day=next_day), [1])
+
+    def test_rollback_gives_the_number_back(self):
+        scope = doctor_scope(self.doctor.id)
+        allocate_queue_numbers(clinic_id=self.clinic.id, scope=scope, day=self.day)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            allocate_queue_numbers(clinic_id=self.clinic.id, scope=scope, day=self.day)
+            raise IntegrityError
+        self.assertEqual(allocate_queue_numbers(clinic_id=self.clinic.id, scope=scope, day=self.day), [2])
+
+    def test_queue_rows_draw_their_numbers_from_the_counter(self):
+        patients = [make_patient(self.clinic, f"Patient {i}") for i in range(3)]
+        rows = [Queue.objects.create(clinic=self.clinic, doctor=self.doctor, patient=p) for p in patients]
+        self.assertEqual([row.queue_number for row in rows], [1, 2, 3])
+
+
+class LiveQueueCountTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.clinic = make_clinic()
+        self.doctor = Doctor.objects.create(clinic=self.clinic, name="Who")
+        self.scope = live_queue.clinic_scope(self.clinic)
+
+    def test_counts_follow_status_changes(self):
+        row = Queue.objects.create(clinic=self.clinic, doctor=self.doctor, patient=make_patient(self.clinic))
+        with self.captureOnCommitCallbacks(execute=True):
+            row.complete()
+        counts = live_queue.get_counts(Queue, self.scope)
+        self.assertEqual((counts["waiting"], counts["completed"]), (0, 1))
+
+    def test_archiving_does_not_change_the_completed_count(self):
+        for i in range(3):
+            row = Queue.objects.create(clinic=self.clinic, doctor=self.doctor, patient=make_patient(self.clinic, f"P{i}"))
+            with self.captureOnCommitCallbacks(execute=True):
+                row.complete()
+        self.assertEqual(live_queue.get_counts(Queue, self.scope)["completed"], 3)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            moved = archive_closed_queue_rows(Queue, QueueArchive, older_than=timezone.now())
+        self.assertEqual(moved, 3)
+        self.assertEqual(live_queue.get_counts(Queue, self.scope)["completed"], 3)
+        # Reseeded from the tables once the counters expire
+        cache.clear()
+        self.assertEqual(live_queue.get_counts(Queue, self.scope)["completed"], 3)
+
+
+class ClinicScopedSearchTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.clinic, self.other_clinic = make_clinic("Clinic"), make_clinic("Other")
+        self.patient = make_patient(self.clinic, "Amina Otieno")
+        self.other = make_patient(self.other_clinic, "Amina Wanjiru")
+        for patient in (self.patient, self.other):
+            Consultation.objects.create(patient=patient)
+
+    def test_patient_search_is_limited_to_the_clinic(self):
+        self.assertEqual(list(search_patients("Amina", clinic=self.clinic)), [self.patient])
+        self.assertEqual(list(search_patients("Amina", clinic=None)), [])
+
+    def test_consultation_search_is_limited_to_the_clinic(self):
+        rows = autocomplete.search_consultations("Amina", clinic=self.clinic)
+        self.assertEqual([row["patient_name"] for row in rows], ["Amina Otieno"])
+        self.assertEqual(autocomplete.search_consultations("Amina", clinic=None), [])
+
+    def test_consultation_search_views_need_a_login(self):
+        for name in ("ajax_consultation_search", "consultation_search"):
+            response = self.client.get(reverse(name), {"q": "Amina"})
+            self.assertEqual(response.status_code, 302, name)
+
+
+class TimelineTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.clinic = make_clinic()
+        self.patient = make_patient(self.clinic)
+        start = timezone.now()
+        # Pairs of consultations at the same moment, so the cursor has to break ties
+        for i in range(7):
+            Consultation.objects.create(patient=self.patient, date=start - datetime.timedelta(days=i // 2))
+
+    def events(self):
+        return timeline.patient_events(Patient.objects.for_clinic(self.clinic), self.patient.id)
+
+    def test_cursor_round_trip(self):
+        events = self.events()
+        pages, cursor = [], None
+        while True:
+            page, cursor = timeline.timeline_page(events, after=cursor, size=3)
+            pages.append(page)
+            if cursor is None:
+                break
+        self.assertEqual([len(page) for page in pages], [3, 3, 1])
+        self.assertEqual(sum(pages, []), events)
+        self.assertEqual(events, sorted(events, key=timeline._sort_key, reverse=True))
+
+    def test_malformed_cursor_starts_from_the_top(self):
+        events = self.events()
+        self.assertEqual(timeline.timeline_page(events, after="not-a-cursor", size=2)[0], events[:2])
+
+    def test_writes_expire_the_cached_timeline(self):
+        self.assertEqual(len(self.events()), 7)
+        with self.captureOnCommitCallbacks(execute=True):
+            Consultation.objects.create(patient=self.patient)
+        self.assertEqual(len(self.events()), 8)
+
+    def test_other_clinics_cannot_read_the_timeline(self):
+        self.events()  # cached
+        with self.assertRaises(Patient.DoesNotExist):
+            timeline.patient_events(Patient.objects.for_clinic(make_clinic("Other")), self.patient.id)
+
+
+class ExportSelectionTests(TestCase):
+    def setUp(self):
+        self.patient = make_patient(make_clinic())
+        self.consultations = [Consultation.objects.create(patient=self.patient) for _ in range(3)]
+
+    def select(self, **params):
+        queryset, label = documents.export_selection(
+            Consultation.objects.all(), params, id_field="id", date_field="date",
+        )
+        return sorted(c.id for c in queryset), label
+
+    def test_selected_ids(self):
+        ids = [c.id for c in self.consultations[:2]]
+        self.assertEqual(self.select(ids=f"{ids[0]},{ids[1]},x"), (ids, "selected"))
+
+    def test_impossible_or_missing_date_means_today(self):
+        today = timezone.localdate().isoformat()
+        everything = sorted(c.id for c in self.consultations)
+        for params in ({"date": "2024-13-45"}, {"date": "yesterday"}, {}):
+            self.assertEqual(self.select(**params), (everything, today), params)
+        self.assertEqual(self.select(date="2001-01-01"), ([], "2001-01-01"))
+
+
+# Jobs are only recorded: the coroutine that would run one is dropped unstarted
+@mock.patch.object(dictation.runner, "submit", lambda coroutine: coroutine.close())
+class SpeechJobTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.clinic = make_clinic()
+        self.user = self.clinic.created_by
+        self.clinic.staff.add(self.user)
+        self.patient = make_patient(self.clinic)
+
+    def dictate(self):
+        return self.client.post(
+            reverse("speech_to_consultation", args=[self.patient.id]),
+            json.dumps({"transcript": "fever for three days"}), content_type="application/json",
+        )
+
+    def test_dictation_needs_a_login(self):
+        self.assertEqual(self.dictate().status_code, 302)
+        self.assertFalse(SpeechJob.objects.exists())
+
+    def test_only_the_submitter_can_follow_a_job(self):
+        self.client.force_login(self.user)
+        response = self.dictate()
+        self.assertEqual(response.status_code, 202)
+        status_url = response.json()["status_url"]
+        # Read back from the database, as any other worker process would
+        cache.clear()
+        self.assertEqual(self.client.get(status_url).json()["status"], dictation.QUEUED)
+
+        colleague = User.objects.create_user(username="colleague", password="x")
+        self.clinic.staff.add(colleague)
+        self.client.force_login(colleague)
+        self.assertEqual(self.client.get(status_url).status_code, 404)
+        self.client.logout()
+        self.assertEqual(self.client.get(status_url).status_code, 302)
 
-# Create your tests here.
+    def test_other_clinics_patients_cannot_be_dictated_for(self):
+        self.client.force_login(make_clinic("Other").created_by)
+        self.assertEqual(self.dictate().status_code, 404)
@@ -0,0 +1,167 @@
+"""
+A patient's history as one chronological stream of events.
+
+Consultations, lab results, prescriptions, nursing notes, sonography
+studies, home visits and payments are loaded with a fixed number of
+queries (one per event type, through prefetch_related), however long the
+history. The merged, newest-first stream is cached per patient until one
+of those records is written (see patient.signals) and served a page at a
+time with an opaque cursor.
+"""
+import base64
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Prefetch
+
+from billing.models import Bill, Payment
+from emr.models import LabResult
+from prescription.models import Prescription
+from specialists.models import HomeVisit, NursingNote, SonographyStudy
+from .models import Consultation, Patient
+
+PAGE_SIZE = 50
+TIMELINE_TTL = 60 * 60
+
+
+def _cache_key(patient_id):
+    return f"patient-timeline:{patient_id}"
+
+
+def _event(kind, obj_id, at, title, detail="", consultation_id=None):
+    return {
+        "kind": kind,
+        "id": obj_id,
+        "at": at,
+        "title": title,
+        "detail": detail or "",
+        "consultation_id": consultation_id,
+    }
+
+
+def load_patient(patient_queryset, patient_id):
+    """The patient with every timeline relation prefetched."""
+    return patient_queryset.prefetch_related(
+        Prefetch(
+            "consultations",
+            queryset=Consultation.objects.with_notes("diagnosis", "chief_complaints").select_related("doctor").prefetch_related(
+                Prefetch("prescription_set", queryset=Prescription.objects.select_related("item")),
+                Prefetch("labresult_set", queryset=LabResult.objects.select_related("lab_test")),
+            ),
+        ),
+        Prefetch("nursing_notes", queryset=NursingNote.objects.all()),
+        Prefetch("sonography_studies", queryset=SonographyStudy.objects.all()),
+        Prefetch("home_visits", queryset=HomeVisit.objects.all()),
+        Prefetch(
+            "bill_set",
+            queryset=Bill.objects.prefetch_related(
+                Prefetch("payments", queryset=Payment.objects.filter(paid_at__isnull=False))
+            ),
+        ),
+    ).get(pk=patient_id)
+
+
+def build_events(patient):
+    """All of a prefetched patient's events, newest first."""
+    events = []
+    for consultation in patient.consultations.all():
+        events.append(_event(
+            "consultation", consultation.id, consultation.date,
+            f"Consultation with {consultation.doctor}" if consultation.doctor else "Consultation",
+            consultation.diagnosis or consultation.chief_complaints, consultation.id,
+        ))
+        for prescription in consultation.prescription_set.all():
+            events.append(_event(
+                "prescription", prescription.id, prescription.prescribed_at,
+                f"Prescribed {prescription.item.name} x{prescription.quantity}",
+                prescription.instructions, consultation.id,
+            ))
+        for result in consultation.labresult_set.all():
+            name = result.lab_test.name if result.lab_test else result.result_name
+            value = f"{result.result_value} {result.get_flag_display()}" if result.flag else result.result_value
+            events.append(_event("lab_result", result.id, result.result_date, f"Lab result: {name}", value, consultation.id))
+    for note in patient.nursing_notes.all():
+        events.append(_event(
+            "nursing_note", note.id, note.created_at, f"Nursing note ({note.get_category_display()})",
+            note.note, note.consultation_id,
+        ))
+    for study in patient.sonography_studies.all():
+        events.append(_event(
+            "sonography", study.id, study.performed_at, f"{study.get_study_type_display()} study",
+            study.impression or study.findings, study.consultation_id,
+        ))
+    for visit in patient.home_visits.all():
+        events.append(_event(
+            "home_visit", visit.id, visit.visit_date, f"Home visit ({visit.get_status_display()})",
+            visit.purpose, visit.consultation_id,
+        ))
+    for bill in patient.bill_set.all():
+        for payment in bill.payments.all():
+            events.append(_event(
+                "payment", payment.id, payment.paid_at, f"Payment of {payment.amount} ({payment.payment_method})",
+                f"Bill #{bill.id}", bill.consultation_id,
+            ))
+    events.sort(key=_sort_key, reverse=True)
+    return events
+
+
+def _sort_key(event):
+    return event["at"].timestamp(), event["kind"], event["id"]
+
+
+def patient_events(patient_queryset, patient_id):
+    """
+    The cached event stream of a patient in `patient_queryset` (e.g. one
+    clinic's patients). Raises Patient.DoesNotExist if not there.
+    """
+    events = cache.get(_cache_key(patient_id))
+    if events is None:
+        events = build_events(load_patient(patient_queryset, patient_id))
+        cache.set(_cache_key(patient_id), events, TIMELINE_TTL)
+    elif not patient_queryset.filter(pk=patient_id).exists():
+        raise Patient.DoesNotExist(f"No patient {patient_id}")
+    return events
+
+
+def encode_cursor(event):
+    at, kind, event_id = _sort_key(event)
+    return base64.urlsafe_b64encode(f"{at!r}|{kind}|{event_id}".encode()).decode()
+
+
+def decode_cursor(cursor):
+    """The sort key a cursor points at, or None if it is missing or malformed."""
+    if not cursor:
+        return None
+    try:
+        at, kind, event_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return float(at), kind, int(event_id)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+def timeline_page(events, *, after=None, size=PAGE_SIZE):
+    """(events, next_cursor): up to `size` events older than the `after` cursor."""
+    after = decode_cursor(after)
+    start = 0
+    if after is not None:
+        start = next((i for i, event in enumerate(events) if _sort_key(event) < after), len(events))
+    page = events[start:start + size]
+    has_next = start + size < len(events)
+    return page, encode_cursor(page[-1]) if page and has_next else None
+
+
+def patient_changed(patient_id):
+    """Drops a patient's cached timeline once the current transaction commits."""
+    if patient_id:
+        transaction.on_commit(lambda: cache.delete(_cache_key(patient_id)))
+
+
+def patients_changed(patient_ids):
+    """patient_changed() for many patients, for writes that bypass the signals (bulk_create, update())."""
+    keys = [_cache_key(patient_id) for patient_id in set(patient_ids) if patient_id]
+    if keys:
+        transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def as_json(event):
+    return dict(event, at=event["at"].isoformat())
@@ -17,12 +17,16 @@ urlpatterns = [
     path('patients/<int:patient_id>/consultations/', views.patient_consultations, name='patient_consultations'),
     path('consultations/<int:consultation_id>/', views.consultation_detail, name='consultation_detail'),
     path('consultations/<int:consultation_id>/pdf/', views.consultation_pdf, name='consultation_pdf'),
+    path('consultations/pdf/export/', views.consultation_pdf_export, name='consultation_pdf_export'),
     path('add-to-queue/<int:doctor_id>/<int:patient_id>/', views.add_to_queue, name='add_to_queue'),
     path('add-to-queue-select/<int:patient_id>/', views.add_to_queue_select, name='add_to_queue_select'),
     path('queue/<int:queue_id>/start/', views.start_consultation, name='start_consultation'),
     path('queue/<int:queue_id>/complete/', views.complete_consultation, name='complete_consultation'),
+    path('api/patients/search/', views.patient_search_api, name='patient_search_api'),
+    path('api/patients/<int:patient_id>/timeline/', views.patient_timeline_api, name='patient_timeline_api'),
     path('api/patient-queue-count/', views.patient_queue_count_api, name='patient_queue_count_api'),
     path('api/patient-complete-count/', views.patient_complete_count_api, name='patient_complete_count_api'),
     path('speech-to-consultation/<int:patient_id>/', views.speech_to_consultation, name='speech_to_consultation'),
+    path('speech-jobs/<str:job_id>/', views.speech_job_status, name='speech_job_status'),
     path('pipeline-notification/', views.pipeline_notification, name='pipeline_notification'),
 ]
@@ -1,81 +1,61 @@
 # patient/views.py
 import json
 import os
-from openai import OpenAI
 from django.shortcuts import render, redirect, get_object_or_404
+from django.urls import reverse
 from django.db import transaction
 from django.core.paginator import Paginator
 from django.contrib import messages
 from .models import Doctor, Patient, Consultation, Queue
-from emr.models import LabTest  
-from django.http import JsonResponse
+from . import dictation, documents, live_queue, timeline
+from .search import patient_q, search_patients
+from emr.models import LabTest, LabPanel
+from django.http import Http404, JsonResponse
 from .forms import PatientForm, ConsultationForm, LabResultFormSet
 from django.http import HttpResponse
 from django.views.decorators.http import require_POST
 from django.contrib.auth.decorators import login_required
-from django.template.loader import render_to_string
+from billing import services as billing
 from billing.models import Bill, Payment
-from weasyprint import HTML
 
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 
-client = OpenAI()
-
 @csrf_exempt
+@login_required
 @require_http_methods(["POST"])
 def speech_to_consultation(request, patient_id):
     """
-    Endpoint to convert speech text to consultation notes using OpenAI.
-    Expects JSON payload with 'transcript' field.
+    Queues a speech transcript for conversion into consultation notes.
+    Expects a JSON payload with a 'transcript' field and answers 202 with
+    the job; follow it at 'status_url' or over ws/speech-jobs/<job_id>/.
     """
-    data = json.loads(request.body)
+    try:
+        data = json.loads(request.body)
+    except ValueError:
+        return JsonResponse({'error': 'Invalid JSON'}, status=400)
     transcript = data.get('transcript', '')
 
     if not transcript:
         return JsonResponse({'error': 'Transcript is required'}, status=400)
 
-    with open('consultation_schema.json', 'r') as f:
-        schema_above = json.load(f)
-    
-    try:
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": f"Extract consultation data from speech transcript into JSON schema. Only return valid JSON matching this exact schema:{json.dumps(schema_above)}. Focus on medical details from speech."},
-                {"role": "user", "content": f"Extract from: {transcript}"}
-            ],
-            temperature=0.1,
-            response_format={"type": "json_object"}  # Ensure the response is in JSON object format
-        )
+    patient = get_object_or_404(Patient.objects.for_clinic(request.clinic), id=patient_id)
+    job = dictation.submit(transcript, patient=patient, user=request.user)
+    return JsonResponse({
+        'success': True,
+        'job_id': job['id'],
+        'status': job['status'],
+        'status_url': reverse('speech_job_status', args=[job['id']]),
+    }, status=202)
 
-        consultation_data = json.loads(response.choices[0].message.content)
-        print(f"Extracted consultation data: {consultation_data}")
-        patient = get_object_or_404(Patient, id=patient_id)
-        doctor = patient.doctor
-        consultation = None
-        try:
-            consultation = Consultation.objects.create(**consultation_data.get('clinical_details', {}),
-                **consultation_data.get('vitals', {}),
-                **consultation_data.get('examinations', {}),
-                **consultation_data.get('investigations', {}),
-                **consultation_data.get('diagnosis_management', {}),
-                patient=patient,
-                doctor=doctor
-            )
-            print("Consultation created successfully.")
-        except Exception as e:
-            print("Error creating consultation:", e)
-        
-        return JsonResponse({
-            'success': True,
-            'consultation_id': consultation.id if consultation else None,
-            'message': 'Consultation created from speech'
-        })
-
-    except Exception as e:
-        return JsonResponse({'error': str(e)}, status=500)
 
+@login_required
+@require_http_methods(["GET"])
+def speech_job_status(request, job_id):
+    job = dictation.get_job(job_id)
+    if job is None or job['user_id'] != request.user.pk:
+        raise Http404("No such job")
+    return JsonResponse(dictation.public(job))
 
 
 def new_consultation(request, patient_id):
@@ -99,7 +79,7 @@ def new_consultation(request, patient_id):
 
 def edit_consultation(request, patient_id, consultation_id):
     patient = get_object_or_404(Patient, id=patient_id)
-    consultation = get_object_or_404(Consultation, id=consultation_id, patient=patient)
+    consultation = get_object_or_404(Consultation.objects.with_notes(), id=consultation_id, patient=patient)
 
     if request.method == "POST":
         form = ConsultationForm(request.POST, instance=consultation)
@@ -135,7 +115,7 @@ def register_patient(request):
         form = PatientForm(request.POST)
         if form.is_valid():
             patient = form.save(commit=False)
-            patient.clinic = request.user.clinics.last()
+            patient.clinic = request.clinic
             patient.save()
             return redirect("patient_success")
     else:
@@ -149,9 +129,9 @@ def patient_success(request):
 
 def consultation_list(request):
     query = request.GET.get("q")
-    consultations = Consultation.objects.all().order_by("-date")
+    consultations = Consultation.objects.for_clinic(request.clinic).order_by("-date")
     if query:
-        consultations = consultations.filter(patient__name__icontains=query)
+        consultations = consultations.filter(patient_q(query, "patient__"))
     paginator = Paginator(consultations, 10)
     page_number = request.GET.get("page")
     page_obj = paginator.get_page(page_number)
@@ -159,15 +139,16 @@ def consultation_list(request):
 
 
 def doctor_detail(request, pk):
-    doctor = get_object_or_404(Doctor, id=pk)
-    queue = Queue.objects.filter(doctor=doctor, status__in=["waiting", "in_progress", "fromLab"]).order_by("queue_number")
+    doctor = get_object_or_404(Doctor.objects.for_clinic(request.clinic), id=pk)
+    queue = Queue.objects.filter(doctor=doctor, status__in=["waiting", "in_progress", "fromLab"]).order_by("queue_date", "queue_number")
     lab_tests = LabTest.objects.filter(lab__lab_type="Internal")
+    lab_panels = LabPanel.objects.filter(is_active=True)
 
     query = request.GET.get("q")
     patients = doctor.patients.all()
 
     if query:
-        patients = patients.filter(name__icontains=query)
+        patients = patients.filter(patient_q(query))
 
     paginator = Paginator(patients, 10)
     page_number = request.GET.get("page")
@@ -179,18 +160,45 @@ def doctor_detail(request, pk):
         "page_obj": page_obj,
         "query": query,
         "lab_tests": lab_tests,
+        "lab_panels": lab_panels,
     })
 
 # List all doctors
 def doctor_list(request):
-    doctors = Doctor.objects.all()
+    doctors = Doctor.objects.for_clinic(request.clinic)
     return render(request, 'patient/doctor_list.html', {'doctors': doctors})
 
 
 
 
+@login_required
+def patient_search_api(request):
+    """Typeahead: best-matching patients of the user's clinic for ?q= (name, phone or date of birth)."""
+    patients = search_patients(request.GET.get('q', ''), clinic=request.clinic)
+    return JsonResponse({'results': [
+        {'id': p.id, 'name': p.name, 'phone_number': p.phone_number, 'date_of_birth': p.date_of_birth}
+        for p in patients.only('id', 'name', 'phone_number', 'date_of_birth')
+    ]})
+
+
+@login_required
+def patient_timeline_api(request, patient_id):
+    """The patient's history, newest first, a page at a time (?after=<next_cursor>)."""
+    try:
+        events = timeline.patient_events(Patient.objects.for_clinic(request.clinic), patient_id)
+    except Patient.DoesNotExist:
+        raise Http404("Patient not found")
+    try:
+        size = min(int(request.GET.get('size', timeline.PAGE_SIZE)), 200)
+    except ValueError:
+        size = timeline.PAGE_SIZE
+    page, next_cursor = timeline.timeline_page(events, after=request.GET.get('after'), size=max(size, 1))
+    return JsonResponse({'events': [timeline.as_json(event) for event in page], 'next_cursor': next_cursor})
+
+
 def patient_queue_count_api(request):
-    count = Queue.objects.filter(status__in=['in_progress','waiting']).count()
+    counts = live_queue.get_counts(Queue, live_queue.clinic_scope(request.clinic))
+    count = counts['in_progress'] + counts['waiting']
     print(f"Patient queue count requested, current count: {count}")
     return JsonResponse({'count': count})
 
@@ -199,12 +207,13 @@ def patient_list(request):
     query = request.GET.get('q')
     page_number = request.GET.get('page')
     lab_tests = LabTest.objects.all()
+    lab_panels = LabPanel.objects.filter(is_active=True)
     # Filter by clinic and optional search term
-    patients = Patient.objects.filter(clinic=request.user.clinics.last())
+    patients = Patient.objects.for_clinic(request.clinic)
     if query:
-        patients = patients.filter(name__icontains=query)
+        patients = patients.filter(patient_q(query))
 
-    completed = Queue.objects.filter(status__in=['completed']).count()
+    completed = live_queue.get_counts(Queue, live_queue.clinic_scope(request.clinic))['completed']
     # Paginate results — 10 per page
     paginator = Paginator(patients.order_by('-date_registered'), 10)
     page_obj = paginator.get_page(page_number)
@@ -214,6 +223,7 @@ def patient_list(request):
         'query': query,
         'completed': completed,
         'lab_tests': lab_tests,
+        'lab_panels': lab_panels,
     }
     return render(request, 'patient/patient_list.html', context)
 
@@ -242,7 +252,7 @@ def patient_consultations(request, patient_id):
     Show consultation history for a patient (list view).
     """
     patient = get_object_or_404(Patient, id=patient_id)
-    consultations = patient.consultations.order_by("-date")  # latest first
+    consultations = patient.consultations.with_notes("diagnosis").select_related("doctor").order_by("-date")  # latest first
     return render(request, "patient/patient_consultations.html", {
         "patient": patient,
         "consultations": consultations,
@@ -254,7 +264,10 @@ def consultation_detail(request, consultation_id):
     Show a single consultation (read-only view) and provide buttons
     to export PDF or edit.
     """
-    consultation = get_object_or_404(Consultation, id=consultation_id)
+    consultation = get_object_or_404(
+        Consultation.objects.with_notes().select_related("patient").prefetch_related("prescription_set__item"),
+        id=consultation_id,
+    )
     return render(request, "patient/consultation_detail.html", {
         "consultation": consultation
     })
@@ -263,19 +276,38 @@ def consultation_detail(request, consultation_id):
 def consultation_pdf(request, consultation_id):
     """
     Render a consultation to a PDF and return it as an HTTP response.
-    Uses WeasyPrint to turn HTML into PDF.
+    Rendered by the patient.documents worker pool, or read from its cache.
     """
-    consultation = get_object_or_404(Consultation, id=consultation_id)
-    html_string = render_to_string("patient/consultation_pdf.html", {"consultation": consultation})
-    html = HTML(string=html_string, base_url=request.build_absolute_uri("/"))
-    pdf = html.write_pdf()
+    consultation = get_object_or_404(
+        Consultation.objects.with_notes().select_related("patient", "doctor").prefetch_related("prescription_set__item"),
+        id=consultation_id,
+    )
+    pdf = documents.render(documents.consultation_html(consultation), request.build_absolute_uri("/"))
 
-    filename = f"consultation_{consultation.patient.name.replace(' ', '_')}_{consultation.id}.pdf"
     response = HttpResponse(pdf, content_type="application/pdf")
-    response["Content-Disposition"] = f'attachment; filename="{filename}"'
+    response["Content-Disposition"] = f'attachment; filename="{documents.consultation_filename(consultation)}"'
     return response
 
 
+@login_required
+def consultation_pdf_export(request):
+    """
+    A ZIP of consultation PDFs, streamed as they are rendered: those in
+    ?ids=1,2,3, or else the clinic's consultations on ?date= (today).
+    """
+    consultations, label = documents.export_selection(
+        Consultation.objects.for_clinic(request.clinic).with_notes()
+        .select_related("patient", "doctor").prefetch_related("prescription_set__item").order_by("date", "id"),
+        request.GET, id_field="id", date_field="date",
+    )
+    base_url = request.build_absolute_uri("/")
+    pdfs = documents.render_many(
+        (documents.consultation_filename(consultation), documents.consultation_html(consultation), base_url)
+        for consultation in consultations
+    )
+    return documents.zip_response(pdfs, f"consultations_{label}.zip")
+
+
 
 def add_to_queue(request, doctor_id, patient_id):
     doctor = get_object_or_404(Doctor, id=doctor_id)
@@ -286,32 +318,17 @@ def add_to_queue(request, doctor_id, patient_id):
         messages.warning(request, f"{patient.name} is already in Dr. {doctor.name}'s queue.")
         return redirect('patient_list')
 
-    # Determine the consultation fee based on previous bills
-    previous_bills_count = Bill.objects.filter(patient=patient).count()
-    if previous_bills_count == 0:
-        consultation_fee = 1500  # first time
-    else:
-        consultation_fee = 1300  # second time or more
-
     # Wrap billing + queue addition in a transaction
-    # with transaction.atomic():
-    # Create a Bill, set consultation=None if not available yet
-    Bill.objects.create(
-        patient=patient,
-        consultation=None,  # No consultation linked yet
-        clinic=patient.clinic,
-        total_amount=consultation_fee,
-        is_paid=False
-    )
-
-    # Add patient to the queue
-    next_number = Queue.objects.filter(doctor=doctor).count() + 1
-    Queue.objects.create(
-        doctor=doctor,
-        patient=patient,
-        queue_number=next_number,
-        clinic=patient.clinic
-    )
+    with transaction.atomic():
+        # A new bill for the visit; the fee depends on whether the patient has been billed before
+        _bill, consultation_fee = billing.start_visit(patient)
+
+        # Add patient to the queue; Queue.save() draws the number from the daily counter
+        Queue.objects.create(
+            doctor=doctor,
+            patient=patient,
+            clinic=patient.clinic
+        )
 
     messages.success(
         request,
@@ -326,15 +343,17 @@ def add_to_queue_select(request, patient_id):
         doctor_id = request.POST.get("doctor_id")
         doctor = get_object_or_404(Doctor, id=doctor_id)
         patient = get_object_or_404(Patient, id=patient_id)
-        patient.doctor = doctor
-        patient.save()
 
-        if Queue.objects.filter(doctor=doctor, patient=patient, status='waiting').exists():
-            messages.warning(request, f"{patient.name} is already in Dr. {doctor.name}'s queue.")
-        else:
-            next_number = Queue.objects.filter(doctor=doctor).count() + 1
-            Queue.objects.create(doctor=doctor, patient=patient, queue_number=next_number, clinic=patient.clinic)
-            messages.success(request, f"{patient.name} added to Dr. {doctor.name}'s queue.")
+        # One transaction, so a failed insert gives its queue number back
+        with transaction.atomic():
+            patient.doctor = doctor
+            patient.save()
+
+            if Queue.objects.filter(doctor=doctor, patient=patient, status='waiting').exists():
+                messages.warning(request, f"{patient.name} is already in Dr. {doctor.name}'s queue.")
+            else:
+                Queue.objects.create(doctor=doctor, patient=patient, clinic=patient.clinic)
+                messages.success(request, f"{patient.name} added to Dr. {doctor.name}'s queue.")
 
     return redirect('patient_list')
 
@@ -351,18 +370,13 @@ def complete_consultation(request, queue_id):
     queue_item = get_object_or_404(Queue, id=queue_id)
     queue_item.complete()
     consultation = queue_item.patient.consultations.last()
-    try:
-        bill = Bill.objects.filter(patient=consultation.patient,is_paid=False).latest('created_at')
-        bill.total_amount += consultation.labor_charges or 0
-        bill.is_paid = False
-        bill.save()
-    except Exception as err:
-        print(f"Bill error: {err}")
+    if consultation is not None and consultation.labor_charges:
+        billing.charge(consultation.patient, "Labor charges", consultation.labor_charges, consultation=consultation)
     return redirect('doctor_detail', pk=queue_item.doctor.id)
 
 
 def patient_complete_count_api(request):
-    count = Queue.objects.filter(status__in=['completed']).count()
+    count = live_queue.get_counts(Queue, live_queue.clinic_scope(request.clinic))['completed']
     print(f"Patient queue complete count requested, current count: {count}")
     return JsonResponse({'count': count})
 
@@ -3,7 +3,7 @@ from django.db.models.signals import post_save
 from django.dispatch import receiver
 from .models import Prescription
 from inventory.models import ConsumptionRecord, Stock, StockMovement
-from billing.models import Bill, BillItem
+from billing import services as billing
 from django.db import transaction
 
 @receiver(post_save, sender=Prescription)
@@ -37,15 +37,5 @@ def prescription_post_save(sender, instance, created, **kwargs):
             quantity=qty,
             used_by=instance.prescribed_by
         )
-    # create or update bill
-    # import pdb;pdb.set_trace()
-    bill = Bill.objects.filter(patient=consultation.patient,is_paid=False).latest('created_at')
-    unit_price = item.price
-    bi = BillItem.objects.create(
-        bill=bill,
-        description=item.name,
-        quantity=qty,
-        unit_price=unit_price
-    )
-    bill.total_amount += item.price
-    bill.save()
+    # bill the full quantity to the patient's open bill
+    billing.charge(consultation.patient, item.name, item.price, quantity=qty, consultation=consultation)
@@ -55,6 +55,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'allauth',
     'allauth.account',
     'allauth.socialaccount',
@@ -87,6 +88,9 @@ WEBPUSH_SETTINGS = {
     "VAPID_ADMIN_EMAIL": os.getenv("VAPID_ADMIN_EMAIL").strip(),
 }
 
+# Username that receives queue/lab/chat web pushes (see notification.outbox)
+PUSH_NOTIFICATION_RECIPIENT = os.getenv("PUSH_NOTIFICATION_RECIPIENT", "baharimedicalclinic").strip()
+
 CRISPY_ALLOWED_TEMPLATE_PACKS = "bootstrap5"
 
 ACCOUNT_SIGNUP_FORM_CLASS = 'authentication.forms.CustomSignupForm'
@@ -103,6 +107,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'clinicmanager.tenancy.ActiveClinicMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'allauth.account.middleware.AccountMiddleware',
@@ -215,12 +220,50 @@ SESSION_EXPIRE_AT_BROWSER_CLOSE = False
 # Paystack config
 PAYSTACK_SECRET_KEY = os.getenv('PAYSTACK_SECRET_KEY').strip()  # set in env or setting.strip()s
 PAYSTACK_BASE_URL = 'https://api.paystack.co'
-
-CHANNEL_LAYERS = {
-    'default': {
-        'BACKEND': 'channels.layers.InMemoryChannelLayer',
+# billing.paystack: seconds per call, retries of transient failures, and how
+# many pages of a transaction listing are fetched at once
+PAYSTACK_TIMEOUT = float(os.getenv('PAYSTACK_TIMEOUT', '10'))
+PAYSTACK_RETRIES = int(os.getenv('PAYSTACK_RETRIES', '3'))
+PAYSTACK_CONCURRENCY = int(os.getenv('PAYSTACK_CONCURRENCY', '4'))
+
+# Dictated consultations (patient.dictation): the extraction backend and how
+# many extractions each process runs at once
+SPEECH_BACKEND = os.getenv('SPEECH_BACKEND', 'patient.dictation.OpenAIBackend')
+SPEECH_CONCURRENCY = int(os.getenv('SPEECH_CONCURRENCY', '4'))
+# Seconds a transcript's extraction is reused for a resent transcript
+EXTRACTION_CACHE_TTL = 60 * 60 * 24 * 7
+
+# PDF rendering (patient.documents): WeasyPrint worker processes per server
+# process, and where rendered PDFs are kept by content hash
+PDF_WORKERS = int(os.getenv('PDF_WORKERS', '2'))
+PDF_CACHE_DIR = os.getenv('PDF_CACHE_DIR', str(BASE_DIR / 'pdf_cache'))
+
+# Set REDIS_URL (e.g. redis://redis:6379) to share channel groups and cached
+# live queue counts between worker processes. Without it both stay in-process,
+# which only works with a single worker.
+REDIS_URL = os.getenv('REDIS_URL', '').strip()
+
+if REDIS_URL:
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels_redis.core.RedisChannelLayer',
+            'CONFIG': {
+                'hosts': [REDIS_URL],
+            },
+        }
+    }
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels.layers.InMemoryChannelLayer',
+        }
     }
-}
 
 
 # CACHES = {
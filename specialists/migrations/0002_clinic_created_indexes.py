@@ -0,0 +1,46 @@
+# Generated by Django 5.1.1 on 2026-10-18 10:41
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing', '0006_clinic_created_indexes'),
+        ('clinicmanager', '0005_alter_clinicbankdetails_bank_name'),
+        ('patient', '0015_clinic_created_indexes'),
+        ('specialists', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='debtcase',
+            index=models.Index(fields=['clinic', 'created_at'], name='debtcase_clinic_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='externallabrequest',
+            index=models.Index(fields=['clinic', 'created_at'], name='extlabreq_clinic_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='homevisit',
+            index=models.Index(fields=['clinic', 'created_at'], name='homevisit_clinic_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notificationforspecialist',
+            index=models.Index(fields=['clinic', 'created_at'], name='specnotif_clinic_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='nursingnote',
+            index=models.Index(fields=['clinic', 'created_at'], name='nursingnote_clinic_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='specialisttask',
+            index=models.Index(fields=['clinic', 'created_at'], name='spectask_clinic_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='supplyinvoice',
+            index=models.Index(fields=['clinic', 'created_at'], name='supplyinv_clinic_created_idx'),
+        ),
+    ]
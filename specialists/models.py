@@ -2,6 +2,7 @@ from django.db import models
 from django.conf import settings
 from django.utils import timezone
 from clinicmanager.models import Clinic
+from clinicmanager.tenancy import ClinicManager
 from patient.models import Patient, Consultation
 from billing.models import Bill, BillItem
 
@@ -25,6 +26,8 @@ class SpecialistProfile(models.Model):
     email = models.EmailField(blank=True, null=True)
     is_active = models.BooleanField(default=True)
 
+    objects = ClinicManager()
+
     def __str__(self):
         return f"{self.user} ({self.role})"
 
@@ -40,6 +43,8 @@ class ServiceCatalog(models.Model):
     price = models.DecimalField(max_digits=12, decimal_places=2, default=0)
     is_active = models.BooleanField(default=True)
 
+    objects = ClinicManager()
+
     def __str__(self):
         return f"{self.name} - {self.clinic}"
 
@@ -56,6 +61,13 @@ class NotificationForSpecialist(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     seen = models.BooleanField(default=False)
 
+    objects = ClinicManager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["clinic", "created_at"], name="specnotif_clinic_created_idx"),
+        ]
+
     def __str__(self):
         return f"{self.title} -> {self.recipient}"
 
@@ -89,6 +101,13 @@ class SpecialistTask(models.Model):
     started_at = models.DateTimeField(null=True, blank=True)
     completed_at = models.DateTimeField(null=True, blank=True)
 
+    objects = ClinicManager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["clinic", "created_at"], name="spectask_clinic_created_idx"),
+        ]
+
     def start(self):
         self.status = "in_progress"
         self.started_at = timezone.now()
@@ -124,6 +143,8 @@ class SonographyStudy(models.Model):
     performed_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name="sonography_done")
     performed_at = models.DateTimeField(default=timezone.now)
 
+    objects = ClinicManager()
+
     def __str__(self):
         return f"{self.patient} - {self.study_type} ({self.performed_at.date()})"
 
@@ -149,6 +170,13 @@ class NursingNote(models.Model):
     created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name="nursing_notes_created")
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = ClinicManager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["clinic", "created_at"], name="nursingnote_clinic_created_idx"),
+        ]
+
     def __str__(self):
         return f"{self.patient} - {self.category} ({self.created_at.date()})"
 
@@ -177,6 +205,13 @@ class ExternalLabRequest(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     sent_at = models.DateTimeField(null=True, blank=True)
 
+    objects = ClinicManager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["clinic", "created_at"], name="extlabreq_clinic_created_idx"),
+        ]
+
     def __str__(self):
         return f"{self.patient} -> {self.lab_name} ({self.status})"
 
@@ -210,6 +245,13 @@ class HomeVisit(models.Model):
     notes = models.TextField(blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = ClinicManager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["clinic", "created_at"], name="homevisit_clinic_created_idx"),
+        ]
+
 
 # -------- Supplies invoicing (expenditure) --------
 
@@ -223,6 +265,13 @@ class SupplyInvoice(models.Model):
     created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = ClinicManager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["clinic", "created_at"], name="supplyinv_clinic_created_idx"),
+        ]
+
     def __str__(self):
         return f"{self.vendor} - {self.total_amount}"
 
@@ -260,6 +309,13 @@ class DebtCase(models.Model):
     notes = models.TextField(blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = ClinicManager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["clinic", "created_at"], name="debtcase_clinic_created_idx"),
+        ]
+
     @property
     def balance(self):
         # if you later compute partial payments, adjust here
@@ -295,5 +351,7 @@ class EquipmentItem(models.Model):
     reorder_level = models.PositiveIntegerField(default=0)
     notes = models.TextField(blank=True, null=True)
 
+    objects = ClinicManager()
+
     def __str__(self):
         return f"{self.name} ({self.qty_available})"
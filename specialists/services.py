@@ -3,7 +3,7 @@ from django.urls import reverse
 from django.utils import timezone
 from django.conf import settings
 
-from billing.models import Bill, BillItem
+from billing import services as billing
 from .models import NotificationForSpecialist, DebtCase
 
 
@@ -19,27 +19,9 @@ def notify_user(clinic, recipient, title, message, url=None):
 
 def bill_for_service(*, clinic, patient, consultation, service, created_by=None):
     """
-    Creates/gets an unpaid bill and adds a line item for the service.
+    Adds a line item for the service to the patient's open bill.
     """
-    bill, _ = Bill.objects.get_or_create(
-        clinic=clinic,
-        patient=patient,
-        consultation=consultation,
-        is_paid=False,
-        defaults={"total_amount": 0},
-    )
-
-    item = BillItem.objects.create(
-        bill=bill,
-        description=service.name,
-        quantity=1,
-        unit_price=service.price,
-        total=service.price,
-    )
-
-    # update bill total
-    bill.total_amount = sum(i.total for i in bill.items.all())
-    bill.save()
+    bill, item = billing.charge(patient, service.name, service.price, consultation=consultation)
 
     # Open debt case automatically if unpaid
     DebtCase.objects.get_or_create(bill=bill, clinic=clinic, patient=patient)
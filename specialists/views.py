@@ -22,14 +22,9 @@ from .models import (
 from .services import notify_user, bill_for_service, send_external_lab_email
 
 
-def _clinic_from_request(request):
-    # Adapt this to your tenancy pattern: request.user.clinic / request.clinic / etc.
-    # For now: try a common pattern
-    return request.user.clinics.last()
-
 @login_required
 def dashboard(request):
-    clinic = _clinic_from_request(request)
+    clinic = request.clinic
     my_notifications = NotificationForSpecialist.objects.filter(clinic=clinic, recipient=request.user).order_by("-created_at")[:10]
 
     ctx = {
@@ -56,7 +51,7 @@ def dashboard(request):
 
 @login_required
 def task_list(request):
-    clinic = _clinic_from_request(request)
+    clinic = request.clinic
     qs = SpecialistTask.objects.filter(clinic=clinic).order_by("-created_at")
     role = request.GET.get("role")
     status = request.GET.get("status")
@@ -69,7 +64,7 @@ def task_list(request):
 
 @login_required
 def task_create(request):
-    clinic = _clinic_from_request(request)
+    clinic = request.clinic
     form = SpecialistTaskForm(request.POST or None)
     # import pdb;pdb.set_trace()
     if request.method == "POST" and form.is_valid():
@@ -87,7 +82,7 @@ def task_bill_service(request, task_id):
     """
     One-click: select service already set on task, generate bill item.
     """
-    clinic = _clinic_from_request(request)
+    clinic = request.clinic
     task = get_object_or_404(SpecialistTask, clinic=clinic, id=task_id)
 
     if not task.service:
@@ -116,7 +111,7 @@ def patient_arrived_alert(request, queue_id):
     Trigger when reception marks patient as arrived / moved to specialist area.
     Alerts doctor + specialist + patient (if you later add SMS/email to patient).
     """
-    clinic = _clinic_from_request(request)
+    clinic = request.clinic
     q = get_object_or_404(Queue, clinic=clinic, id=queue_id)
 
     # notify doctor
@@ -149,14 +144,14 @@ def patient_arrived_alert(request, queue_id):
 
 @login_required
 def sonography_list(request):
-    clinic = _clinic_from_request(request)
+    clinic = request.clinic
     qs = SonographyStudy.objects.filter(clinic=clinic).order_by("-performed_at")
     return render(request, "specialists/sonography/list.html", {"rows": qs})
 
 
 @login_required
 def sonography_create(request):
-    clinic = _clinic_from_request(request)
+    clinic = request.clinic
     form = SonographyStudyForm(request.POST or None)
     if request.method == "POST" and form.is_valid():
         form = SonographyStudyForm(request.POST, request.FILES)
@@ -174,7 +169,7 @@ def sonography_create(request):
 
 @login_required
 def sonography_detail(request, pk):
-    clinic = _clinic_from_request(request)
+    clinic = request.clinic
     obj = get_object_or_404(SonographyStudy, clinic=clinic, pk=pk)
     return render(request, "specialists/sonography/detail.html", {"obj": obj})
 
@@ -183,14 +178,14 @@ def sonography_detail(request, pk):
 
 @login_required
 def nursing_list(request):
-    clinic = _clinic_from_request(request)
+    clinic = request.clinic
     qs = NursingNote.objects.filter(clinic=clinic).order_by("-created_at")
     return render(request, "specialists/nursing/list.html", {"rows": qs})
 
 
 @login_required
 def nursing_create(request):
-    clinic = _clinic_from_request(request)
+    clinic = request.clinic
     if request.method == "POST":
         form = NursingNoteForm(request.POST)
         if form.is_valid():
@@ -207,7 +202,7 @@ def nursing_create(request):
 
 @login_required
 def nursing_detail(request, pk):
-    clinic = _clinic_from_request(request)
+    clinic = request.clinic
     obj = get_object_or_404(NursingNote, clinic=clinic, pk=pk)
     return render(request, "specialists/nursing/detail.html", {"obj": obj})
 
@@ -216,14 +211,14 @@ def nursing_detail(request, pk):
 
 @login_required
 def external_lab_list(request):
-    clinic = _clinic_from_request(request)
+    clinic = request.clinic
     qs = ExternalLabRequest.objects.filter(clinic=clinic).order_by("-created_at")
     return render(request, "specialists/external_lab/request_list.html", {"rows": qs})
 
 
 @login_required
 def external_lab_create(request):
-    clinic = _clinic_from_request(request)
+    clinic = request.clinic
     form = ExternalLabRequestForm(request.POST or None) 
     # import pdb;pdb.set_trace()
     if request.method == "POST" and form.is_valid():
@@ -242,7 +237,7 @@ def external_lab_create(request):
 
 @login_required
 def external_lab_detail(request, pk):
-    clinic = _clinic_from_request(request)
+    clinic = request.clinic
     obj = get_object_or_404(ExternalLabRequest, clinic=clinic, pk=pk)
     upload_form = ExternalLabResultForm()
     return render(request, "specialists/external_lab/request_detail.html", {"obj": obj, "upload_form": upload_form})
@@ -250,7 +245,7 @@ def external_lab_detail(request, pk):
 
 @login_required
 def external_lab_send(request, pk):
-    clinic = _clinic_from_request(request)
+    clinic = request.clinic
     obj = get_object_or_404(ExternalLabRequest, clinic=clinic, pk=pk)
     send_external_lab_email(obj)
     messages.success(request, "Email sent to external lab.")
@@ -259,7 +254,7 @@ def external_lab_send(request, pk):
 
 @login_required
 def external_lab_upload_result(request, pk):
-    clinic = _clinic_from_request(request)
+    clinic = request.clinic
     req_obj = get_object_or_404(ExternalLabRequest, clinic=clinic, pk=pk)
     if request.method == "POST":
         form = ExternalLabResultForm(request.POST, request.FILES)
@@ -278,14 +273,14 @@ def external_lab_upload_result(request, pk):
 
 @login_required
 def home_visit_list(request):
-    clinic = _clinic_from_request(request)
+    clinic = request.clinic
     qs = HomeVisit.objects.filter(clinic=clinic).order_by("-visit_date")
     return render(request, "specialists/home_visit/list.html", {"rows": qs})
 
 
 @login_required
 def home_visit_create(request):
-    clinic = _clinic_from_request(request)
+    clinic = request.clinic
     if request.method == "POST":
         form = HomeVisitForm(request.POST)
         if form.is_valid():
@@ -303,14 +298,14 @@ def home_visit_create(request):
 
 @login_required
 def supply_invoice_list(request):
-    clinic = _clinic_from_request(request)
+    clinic = request.clinic
     qs = SupplyInvoice.objects.filter(clinic=clinic).order_by("-invoice_date")
     return render(request, "specialists/supplies/invoice_list.html", {"rows": qs})
 
 
 @login_required
 def supply_invoice_create(request):
-    clinic = _clinic_from_request(request)
+    clinic = request.clinic
     if request.method == "POST":
         form = SupplyInvoiceForm(request.POST, request.FILES)
         if form.is_valid():
@@ -329,14 +324,14 @@ def supply_invoice_create(request):
 
 @login_required
 def debts_list(request):
-    clinic = _clinic_from_request(request)
+    clinic = request.clinic
     qs = DebtCase.objects.filter(clinic=clinic).select_related("bill", "patient").order_by("-created_at")
     return render(request, "specialists/debts/list.html", {"rows": qs})
 
 
 @login_required
 def debt_detail(request, pk):
-    clinic = _clinic_from_request(request)
+    clinic = request.clinic
     obj = get_object_or_404(DebtCase, clinic=clinic, pk=pk)
     follow_form = DebtFollowUpForm()
     # WhatsApp quick link (no sending, just generates a message link)
@@ -350,7 +345,7 @@ def debt_detail(request, pk):
 
 @login_required
 def debt_add_followup(request, pk):
-    clinic = _clinic_from_request(request)
+    clinic = request.clinic
     obj = get_object_or_404(DebtCase, clinic=clinic, pk=pk)
     if request.method == "POST":
         form = DebtFollowUpForm(request.POST)
@@ -367,14 +362,14 @@ def debt_add_followup(request, pk):
 
 @login_required
 def equipment_list(request):
-    clinic = _clinic_from_request(request)
+    clinic = request.clinic
     qs = EquipmentItem.objects.filter(clinic=clinic).order_by("name")
     return render(request, "specialists/equipment/list.html", {"rows": qs})
 
 
 @login_required
 def equipment_create(request):
-    clinic = _clinic_from_request(request)
+    clinic = request.clinic
     if request.method == "POST":
         form = EquipmentItemForm(request.POST)
         if form.is_valid():